@@ -1,19 +1,18 @@
+import sys
 import dotenv
-import importlib
-from pathlib import Path
-from shroud.slack.slack import start_app
 
 dotenv.load_dotenv()
 
-def import_modules_from_directory(directory):
-    for path in directory.glob("*.py"):
-        if path.name != "__init__.py":
-            module_name = f"shroud.slack.handlers.{path.stem}"
-            importlib.import_module(module_name)
-
 def main():
-    handlers_directory = Path(__file__).parent / 'slack' / 'handlers'
-    import_modules_from_directory(handlers_directory)
+    if sys.argv[1:2] == ["export"]:
+        from shroud.export import main as export
+        export(sys.argv[2:])
+        return
+    # Imported here so the export never builds the App
+    from shroud.slack import handlers
+    from shroud.slack.slack import start_app
+
+    handlers.register()
     start_app()
 
 if __name__ == "__main__":
@@ -0,0 +1,56 @@
+import argparse
+import json
+from pathlib import Path
+
+from shroud import settings
+from shroud.bench import payloads
+from shroud.bench.fakes import FakeSlack, MemoryBackend
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m shroud.bench",
+        description="Replay recorded Slack payloads through Shroud's listeners against a fake Slack and database",
+    )
+    parser.add_argument("--relays", type=int, default=100, help="Reports to replay every event type for")
+    parser.add_argument("--slack-latency", type=float, default=0.03, help="Seconds each Slack API call takes")
+    parser.add_argument("--db-latency", type=float, default=0.1, help="Seconds each database request takes")
+    parser.add_argument("--workers", type=int, help="Override worker_pool_size")
+    parser.add_argument("--write-behind-delay", type=float, help="Override write_behind_delay")
+    parser.add_argument("--rate-limits", action="store_true", help="Keep Slack rate limits applied to the fake Slack")
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    # Nothing here should reach the configured workspace or database
+    settings.set("channel", payloads.FD_CHANNEL)
+    settings.set("db_backend", "sqlite")
+    settings.set("sqlite_path", ":memory:")
+    settings.set("airtable_mirror", False)
+    settings.set("outbox_path", ":memory:")
+    settings.set("stats_path", ":memory:")
+    # Edits are measured as they're relayed, not after a debounce window
+    settings.set("edit_relay_window", 0)
+    # The recorded file shares can't be downloaded, file relay has its own benchmark in shroud.bench.files
+    settings.set("file_relay_max_size", 0)
+    if args.workers:
+        settings.set("worker_pool_size", args.workers)
+    if args.write_behind_delay is not None:
+        settings.set("write_behind_delay", args.write_behind_delay)
+
+    # Installed before anything builds a WebClient, since Bolt calls auth.test when the app is created
+    slack = FakeSlack(latency=args.slack_latency)
+    slack.install()
+    from shroud.bench.replay import Replay, format_results
+    from shroud.slack.client import scheduler
+
+    scheduler.enabled = args.rate_limits
+
+    results, complete = Replay(slack, MemoryBackend(latency=args.db_latency)).run(args.relays)
+    print(format_results(results))
+    print(f"{complete}/{args.relays} relays were forwarded and answered")
+    if args.json:
+        args.json.write_text(json.dumps([r.model_dump() for r in results], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+from collections.abc import Iterator
+
+from slack_sdk import WebClient
+from slack_sdk.web.slack_response import SlackResponse
+
+from shroud.utils.storage import TS_FIELDS, Backend
+
+
+class FakeSlack:
+    """
+    Answers Web API calls in place of Slack after `latency` seconds. install() routes every WebClient through it,
+    including the scheduling client Bolt was built with
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        # Posted messages need timestamps the handlers can look up later
+        self._ts = itertools.count(1)
+        # Where files.getUploadURLExternal sends uploads, e.g. the local server in shroud.bench.files
+        self.upload_url = "https://files.slack.com/upload/v1/bench"
+        self._file_ids = itertools.count(1)
+
+    def install(self) -> None:
+        fake = self
+
+        def api_call(client, api_method: str, **kwargs):
+            return fake.api_call(client, api_method, **kwargs)
+
+        WebClient.api_call = api_call
+
+    def next_ts(self) -> str:
+        with self._lock:
+            return f"1800000000.{next(self._ts):06d}"
+
+    def api_call(self, client, api_method: str, **kwargs) -> SlackResponse:
+        with self._lock:
+            self.calls[api_method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        args = {
+            **(kwargs.get("params") or {}),
+            **(kwargs.get("data") or {}),
+            **(kwargs.get("json") or {}),
+        }
+        return SlackResponse(
+            client=client,
+            http_verb=kwargs.get("http_verb", "POST"),
+            api_url=f"https://slack.com/api/{api_method}",
+            req_args=kwargs,
+            data={"ok": True, **self._response(api_method, args)},
+            headers={},
+            status_code=200,
+        )
+
+    def _response(self, api_method: str, args: dict) -> dict:
+        match api_method:
+            case "auth.test":
+                return {"user_id": "U0BENCHBOT", "bot_id": "B0BENCHBOT", "team_id": "T0BENCH"}
+            case "chat.postMessage":
+                return {"channel": args.get("channel"), "ts": self.next_ts()}
+            case "conversations.history" | "conversations.replies":
+                ts = args.get("oldest") or args.get("ts")
+                return {"messages": [{"type": "message", "text": "Benchmark report", "ts": ts}]}
+            case "users.info":
+                user = args.get("user")
+                return {
+                    "user": {
+                        "id": user,
+                        "real_name": f"Bench {user}",
+                        "profile": {"real_name": f"Bench {user}", "image_512": "https://example.com/a.png"},
+                    }
+                }
+            case "files.getUploadURLExternal":
+                with self._lock:
+                    file_id = f"F{next(self._file_ids):010d}"
+                return {"upload_url": f"{self.upload_url}/{file_id}", "file_id": file_id}
+            case "files.completeUploadExternal":
+                # Sent as a JSON string
+                return {"files": json.loads(args.get("files") or "[]")}
+            case "reactions.get":
+                return {"message": {"reactions": []}}
+            case "conversations.members":
+                return {"members": [], "response_metadata": {"next_cursor": ""}}
+            case _:
+                return {}
+
+
+class MemoryBackend(Backend):
+    """
+    Airtable stand-in that keeps records in memory and sleeps `latency` seconds per request
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.ops: Counter[str] = Counter()
+        self._records: dict[str, dict] = {}
+        # (field, ts) -> record id, so lookups don't scan every record
+        self._index: dict[tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def _request(self, op: str) -> None:
+        with self._lock:
+            self.ops[op] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def create(self, fields: dict) -> dict:
+        self._request("create")
+        record = {
+            "id": f"rec{uuid.uuid4().hex[:14]}",
+            "fields": {k: v for k, v in fields.items() if v is not None},
+        }
+        with self._lock:
+            self._records[record["id"]] = record
+            self._reindex(record, {})
+        return {"id": record["id"], "fields": dict(record["fields"])}
+
+    def find(self, ts: str, field: str | None = None) -> dict | None:
+        self._request("find")
+        fields = (field,) if field else TS_FIELDS
+        with self._lock:
+            for f in fields:
+                record_id = self._index.get((f, ts))
+                if record_id is not None:
+                    record = self._records[record_id]
+                    return {"id": record["id"], "fields": dict(record["fields"])}
+        return None
+
+    def _reindex(self, record: dict, old_fields: dict) -> None:
+        for f in TS_FIELDS:
+            if old_fields.get(f):
+                self._index.pop((f, old_fields[f]), None)
+            if record["fields"].get(f):
+                self._index[(f, record["fields"][f])] = record["id"]
+
+    def _apply(self, record_id: str, fields: dict) -> None:
+        record = self._records[record_id]
+        old_fields = record["fields"]
+        record["fields"] = {
+            k: v for k, v in {**old_fields, **fields}.items() if v is not None
+        }
+        self._reindex(record, old_fields)
+
+    def update(self, record_id: str, fields: dict) -> None:
+        self._request("update")
+        with self._lock:
+            self._apply(record_id, fields)
+
+    def batch_update(self, records: list[dict]) -> None:
+        self._request("batch_update")
+        with self._lock:
+            for record in records:
+                self._apply(record["id"], record["fields"])
+
+    def delete(self, record_id: str) -> None:
+        self._request("delete")
+        with self._lock:
+            record = self._records.pop(record_id, None)
+            if record is not None:
+                self._reindex({"id": record_id, "fields": {}}, record["fields"])
+
+    def peek(self, dm_ts: str) -> dict | None:
+        """
+        Look a record up without counting it as a request, for checking state between phases
+        """
+        with self._lock:
+            record_id = self._index.get(("dm_ts", dm_ts))
+            return None if record_id is None else dict(self._records[record_id])
+
+    def iterate(self, fields: list[str] | None = None, after: dict | None = None) -> Iterator[list[dict]]:
+        self._request("iterate")
+        with self._lock:
+            records = sorted(
+                (dict(r) for r in self._records.values() if after is None or r["id"] > after["id"]),
+                key=lambda r: r["id"],
+            )
+        for i in range(0, len(records), 100):
+            yield records[i : i + 100]
@@ -0,0 +1,179 @@
+"""
+File relay benchmark: copies files through shroud.utils.files against a local HTTP server standing in for Slack's file
+downloads and upload URLs. Reports throughput, the peak memory Python allocated during the copy and how much the
+process grew, for the streaming relay and for reading each file whole first, the way files_upload_v2 does.
+The server checks every upload's length and CRC against what it served
+"""
+
+import argparse
+import resource
+import threading
+import time
+import tracemalloc
+import urllib.request
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import ClassVar
+
+from pydantic import BaseModel
+from slack_sdk import WebClient
+
+from shroud import settings
+from shroud.bench.fakes import FakeSlack
+
+# Repeated to make up every served file
+BLOCK = bytes(range(256)) * 4096
+MB = 1024 * 1024
+
+
+def expected_crc(size: int) -> int:
+    crc = 0
+    for offset in range(0, size, len(BLOCK)):
+        crc = zlib.crc32(BLOCK[: min(len(BLOCK), size - offset)], crc)
+    return crc
+
+
+class FileServer(BaseHTTPRequestHandler):
+    """
+    GET /download/<size> serves `size` bytes. POST /upload/<file id> reads the body in blocks and records its length and CRC
+    """
+
+    # file id -> (bytes, crc), shared by the handler made for each request
+    uploads: ClassVar[dict[str, tuple[int, int]]] = {}
+
+    def do_GET(self):
+        size = int(self.path.rsplit("/", 1)[1])
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        for offset in range(0, size, len(BLOCK)):
+            self.wfile.write(BLOCK[: min(len(BLOCK), size - offset)])
+
+    def do_POST(self):
+        remaining = int(self.headers["Content-Length"])
+        received, crc = 0, 0
+        while remaining:
+            chunk = self.rfile.read(min(remaining, len(BLOCK)))
+            if not chunk:
+                break
+            received += len(chunk)
+            crc = zlib.crc32(chunk, crc)
+            remaining -= len(chunk)
+        self.uploads[self.path.rsplit("/", 1)[1]] = (received, crc)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"OK")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def buffered_transfer(file: dict, client: WebClient) -> str:
+    """
+    Download the whole file, then upload it, as files_upload_v2 would
+    """
+    request = urllib.request.Request(file["url_private_download"], headers={"Authorization": f"Bearer {client.token}"})
+    with urllib.request.urlopen(request) as download:
+        data = download.read()
+    upload = client.files_getUploadURLExternal(filename=file["name"], length=len(data))
+    with urllib.request.urlopen(urllib.request.Request(upload["upload_url"], data=data, method="POST")) as response:
+        response.read()
+    return upload["file_id"]
+
+
+class Result(BaseModel):
+    mode: str
+    files: int
+    megabytes: float
+    seconds: float
+    peak_traced_mb: float
+    rss_growth_mb: float
+
+    @property
+    def throughput(self) -> float:
+        return self.megabytes / self.seconds
+
+
+def _max_rss_mb() -> float:
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(mode: str, port: int, size: int, count: int) -> Result:
+    from shroud.utils import files
+
+    transfer = files.transfer
+    if mode == "buffered":
+        files.transfer = buffered_transfer
+    shared = [
+        {
+            "id": f"FBENCH{i:04d}",
+            "name": f"bench-{i}.bin",
+            "size": size,
+            "mimetype": "application/octet-stream",
+            "url_private_download": f"http://127.0.0.1:{port}/download/{size}",
+        }
+        for i in range(count)
+    ]
+    FileServer.uploads.clear()
+    rss_before = _max_rss_mb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = files.relay(shared, "C0BENCH0001", "1800000000.000001", WebClient(token="xoxb-bench"))
+    finally:
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        files.transfer = transfer
+    if result.skipped:
+        raise SystemExit(f"Files weren't relayed: {result.skipped}")
+    crc = expected_crc(size)
+    for file_id, (received, received_crc) in FileServer.uploads.items():
+        if received != size or received_crc != crc:
+            raise SystemExit(f"Upload {file_id} got {received} bytes with CRC {received_crc:x}, not {size} with {crc:x}")
+    return Result(
+        mode=mode,
+        files=count,
+        megabytes=size * count / MB,
+        seconds=seconds,
+        peak_traced_mb=peak / MB,
+        rss_growth_mb=_max_rss_mb() - rss_before,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m shroud.bench.files",
+        description="Relay files through a local stand-in for Slack's file servers and measure memory",
+    )
+    parser.add_argument("--size-mb", type=int, default=300, help="Size of each file")
+    parser.add_argument("--files", type=int, default=1, help="Files shared in the message")
+    parser.add_argument("--compare", action="store_true", help="Also copy the files by reading each one whole first")
+    args = parser.parse_args()
+
+    size = args.size_mb * MB
+    settings.set("file_relay_max_size", size)
+    settings.set("file_relay_max_total", size * args.files)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FileServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    slack = FakeSlack(latency=0)
+    slack.install()
+    slack.upload_url = f"http://127.0.0.1:{server.server_port}/upload"
+
+    print(
+        f"{args.files} x {args.size_mb} MB, {settings.file_relay_chunk_size // 1024} KB chunks, "
+        f"{settings.file_relay_concurrency} at once"
+    )
+    print(f"{'mode':<10} {'MB/s':>8} {'peak traced MB':>15} {'RSS growth MB':>14}")
+    # Streaming first, so its RSS growth isn't hidden by the buffered copy's
+    for mode in ("streaming", "buffered") if args.compare else ("streaming",):
+        result = run(mode, server.server_port, size, args.files)
+        print(f"{result.mode:<10} {result.throughput:>8.1f} {result.peak_traced_mb:>15.1f} {result.rss_growth_mb:>14.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
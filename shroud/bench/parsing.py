@@ -0,0 +1,137 @@
+"""
+Per-event cost of turning a message event into a MessageEvent: the prefilter alone, the current parser, and the pydantic
+model it replaced. Nothing is looked up in the database, which the old parser would also do for events the prefilter drops
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+from typing import Annotated, Any
+
+from pydantic import BaseModel, StringConstraints
+
+from shroud.bench import payloads
+from shroud.bench.fakes import FakeSlack
+
+# Importing the handlers creates the App, which calls auth.test
+FakeSlack(latency=0).install()
+from shroud.slack.handlers.incoming_message import (
+    MessageEvent,
+    ValidationRegexs,
+    is_relevant,
+    parse_message_event,
+)
+
+Channel = Annotated[str, StringConstraints(pattern=ValidationRegexs.channel.value)]
+Ts = Annotated[str, StringConstraints(pattern=ValidationRegexs.ts.value)]
+User = Annotated[str, StringConstraints(pattern=ValidationRegexs.user.value)]
+
+
+class PydanticMessageEvent(BaseModel):
+    """
+    The fields of the pydantic MessageEvent used before
+    """
+
+    channel: Channel
+    thread_ts: Ts | None = None
+    ts: Ts
+    user: User
+    content: str = None
+    content_post_update: str = None
+    attachments: list[Any] = []
+    subtype: MessageEvent.Subtypes
+    return_to_sender: bool = False
+
+
+def pydantic_parse(event: dict) -> PydanticMessageEvent | None:
+    """
+    parse_message_event as it was, without the prefilter
+    """
+    subtype = MessageEvent.Subtypes(event.get("subtype"))
+    if event.get("message", {}).get("subtype") == "bot_message":
+        return None
+    match subtype:
+        case MessageEvent.Subtypes.file_share | MessageEvent.Subtypes.normal:
+            return PydanticMessageEvent(
+                channel=event["channel"],
+                thread_ts=event.get("thread_ts"),
+                ts=event["ts"],
+                user=event.get("user"),
+                content=event.get("text", ""),
+                subtype=subtype,
+            )
+        case MessageEvent.Subtypes.message_changed:
+            return PydanticMessageEvent(
+                channel=event["channel"],
+                subtype=subtype,
+                ts=event["message"]["ts"],
+                content=f"A message has been edited from ```{event['previous_message']['text']}``` to ```{event['message']['text']}```",
+                content_post_update=event["message"]["text"],
+                user=event["message"]["user"],
+                thread_ts=event["message"].get("thread_ts"),
+                attachments=event["message"].get("attachments", []),
+            )
+        case MessageEvent.Subtypes.message_deleted:
+            return PydanticMessageEvent(
+                channel=event["channel"],
+                subtype=subtype,
+                ts=event["deleted_ts"],
+                user=event["previous_message"]["user"],
+                thread_ts=event["previous_message"].get("thread_ts"),
+                return_to_sender=True,
+                content="Message deletions are not forwarded.",
+            )
+    return None
+
+
+def _bot_update() -> dict:
+    body = payloads.message_changed(1, "1800000000.000001", "1800000000.000001", "1800000000.000003")
+    body["event"]["channel"] = payloads.FD_CHANNEL
+    body["event"]["message"]["subtype"] = "bot_message"
+    return body
+
+
+dm_ts, reply_ts, event_ts = "1800000000.000001", "1800000000.000002", "1800000000.000003"
+EVENTS: dict[str, dict] = {
+    name: body["event"]
+    for name, body in {
+        "dm_message": payloads.dm_message(1, dm_ts),
+        "dm_reply": payloads.dm_reply(1, dm_ts, reply_ts),
+        "channel_reply": payloads.channel_reply(payloads.FD_CHANNEL, dm_ts, reply_ts),
+        "channel_message": payloads.channel_message(payloads.FD_CHANNEL, reply_ts),
+        "bot_update": _bot_update(),
+        "message_changed": payloads.message_changed(1, dm_ts, reply_ts, event_ts),
+        "message_deleted": payloads.message_deleted(1, dm_ts, reply_ts, event_ts),
+        "file_share": payloads.file_share(1, dm_ts, reply_ts),
+    }.items()
+}
+
+
+def _ns_per_call(func: Callable[[dict], object], event: dict, iterations: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func(event)
+        best = min(best, time.perf_counter() - start)
+    return best / iterations * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m shroud.bench.parsing", description=__doc__)
+    parser.add_argument("--iterations", type=int, default=50000, help="Parses per run")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per event, of which the fastest is reported")
+    args = parser.parse_args()
+
+    print(f"{'event':<16} {'relevant':>8} {'prefilter ns':>13} {'parse ns':>9} {'pydantic ns':>12} {'speedup':>8}")
+    for name, event in EVENTS.items():
+        prefilter = _ns_per_call(is_relevant, event, args.iterations, args.repeat)
+        parse = _ns_per_call(parse_message_event, event, args.iterations, args.repeat)
+        baseline = _ns_per_call(pydantic_parse, event, args.iterations, args.repeat)
+        print(
+            f"{name:<16} {is_relevant(event)!s:>8} {prefilter:>13.0f} {parse:>9.0f} {baseline:>12.0f} {baseline / parse:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Event and action payloads shaped like the ones Slack delivers over Socket Mode, trimmed to what Bolt and the handlers read
+"""
+
+TEAM_ID = "T0BENCH"
+FD_MEMBER = "U0BENCHFD0"
+# Stands in for settings.channel, which may not be a valid channel ID in example settings
+FD_CHANNEL = "C0BENCHFD00"
+
+
+def reporter(i: int) -> str:
+    return f"U{i:010d}"
+
+
+def dm_channel(i: int) -> str:
+    return f"D{i:010d}"
+
+
+def _event(event: dict) -> dict:
+    return {
+        "type": "event_callback",
+        "team_id": TEAM_ID,
+        "api_app_id": "A0BENCH",
+        "event": event,
+        "event_id": f"Ev{event.get('event_ts', event.get('ts', '')).replace('.', '')}",
+        "event_time": 1800000000,
+    }
+
+
+def dm_message(i: int, ts: str) -> dict:
+    return _event(
+        {
+            "type": "message",
+            "channel": dm_channel(i),
+            "channel_type": "im",
+            "user": reporter(i),
+            "text": f"Report number {i}",
+            "ts": ts,
+            "event_ts": ts,
+        }
+    )
+
+
+def dm_reply(i: int, dm_ts: str, ts: str) -> dict:
+    body = dm_message(i, ts)
+    body["event"]["thread_ts"] = dm_ts
+    body["event"]["text"] = "Some more context"
+    return body
+
+
+def channel_reply(channel: str, forwarded_ts: str, ts: str) -> dict:
+    return _event(
+        {
+            "type": "message",
+            "channel": channel,
+            "channel_type": "channel",
+            "user": FD_MEMBER,
+            "text": "? Thanks, we're looking into it",
+            "thread_ts": forwarded_ts,
+            "ts": ts,
+            "event_ts": ts,
+        }
+    )
+
+
+def channel_message(channel: str, ts: str) -> dict:
+    """
+    A message in a private channel Shroud is in that has nothing to do with a relay
+    """
+    body = channel_reply(channel, ts, ts)
+    del body["event"]["thread_ts"]
+    body["event"]["text"] = "Unrelated chatter"
+    return body
+
+
+def message_changed(i: int, dm_ts: str, reply_ts: str, event_ts: str) -> dict:
+    return _event(
+        {
+            "type": "message",
+            "subtype": "message_changed",
+            "channel": dm_channel(i),
+            "channel_type": "im",
+            "hidden": True,
+            "message": {
+                "type": "message",
+                "user": reporter(i),
+                "text": "Some more context, edited",
+                "ts": reply_ts,
+                "thread_ts": dm_ts,
+            },
+            "previous_message": {
+                "type": "message",
+                "user": reporter(i),
+                "text": "Some more context",
+                "ts": reply_ts,
+                "thread_ts": dm_ts,
+            },
+            "ts": event_ts,
+            "event_ts": event_ts,
+        }
+    )
+
+
+def report_edited(i: int, dm_ts: str, event_ts: str) -> dict:
+    body = message_changed(i, dm_ts, dm_ts, event_ts)
+    for message, text in ((body["event"]["message"], f"Report number {i}, edited"), (body["event"]["previous_message"], f"Report number {i}")):
+        del message["thread_ts"]
+        message["text"] = text
+    return body
+
+
+def message_deleted(i: int, dm_ts: str, reply_ts: str, event_ts: str) -> dict:
+    return _event(
+        {
+            "type": "message",
+            "subtype": "message_deleted",
+            "channel": dm_channel(i),
+            "channel_type": "im",
+            "hidden": True,
+            "deleted_ts": reply_ts,
+            "previous_message": {
+                "type": "message",
+                "user": reporter(i),
+                "text": "Some more context, edited",
+                "ts": reply_ts,
+                "thread_ts": dm_ts,
+            },
+            "ts": event_ts,
+            "event_ts": event_ts,
+        }
+    )
+
+
+def file_share(i: int, dm_ts: str, ts: str) -> dict:
+    return _event(
+        {
+            "type": "message",
+            "subtype": "file_share",
+            "channel": dm_channel(i),
+            "channel_type": "im",
+            "user": reporter(i),
+            "text": "",
+            "files": [{"id": f"F{i:010d}", "name": "screenshot.png", "mimetype": "image/png", "size": 48213}],
+            "upload": False,
+            "thread_ts": dm_ts,
+            "ts": ts,
+            "event_ts": ts,
+        }
+    )
+
+
+def _action(i: int, dm_ts: str, selection_ts: str, action: dict) -> dict:
+    return {
+        "type": "block_actions",
+        "team": {"id": TEAM_ID, "domain": "bench"},
+        "user": {"id": reporter(i), "team_id": TEAM_ID},
+        "api_app_id": "A0BENCH",
+        # Unique per interaction, like Slack's
+        "trigger_id": f"{i}.{selection_ts}.{action['action_id']}",
+        "container": {"type": "message", "message_ts": selection_ts, "channel_id": dm_channel(i), "is_ephemeral": False, "thread_ts": dm_ts},
+        "channel": {"id": dm_channel(i), "name": "directmessage"},
+        "message": {"type": "message", "user": "U0BENCHBOT", "ts": selection_ts, "thread_ts": dm_ts, "text": "Select how this message should be forwarded"},
+        "actions": [action],
+    }
+
+
+def report_forwarding(i: int, dm_ts: str, selection_ts: str, selection: str) -> dict:
+    return _action(
+        i,
+        dm_ts,
+        selection_ts,
+        {
+            "type": "static_select",
+            "action_id": "report_forwarding",
+            "block_id": "bench",
+            "selected_option": {"text": {"type": "plain_text", "text": selection}, "value": selection},
+            "action_ts": selection_ts,
+        },
+    )
+
+
+def submit_forwarding(i: int, dm_ts: str, selection_ts: str) -> dict:
+    return _action(
+        i,
+        dm_ts,
+        selection_ts,
+        {
+            "type": "button",
+            "action_id": "submit_forwarding",
+            "block_id": "bench",
+            "text": {"type": "plain_text", "text": "Submit"},
+            "action_ts": selection_ts,
+        },
+    )
+
+
+def reaction(kind: str, channel: str, forwarded_ts: str, event_ts: str) -> dict:
+    return _event(
+        {
+            "type": kind,
+            "user": FD_MEMBER,
+            "reaction": "white_check_mark",
+            "item": {"type": "message", "channel": channel, "ts": forwarded_ts},
+            "item_user": "U0BENCHBOT",
+            "event_ts": event_ts,
+        }
+    )
@@ -0,0 +1,205 @@
+import time
+from collections import Counter
+
+from pydantic import BaseModel
+from slack_bolt.request import BoltRequest
+
+from shroud import settings
+from shroud.bench import payloads
+from shroud.bench.fakes import FakeSlack, MemoryBackend
+from shroud.utils.outbox import outbox
+
+# Replayed in this order, each phase once per relay. Later phases need timestamps earlier ones produced
+PHASES = (
+    "dm_message",
+    "report_forwarding",
+    "report_edited",
+    "submit_forwarding",
+    "dm_reply",
+    "channel_reply",
+    "message_changed",
+    "message_deleted",
+    "file_share",
+    "reaction_added",
+    "reaction_removed",
+    # Threads and reactions in FD's channel that aren't relays
+    "unrelated_reply",
+    "unrelated_reaction",
+)
+
+
+class PhaseResult(BaseModel):
+    event_type: str
+    events: int
+    seconds: float
+    events_per_second: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    # Per event, by method or backend operation
+    slack_calls: dict[str, float]
+    db_ops: dict[str, float]
+
+
+class Relay(BaseModel):
+    i: int
+    dm_ts: str
+    selection_ts: str | None = None
+    forwarded_ts: str | None = None
+    reply_ts: str | None = None
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    # Nearest rank
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def _per_event(after: Counter, before: Counter, events: int) -> dict[str, float]:
+    return {k: round(v / events, 2) for k, v in sorted((after - before).items())}
+
+
+class Replay:
+    """
+    Feeds payloads through the registered Bolt listeners and times each one from dispatch until its listener finishes
+    """
+
+    def __init__(self, slack: FakeSlack, backend: MemoryBackend):
+        # Imported here so the fakes are installed before Bolt builds its client
+        from shroud.slack import handlers
+        from shroud.slack import slack as slack_app
+        from shroud.utils import db
+
+        self.slack = slack
+        self.backend = backend
+        self.app = slack_app.app
+        self.pool = slack_app.worker_pool
+        self.db = db
+        db.use_backend(backend)
+        handlers.register()
+
+        # Every listener in the replay is ordered, so the dispatcher sees each one's work
+        dispatcher = slack_app.dispatcher
+        submit = dispatcher.submit
+        # One list per listener run for the event being dispatched, filled with its finish time
+        self._runs: list[list[float]] = []
+
+        def timed_submit(key, fn, /, *args, **kwargs):
+            finished: list[float] = []
+            self._runs.append(finished)
+
+            def run(*args, **kwargs):
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    finished.append(time.perf_counter())
+
+            return submit(key, run, *args, **kwargs)
+
+        dispatcher.submit = timed_submit
+
+    def _dispatch(self, body: dict) -> tuple[float, list[list[float]]]:
+        runs = self._runs = []
+        start = time.perf_counter()
+        self.app.dispatch(BoltRequest(body=body, mode="socket_mode"))
+        # Events no listener picked up only cost the dispatch
+        if not runs:
+            runs.append([time.perf_counter()])
+        return start, runs
+
+    def phase(self, event_type: str, bodies: list[dict]) -> PhaseResult:
+        calls_before, ops_before = Counter(self.slack.calls), Counter(self.backend.ops)
+        start = time.perf_counter()
+        timings = [self._dispatch(body) for body in bodies]
+        self.pool.wait_idle()
+        # Latency stops at the listener, but calls the outbox makes afterwards still belong to this phase
+        outbox.wait_idle()
+        seconds = time.perf_counter() - start
+        # Queued writes belong to the phase that made them, but flushing isn't part of its latency
+        if self.db.writes:
+            self.db.writes.flush()
+        calls_after, ops_after = Counter(self.slack.calls), Counter(self.backend.ops)
+
+        latencies = sorted(
+            max(end for finished in runs for end in finished) - start
+            for start, runs in timings
+        )
+        return PhaseResult(
+            event_type=event_type,
+            events=len(bodies),
+            seconds=round(seconds, 3),
+            events_per_second=round(len(bodies) / seconds, 1),
+            p50_ms=round(percentile(latencies, 50) * 1000, 1),
+            p95_ms=round(percentile(latencies, 95) * 1000, 1),
+            p99_ms=round(percentile(latencies, 99) * 1000, 1),
+            slack_calls=_per_event(calls_after, calls_before, len(bodies)),
+            db_ops=_per_event(ops_after, ops_before, len(bodies)),
+        )
+
+    def _bodies(self, event_type: str, relays: list[Relay]) -> list[dict]:
+        ts = self.slack.next_ts
+        match event_type:
+            case "dm_message":
+                return [payloads.dm_message(r.i, r.dm_ts) for r in relays]
+            case "report_forwarding":
+                return [
+                    payloads.report_forwarding(
+                        r.i, r.dm_ts, r.selection_ts, "with_username" if r.i % 2 else "anonymous"
+                    )
+                    for r in relays
+                ]
+            case "report_edited":
+                return [payloads.report_edited(r.i, r.dm_ts, ts()) for r in relays]
+            case "submit_forwarding":
+                return [payloads.submit_forwarding(r.i, r.dm_ts, r.selection_ts) for r in relays]
+            case "dm_reply":
+                for r in relays:
+                    r.reply_ts = ts()
+                return [payloads.dm_reply(r.i, r.dm_ts, r.reply_ts) for r in relays]
+            case "channel_reply":
+                return [payloads.channel_reply(settings.channel, r.forwarded_ts, ts()) for r in relays]
+            case "message_changed":
+                return [payloads.message_changed(r.i, r.dm_ts, r.reply_ts, ts()) for r in relays]
+            case "message_deleted":
+                return [payloads.message_deleted(r.i, r.dm_ts, r.reply_ts, ts()) for r in relays]
+            case "file_share":
+                return [payloads.file_share(r.i, r.dm_ts, ts()) for r in relays]
+            case "reaction_added" | "reaction_removed":
+                return [payloads.reaction(event_type, settings.channel, r.forwarded_ts, ts()) for r in relays]
+            case "unrelated_reply":
+                return [payloads.channel_reply(settings.channel, ts(), ts()) for r in relays]
+            case "unrelated_reaction":
+                return [payloads.reaction("reaction_added", settings.channel, ts(), ts()) for r in relays]
+
+    def run(self, relay_count: int) -> tuple[list[PhaseResult], int]:
+        """
+        Replay every phase for `relay_count` relays. Returns the results and how many relays ended up fully forwarded
+        """
+        relays = [Relay(i=i, dm_ts=self.slack.next_ts()) for i in range(relay_count)]
+        results = []
+        for event_type in PHASES:
+            results.append(self.phase(event_type, self._bodies(event_type, relays)))
+            for relay in relays:
+                fields = self.backend.peek(relay.dm_ts)["fields"]
+                relay.selection_ts = fields.get("selection_ts")
+                relay.forwarded_ts = fields.get("forwarded_ts")
+        complete = sum(
+            1
+            for relay in relays
+            if {"forwarded_ts", "reply_time"} <= self.backend.peek(relay.dm_ts)["fields"].keys()
+        )
+        return results, complete
+
+
+def format_results(results: list[PhaseResult]) -> str:
+    lines = [
+        f"{'event':<18} {'events':>6} {'ev/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  calls per event"
+    ]
+    for r in results:
+        calls = ", ".join(f"{k} x{v}" for k, v in {**r.slack_calls, **{f"db.{k}": v for k, v in r.db_ops.items()}}.items())
+        lines.append(
+            f"{r.event_type:<18} {r.events:>6} {r.events_per_second:>8} {r.p50_ms:>8} {r.p95_ms:>8} {r.p99_ms:>8}  {calls or '-'}"
+        )
+    return "\n".join(lines)
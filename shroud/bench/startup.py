@@ -0,0 +1,90 @@
+"""
+Cold start benchmark: wall-clock time from launching a fresh interpreter until Shroud is connected to Socket Mode.
+Offline by default, with Slack faked and each Slack round trip taking --slack-latency seconds. --live connects with the configured tokens
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+# Printed by the child in this order
+MILESTONES = ("imported", "registered", "connected", "backend ready")
+
+
+def _mark(name: str) -> None:
+    print(f"milestone {name}", flush=True)
+
+
+def child(live: bool, slack_latency: float) -> None:
+    """
+    Follow shroud.__main__.main() up to the point Socket Mode is connected, reporting each step
+    """
+    if not live:
+        from slack_bolt.adapter.socket_mode import SocketModeHandler
+
+        from shroud.bench.fakes import FakeSlack
+
+        FakeSlack(latency=slack_latency).install()
+        # apps.connections.open, then the WebSocket handshake
+        SocketModeHandler.connect = lambda self: time.sleep(slack_latency * 2)
+        SocketModeHandler.close = lambda self: None
+
+    import shroud.__main__ as entry
+
+    _mark("imported")
+    entry.handlers.register()
+    _mark("registered")
+
+    from slack_bolt.adapter.socket_mode import SocketModeHandler
+
+    from shroud import settings
+    from shroud.slack.slack import app
+    from shroud.utils import db
+
+    handler = SocketModeHandler(app, settings.slack_app_token)
+    handler.connect()
+    _mark("connected")
+    # Happens in the background in start_app, but it's worth knowing how long the first event could wait on it
+    db.init_backend()
+    _mark("backend ready")
+    handler.close()
+
+
+def run_once(live: bool, slack_latency: float) -> dict[str, float]:
+    args = [sys.executable, "-m", "shroud.bench.startup", "--child", "--slack-latency", str(slack_latency)]
+    if live:
+        args.append("--live")
+    start = time.perf_counter()
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, text=True)
+    timings = {}
+    for line in process.stdout:
+        if line.startswith("milestone "):
+            timings[line.removeprefix("milestone ").strip()] = time.perf_counter() - start
+    if process.wait() != 0:
+        raise RuntimeError(f"Startup failed with exit code {process.returncode}")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m shroud.bench.startup", description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--slack-latency", type=float, default=0.1, help="Seconds each faked Slack round trip takes")
+    parser.add_argument("--live", action="store_true", help="Connect to Slack for real with the configured tokens")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.live, args.slack_latency)
+        return
+
+    runs = [run_once(args.live, args.slack_latency) for _ in range(args.runs)]
+    print(f"{'milestone':<14} {'median s':>9} {'min s':>7} {'max s':>7}")
+    for milestone in MILESTONES:
+        values = [r[milestone] for r in runs if milestone in r]
+        if values:
+            print(f"{milestone:<14} {statistics.median(values):>9.3f} {min(values):>7.3f} {max(values):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
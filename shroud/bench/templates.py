@@ -0,0 +1,177 @@
+"""
+Per-message cost of the payloads in shroud.utils.templates against building them from scratch, the way Shroud did before.
+For each payload it reports the time to build it, the time to build and JSON-encode it like the Web API client does,
+and how many bytes and objects each message allocates while it's in flight
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from collections.abc import Callable
+
+from pydantic import BaseModel
+
+from shroud.utils import templates
+
+
+def _fresh_selection_prompt() -> list[dict]:
+    return [
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": "Do you want to forward this report anonymously or with your username?",
+            },
+            "accessory": {
+                "type": "static_select",
+                "action_id": "report_forwarding",
+                "placeholder": {"type": "plain_text", "text": "Choose an option"},
+                "options": [
+                    {"text": {"type": "plain_text", "text": "Forward Anonymously"}, "value": "anonymous"},
+                    {"text": {"type": "plain_text", "text": "Forward with Username"}, "value": "with_username"},
+                ],
+            },
+        },
+        {
+            "type": "actions",
+            "elements": [
+                {
+                    "type": "button",
+                    "text": {"type": "plain_text", "text": "Submit"},
+                    "style": "primary",
+                    "action_id": "submit_forwarding",
+                }
+            ],
+        },
+    ]
+
+
+def _fresh_submitted(user_selection: str) -> list[dict]:
+    return [
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": f"{'This report has been submitted' if user_selection == "with_username" else 'This report has been submitted anonymously'}. We've received your report and should get back to you within a couple hours.",
+            },
+        }
+    ]
+
+
+def _fresh_join_channel(private_channel: str, target_user: str) -> list[dict]:
+    return [
+        {
+            "type": "section",
+            "text": {"type": "mrkdwn", "text": templates.join_channel_text(private_channel, target_user)},
+        },
+        {
+            "type": "actions",
+            "elements": [
+                {
+                    "type": "button",
+                    "text": {"type": "plain_text", "text": "Join private channel"},
+                    "action_id": "join_private_channel",
+                    "value": private_channel,
+                }
+            ],
+        },
+    ]
+
+
+# name -> (from scratch, template), both taking the message number
+CASES: dict[str, tuple[Callable[[int], object], Callable[[int], object]]] = {
+    "selection_prompt": (lambda i: _fresh_selection_prompt(), lambda i: templates.selection_prompt_blocks()),
+    "submitted": (
+        lambda i: _fresh_submitted("anonymous" if i % 2 else "with_username"),
+        lambda i: templates.submitted_blocks("anonymous" if i % 2 else "with_username"),
+    ),
+    "join_channel": (
+        lambda i: _fresh_join_channel(f"C{i:010d}", f"U{i:010d}"),
+        lambda i: templates.join_channel_blocks(f"C{i:010d}", f"U{i:010d}"),
+    ),
+    "help_text": (lambda i: templates.build_help_text(), lambda i: templates.help_text()),
+}
+
+
+class CaseResult(BaseModel):
+    payload: str
+    variant: str
+    build_us: float
+    build_and_encode_us: float
+    bytes_per_message: float
+    objects_per_message: float
+
+
+def _time_per_call(func: Callable[[int], object], iterations: int, encode: bool, repeat: int) -> float:
+    # Best of `repeat` runs, since anything slower than that is noise from elsewhere
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(iterations):
+            payload = func(i)
+            if encode:
+                # What slack_sdk does with a chat.postMessage body
+                json.dumps({"channel": "C0BENCHFD00", "blocks": payload})
+        best = min(best, time.perf_counter() - start)
+    return best / iterations * 1e6
+
+
+def _allocations_per_call(func: Callable[[int], object], iterations: int) -> tuple[float, float]:
+    # Payloads are kept, as they would be while their requests are in flight, so what they allocate is still traced
+    kept = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i in range(iterations):
+        kept.append(func(i))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = [s for s in after.compare_to(before, "filename") if s.size_diff > 0]
+    # The list holding the payloads isn't part of any message
+    size = sum(s.size_diff for s in stats) - kept.__sizeof__()
+    count = sum(s.count_diff for s in stats) - 1
+    return max(size, 0) / iterations, max(count, 0) / iterations
+
+
+def run(iterations: int, repeat: int) -> list[CaseResult]:
+    results = []
+    for name, (fresh, template) in CASES.items():
+        assert fresh(0) == template(0) and fresh(1) == template(1), f"{name} template doesn't match"
+        # help_text is cached after this, like it is after startup
+        template(0)
+        # Parsing the manifest is slow enough that fewer iterations are plenty
+        n = max(1, iterations // 1000) if name == "help_text" else iterations
+        for variant, func in (("from scratch", fresh), ("template", template)):
+            size, count = _allocations_per_call(func, n)
+            results.append(
+                CaseResult(
+                    payload=name,
+                    variant=variant,
+                    build_us=round(_time_per_call(func, n, False, repeat), 2),
+                    build_and_encode_us=round(_time_per_call(func, n, name != "help_text", repeat), 2),
+                    bytes_per_message=round(size, 1),
+                    objects_per_message=round(count, 1),
+                )
+            )
+    return results
+
+
+def format_results(results: list[CaseResult]) -> str:
+    lines = [f"{'payload':<18} {'variant':<13} {'build us':>9} {'+encode us':>11} {'bytes':>9} {'objects':>8}"]
+    for r in results:
+        lines.append(
+            f"{r.payload:<18} {r.variant:<13} {r.build_us:>9} {r.build_and_encode_us:>11} {r.bytes_per_message:>9} {r.objects_per_message:>8}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m shroud.bench.templates", description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20000, help="Messages built per run")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per payload, of which the fastest is reported")
+    args = parser.parse_args()
+    print(format_results(run(args.iterations, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
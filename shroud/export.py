@@ -0,0 +1,167 @@
+"""
+`python -m shroud export`: every relay record and the forwarded report's thread, as gzipped JSON lines.
+Records are read a page at a time and threads are fetched a few at a time as background Slack calls, so memory doesn't
+grow with the table. The file is written as a series of gzip members, and a checkpoint is saved after each one, so an
+interrupted export picks up where the last checkpoint left off
+"""
+
+import argparse
+import collections
+import contextvars
+import gzip
+import json
+import os
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO
+
+from pydantic import BaseModel
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+from shroud import settings
+from shroud.slack.client import ScheduledWebClient, print_stats
+from shroud.utils import db, ratelimit
+
+
+class Checkpoint(BaseModel):
+    # Records written so far
+    records: int = 0
+    # The last of them, which the backend lists the rest after. Records are listed in order of these, not by position,
+    # so records created or deleted since don't shift where the export picks up
+    last_id: str | None = None
+    last_dm_ts: str | None = None
+    # Length of the file up to the end of the last complete gzip member
+    size: int = 0
+    threads_failed: int = 0
+
+
+def _records(checkpoint: Checkpoint) -> Iterator[dict]:
+    """
+    Every record after the checkpoint's last one, a page at a time from the backend
+    """
+    after = None
+    if checkpoint.last_id is not None:
+        after = {"id": checkpoint.last_id, "fields": {"dm_ts": checkpoint.last_dm_ts}}
+    for page in db.init_backend().iterate(after=after):
+        yield from page
+
+
+def fetch_thread(client: WebClient, ts: str) -> list[dict]:
+    messages = []
+    cursor = None
+    while True:
+        resp = client.conversations_replies(channel=settings.channel, ts=ts, limit=200, cursor=cursor)
+        messages.extend(resp["messages"])
+        cursor = resp.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            return messages
+
+
+def _export_line(record: dict, client: WebClient) -> dict:
+    forwarded_ts = record["fields"].get("forwarded_ts")
+    if not forwarded_ts:
+        return {"record": record, "thread": []}
+    try:
+        return {"record": record, "thread": fetch_thread(client, forwarded_ts)}
+    except SlackApiError as e:
+        # Usually a report that was deleted from the channel, which shouldn't stop the rest
+        return {"record": record, "thread": None, "error": e.response.get("error")}
+
+
+def _with_threads(records: Iterator[dict], client: WebClient, workers: int) -> Iterator[dict]:
+    """
+    Lines for `records` in order, with up to twice `workers` threads being fetched ahead of the one being written
+    """
+    pending: collections.deque[Future] = collections.deque()
+    with ratelimit.background(), ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export") as pool:
+        for record in records:
+            # Each fetch carries this thread's context so the background priority applies in the pool
+            pending.append(pool.submit(contextvars.copy_context().run, _export_line, record, client))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _save_checkpoint(path: Path, checkpoint: Checkpoint) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(checkpoint.model_dump_json())
+    os.replace(tmp, path)
+
+
+def _end_member(gz: gzip.GzipFile, raw: BinaryIO) -> int:
+    gz.close()
+    raw.flush()
+    os.fsync(raw.fileno())
+    return raw.tell()
+
+
+def export(output: Path, restart: bool = False) -> Checkpoint:
+    checkpoint_path = output.with_name(output.name + ".checkpoint")
+    if checkpoint_path.exists() and not restart:
+        if not output.exists():
+            raise FileNotFoundError(f"{checkpoint_path} is for {output}, which is missing, pass --restart to start over")
+        checkpoint = Checkpoint.model_validate_json(checkpoint_path.read_text())
+        print(f"Resuming after {checkpoint.records} records")
+        mode = "r+b"
+    elif output.exists() and not restart:
+        raise FileExistsError(f"{output} already exists, pass --restart to overwrite it")
+    else:
+        checkpoint = Checkpoint()
+        mode = "wb"
+
+    client = ScheduledWebClient(token=settings.slack_bot_token)
+    lines = _with_threads(_records(checkpoint), client, settings.export_workers)
+    with open(output, mode) as raw:
+        # Drops a gzip member that was being written when the export stopped
+        raw.truncate(checkpoint.size)
+        raw.seek(checkpoint.size)
+        gz = gzip.GzipFile(fileobj=raw, mode="wb")
+        written = 0
+        try:
+            for line in lines:
+                gz.write(json.dumps(line, separators=(",", ":")).encode() + b"\n")
+                checkpoint.records += 1
+                checkpoint.last_id = line["record"]["id"]
+                checkpoint.last_dm_ts = line["record"]["fields"].get("dm_ts")
+                if line["thread"] is None:
+                    checkpoint.threads_failed += 1
+                written += 1
+                if written % settings.export_checkpoint_interval == 0:
+                    checkpoint.size = _end_member(gz, raw)
+                    _save_checkpoint(checkpoint_path, checkpoint)
+                    print(f"Exported {checkpoint.records} records")
+                    gz = gzip.GzipFile(fileobj=raw, mode="wb")
+            checkpoint.size = _end_member(gz, raw)
+        finally:
+            # Does nothing once the member is ended. A member cut short is dropped when the export resumes
+            gz.close()
+    checkpoint_path.unlink(missing_ok=True)
+    return checkpoint
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m shroud export",
+        description="Write every relay record and its forwarded thread to gzipped JSON lines",
+    )
+    parser.add_argument(
+        "output", type=Path, nargs="?", default=Path("shroud-export.jsonl.gz"), help="File to write"
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="Ignore any checkpoint and overwrite the output"
+    )
+    args = parser.parse_args(argv)
+    try:
+        checkpoint = export(args.output, restart=args.restart)
+    except (FileExistsError, FileNotFoundError) as e:
+        raise SystemExit(str(e))
+    finally:
+        db.close()
+    print(
+        f"Exported {checkpoint.records} records to {args.output}"
+        + (f", {checkpoint.threads_failed} threads couldn't be fetched" if checkpoint.threads_failed else "")
+    )
+    print_stats()
@@ -1,3 +1,11 @@
-from shroud.slack.slack import app
+# Importing shroud.slack.slack builds the App, which calls auth.test, so it waits until a handler asks for the App.
+# `python -m shroud export` only needs shroud.slack.client
+__all__ = ["app", "deferred", "ordered"]
 
-__all__ = ["app"]
+
+def __getattr__(name: str):
+    if name in __all__:
+        from shroud.slack import slack
+
+        return getattr(slack, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
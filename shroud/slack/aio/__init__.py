@@ -0,0 +1,3 @@
+from shroud.slack.aio.app import app, deferred, ordered, start_app
+
+__all__ = ["app", "deferred", "ordered", "start_app"]
@@ -0,0 +1,227 @@
+import asyncio
+import functools
+
+# Slack imports
+from slack_bolt import BoltResponse
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.context.respond.async_respond import AsyncRespond
+
+# To avoid a log message about unhandled requests
+from slack_bolt.error import BoltUnhandledRequestError
+from slack_bolt.kwargs_injection.async_utils import build_async_required_kwargs
+from slack_bolt.request.async_request import AsyncBoltRequest
+from slack_bolt.util.utils import get_arg_names_of_callable
+from slack_sdk.errors import SlackApiError
+
+from shroud import settings
+from shroud.slack import client as slack_client
+from shroud.slack import supervisor
+from shroud.slack.aio.client import AsyncScheduledWebClient
+from shroud.slack.slack import ERROR_MESSAGE
+from shroud.utils import allowlist, channels, db, events, metrics, stats, templates
+from shroud.utils.dispatch import AsyncOrderedDispatcher
+from shroud.utils.edits import debouncer
+from shroud.utils.outbox import outbox
+from shroud.utils.workers import TaskLimiter
+
+# Bounds deferred listener work the same way the sync runtime's worker pool does
+limiter = TaskLimiter(
+    max_tasks=settings.worker_pool_size, max_queue=settings.worker_queue_size
+)
+dispatcher = AsyncOrderedDispatcher()
+# Ordered listeners run as plain tasks rather than Bolt lazy listeners, so keep them referenced until they finish
+_ordered_tasks: set[asyncio.Task] = set()
+app = AsyncApp(
+    client=AsyncScheduledWebClient(token=settings.slack_bot_token),
+    raise_error_for_unhandled_request=True,
+    process_before_response=True,
+)
+
+
+async def claim_request(body, next):
+    # See shroud.slack.slack.claim_request
+    key = events.event_key(body)
+    if key is not None:
+        claimed = await asyncio.to_thread(events.store.claim, key, settings.socket_worker_id)
+        metrics.socket_requests.inc(
+            worker=str(settings.socket_worker_id),
+            result="claimed" if claimed else "duplicate",
+        )
+        if not claimed:
+            return BoltResponse(status=200, body="")
+    await next()
+
+
+if events.store is not None:
+    app.middleware(claim_request)
+
+
+@app.middleware
+async def use_scheduled_client(context, next):
+    context["client"] = app.client
+    await next()
+
+
+async def _ack(ack):
+    # Holding the ack until there's room is what pushes back on Slack
+    await limiter.reserve()
+    await ack()
+
+
+def _reporting_errors(func):
+    async def timed(kwargs):
+        # Timed inside the limiter so waiting for a slot isn't counted as listener time
+        with metrics.timed(
+            metrics.listener_seconds,
+            metrics.listener_errors,
+            metrics.listeners_in_flight,
+            handler=func.__name__,
+            subtype=metrics.listener_subtype(kwargs),
+        ):
+            await func(**kwargs)
+
+    @functools.wraps(func)
+    async def run(**kwargs):
+        try:
+            await limiter.run(timed(kwargs))
+        except Exception as e:  # noqa: BLE001
+            # Like handle_errors, which Bolt calls with whatever a listener raised
+            print(f"Error in {func.__name__}: {e}")
+            if "respond" in kwargs:
+                try:
+                    await kwargs["respond"](ERROR_MESSAGE)
+                except SlackApiError as e:
+                    print(f"Error sending message: {e.response['error']}")
+
+    return run
+
+
+def deferred(register):
+    """
+    Async version of shroud.slack.deferred
+    """
+
+    def decorator(func):
+        register(ack=_ack, lazy=[_reporting_errors(func)])
+        return func
+
+    return decorator
+
+
+def ordered(register, key):
+    """
+    Async version of shroud.slack.ordered
+    """
+
+    def decorator(func):
+        run = _reporting_errors(func)
+        arg_names = get_arg_names_of_callable(func)
+
+        async def run_request(request: AsyncBoltRequest):
+            await run(
+                **build_async_required_kwargs(
+                    logger=app.logger,
+                    required_arg_names=arg_names,
+                    request=request,
+                    response=None,
+                    this_func=func,
+                )
+            )
+
+        async def ack_and_dispatch(ack, body, request: AsyncBoltRequest):
+            await limiter.reserve()
+            # Envelopes reach this one at a time (see socket_mode_handler), and tasks start in creation order and queue on
+            # their key's lock before yielding, which keeps a relay in order
+            task = asyncio.create_task(
+                dispatcher.run(key(body), run_request(request.to_copyable()))
+            )
+            _ordered_tasks.add(task)
+            task.add_done_callback(_ordered_tasks.discard)
+            await ack()
+
+        register(ack_and_dispatch)
+        return func
+
+    return decorator
+
+
+def socket_mode_handler() -> AsyncSocketModeHandler:
+    """
+    AsyncSocketModeHandler that handles envelopes one at a time in the order they arrived. slack_sdk starts a task per
+    envelope and Bolt's middleware awaits before `ordered` is reached, so two events for one relay could otherwise swap
+    """
+    handler = AsyncSocketModeHandler(app, settings.slack_app_token)
+    run_listeners = handler.client.run_message_listeners
+    # Resolved when the envelope before the newest one has been handled
+    previous: list[asyncio.Future | None] = [None]
+
+    def run_in_order(message: dict, raw_message: str):
+        # slack_sdk calls this in arrival order as it creates each envelope's task, so the order is taken here
+        waiting_for = previous[0]
+        done = previous[0] = asyncio.get_running_loop().create_future()
+
+        async def run() -> None:
+            try:
+                if waiting_for is not None:
+                    await asyncio.shield(waiting_for)
+                await run_listeners(message, raw_message)
+            finally:
+                if not done.done():
+                    done.set_result(None)
+
+        return run()
+
+    handler.client.run_message_listeners = run_in_order
+    return handler
+
+
+async def start_app():
+    # Registering the listeners is deferred so the sync runtime never imports them
+    import shroud.slack.aio.handlers  # noqa: F401
+
+    if settings.metrics_port:
+        metrics.serve(settings.metrics_host, supervisor.metrics_port())
+    handler = socket_mode_handler()
+    try:
+        await handler.connect_async()
+        print(f"Connected to Slack as Socket Mode worker {settings.socket_worker_id}" if settings.socket_worker_id else "Connected to Slack")
+        # Set the backend up and index record timestamps now that events can arrive. Kept referenced so the task isn't garbage collected
+        backend_ready = asyncio.create_task(asyncio.to_thread(db.warm))  # noqa: F841
+        # Listed with a sync client on threads of their own, like clean-db
+        listing_client = slack_client.ScheduledWebClient(token=settings.slack_bot_token)
+        channels.directory.warm(listing_client)
+        allowlist.members.warm(listing_client)
+        # Finish forwarding reports a previous run was interrupted in the middle of
+        outbox.start(listing_client)
+        # Read the manifest for /help now rather than on the first call
+        await asyncio.to_thread(templates.help_text)
+        await asyncio.sleep(float("inf"))
+    except asyncio.CancelledError:
+        pass
+    finally:
+        print("Shutting down, finishing queued work...")
+        await handler.close_async()
+        await limiter.drain()
+        print(f"Deferred work drained: {limiter.stats()}")
+        # Edits still being held are relayed rather than lost
+        await asyncio.gather(*(asyncio.wrap_future(f) for f in debouncer.flush() if f is not None))
+        await asyncio.to_thread(outbox.close)
+        stats.store.close()
+        await asyncio.to_thread(db.close)
+        if events.store is not None:
+            events.store.close()
+        slack_client.print_stats()
+
+
+@app.error
+async def handle_errors(error, body, respond: AsyncRespond):
+    if isinstance(error, BoltUnhandledRequestError):
+        return BoltResponse(status=200, body="")
+    else:
+        print(f"Error: {error}")
+        try:
+            await respond(ERROR_MESSAGE)
+        except SlackApiError as e:
+            print(f"Error sending message: {e.response['error']}")
+        return BoltResponse(status=500, body="Something Wrong")
@@ -0,0 +1,44 @@
+import time
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+
+from shroud import settings
+from shroud.slack.client import (
+    observe_call,
+    request_channel,
+    retry_after_seconds,
+    scheduler,
+)
+from shroud.utils import metrics
+
+
+class AsyncScheduledWebClient(AsyncWebClient):
+    """
+    Async version of shroud.slack.client.ScheduledWebClient, sharing its scheduler. Kept apart so the sync runtime never imports aiohttp
+    """
+
+    async def api_call(self, api_method: str, **kwargs):
+        channel = request_channel(kwargs)
+        attempt = 0
+        while True:
+            metrics.slack_wait_seconds.inc(
+                await scheduler.acquire_async(api_method, channel), method=api_method
+            )
+            metrics.slack_in_flight.inc(method=api_method)
+            start = time.perf_counter()
+            try:
+                response = await super().api_call(api_method, **kwargs)
+            except Exception as e:
+                observe_call(api_method, start, e)
+                if not isinstance(e, SlackApiError):
+                    raise
+                retry_after = retry_after_seconds(e)
+                if retry_after is None or attempt >= settings.slack_max_retries:
+                    raise
+                attempt += 1
+                print(f"Rate limited on {api_method}, retrying in {retry_after}s")
+                scheduler.throttled(api_method, channel, retry_after)
+            else:
+                observe_call(api_method, start, None)
+                return response
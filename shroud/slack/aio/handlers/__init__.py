@@ -0,0 +1,9 @@
+# Async versions of shroud.slack.handlers, registered on the AsyncApp
+from shroud.slack.aio.handlers import (  # noqa: F401
+    channels,
+    commands,
+    dropdown,
+    incoming_message,
+    reactions,
+    users,
+)
@@ -0,0 +1,50 @@
+from slack_sdk.web.async_client import AsyncWebClient
+
+from shroud import settings
+from shroud.slack.aio import app, deferred
+from shroud.utils import allowlist, channels
+
+
+# https://api.slack.com/events/channel_created
+# Channel names are unique across the workspace, so a new channel's name is taken whether or not it's private
+@deferred(app.event("channel_created"))
+async def handle_channel_created(event):
+    channels.directory.add(event["channel"]["id"], event["channel"]["name"])
+
+
+# Private channels send group_* events instead of channel_* ones
+@deferred(app.event("channel_rename"))
+@deferred(app.event("group_rename"))
+async def handle_channel_rename(event):
+    channels.directory.add(event["channel"]["id"], event["channel"]["name"])
+
+
+@deferred(app.event("channel_archive"))
+@deferred(app.event("group_archive"))
+@deferred(app.event("channel_deleted"))
+@deferred(app.event("group_deleted"))
+@deferred(app.event("group_left"))
+async def handle_channel_gone(event):
+    channels.directory.remove(event["channel"])
+
+
+# Only the id comes with the event, and the name may have changed while it was archived
+@deferred(app.event("channel_unarchive"))
+@deferred(app.event("group_unarchive"))
+async def handle_channel_unarchive(event, client: AsyncWebClient):
+    channel = (await client.conversations_info(channel=event["channel"]))["channel"]
+    channels.directory.add(channel["id"], channel["name"])
+
+
+# https://api.slack.com/events/member_joined_channel
+# Keeps the allowlist current between full listings
+@deferred(app.event("member_joined_channel"))
+async def handle_member_joined(event):
+    if event["channel"] == settings.channel:
+        allowlist.members.add(event["user"])
+
+
+@deferred(app.event("member_left_channel"))
+async def handle_member_left(event):
+    if event["channel"] == settings.channel:
+        allowlist.members.remove(event["user"])
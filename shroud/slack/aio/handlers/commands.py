@@ -0,0 +1,156 @@
+import asyncio
+
+from slack_bolt.context.respond.async_respond import AsyncRespond
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+
+from shroud import settings
+from shroud.slack.aio import app, deferred
+from shroud.slack.client import ScheduledWebClient
+from shroud.slack.handlers.commands import (
+    NOT_ALLOWED_TEXT,
+    format_cleanup_summary,
+    parse_stats_weeks,
+    parse_user_mention,
+)
+from shroud.utils import aio, channels, db, stats, templates, utils
+
+
+async def check_allowlisted(respond: AsyncRespond, client: AsyncWebClient, user_id: str) -> bool:
+    try:
+        if await aio.is_allowlisted(user_id, client):
+            return True
+        await respond(NOT_ALLOWED_TEXT)
+    except SlackApiError as e:
+        await respond(f"Failed to verify channel membership: {e}")
+    return False
+
+
+@deferred(app.command(utils.apply_command_prefix("clean-db")))
+async def clean_db(respond: AsyncRespond, client: AsyncWebClient, command):
+    if not await check_allowlisted(respond, client, command["user_id"]):
+        return
+    print("Cleaning database")
+    dry_run = command.get("text", "").strip() == "dry-run"
+    await respond(
+        "Checking records for deleted messages (dry run)..." if dry_run else "Checking records for deleted messages..."
+    )
+    # The cleaner runs its own thread pool, so hand it a sync client and a respond that hops back onto the loop
+    loop = asyncio.get_running_loop()
+    summary = await asyncio.to_thread(
+        db.clean_database,
+        ScheduledWebClient(token=client.token),
+        respond=lambda text: asyncio.run_coroutine_threadsafe(respond(text), loop).result(),
+        dry_run=dry_run,
+    )
+    await respond(format_cleanup_summary(summary))
+    print(f"Cleaned database: {summary}")
+
+
+@deferred(app.command(utils.apply_command_prefix("create-dm")))
+async def create_dm(respond: AsyncRespond, client: AsyncWebClient, command):
+    allowlist_channel = settings.channel
+    user_id = command["user_id"]
+
+    # Check if user is in the allowlist channel
+    if not await check_allowlisted(respond, client, user_id):
+        return
+
+    target_user = parse_user_mention(command["text"])
+    if target_user is None:
+        await respond("Unable to extract user ID.")
+        return
+
+    # Create a ~~DM~~ private channel with the target user and the person who ran the command
+    invite_users = [user_id, target_user]
+    channel_name = f"{settings.app_name}-{target_user.lower()}"
+    try:
+        private_channel = (
+            await client.conversations_create(name=channel_name, is_private=True)
+        )["channel"]["id"]
+    except SlackApiError as e:
+        if e.response["error"] == "name_taken":
+            await respond("A DM with this name already exists.")
+        else:
+            await respond(f"Failed to create DM: {e}")
+        # Get the channel ID from channel_name. Only lists the channels if the name isn't in the index
+        private_channel = await asyncio.to_thread(
+            channels.directory.get, channel_name, ScheduledWebClient(token=client.token)
+        )
+        if private_channel is None:
+            await respond("Unable to find the private channel.")
+            return
+    else:
+        channels.directory.add(private_channel, channel_name)
+        await respond(f"Created a prviate channel <#{private_channel}>")
+    try:
+        await client.conversations_invite(
+            channel=private_channel, users=",".join(invite_users)
+        )
+    except SlackApiError as e:
+        if e.response["error"] == "already_in_channel":
+            await respond("You are already in this DM.")
+        else:
+            await respond(f"Failed to invite users to the DM: {e}")
+        # Send a message to the allowlist channel with a button to join the DM
+        await client.chat_postMessage(
+            channel=allowlist_channel,
+            text=templates.join_channel_text(private_channel, target_user),
+            blocks=templates.join_channel_blocks(private_channel, target_user),
+        )
+
+
+@deferred(app.action("join_private_channel"))
+async def join_dm(body, client: AsyncWebClient):
+    user_id = body["user"]["id"]
+    private_channel = body["actions"][0]["value"]
+
+    # The button is only posted in the allowlist channel, but the action could come from anyone
+    if not await aio.is_allowlisted(user_id, client):
+        await client.chat_postEphemeral(
+            channel=body["channel"]["id"],
+            user=user_id,
+            text=NOT_ALLOWED_TEXT,
+        )
+        return
+
+    try:
+        # Invite the user to the DM channel
+        await client.conversations_invite(channel=private_channel, users=user_id)
+        await client.chat_postEphemeral(
+            channel=private_channel,
+            user=user_id,
+            text="You have been added to the channel.",
+        )
+    except SlackApiError as e:
+        if e.response["error"] == "already_in_channel":
+            await client.chat_postEphemeral(
+                channel=private_channel,
+                user=user_id,
+                text="You are already in this DM.",
+            )
+        else:
+            # Send an error message to the user
+            await client.chat_postEphemeral(
+                channel=body["channel"]["id"],
+                user=user_id,
+                text=f"Failed to join channel: {e}",
+            )
+
+
+@deferred(app.command(utils.apply_command_prefix("stats")))
+async def stats_command(respond: AsyncRespond, client: AsyncWebClient, command):
+    if not await check_allowlisted(respond, client, command["user_id"]):
+        return
+    weeks = parse_stats_weeks(command.get("text", ""))
+    if weeks is None:
+        await respond(f"Usage: `/{settings.app_name}-stats [weeks]`, with weeks from 1 to 52.")
+        return
+    summary = await asyncio.to_thread(stats.store.summary, weeks)
+    await respond(stats.format_summary(summary))
+
+
+@deferred(app.command(utils.apply_command_prefix("help")))
+async def help_command(respond: AsyncRespond):
+    # Reading and parsing the manifest is blocking file I/O, though it's usually done by now
+    await respond(await asyncio.to_thread(templates.help_text))
@@ -0,0 +1,40 @@
+import asyncio
+
+from slack_bolt.context.say.async_say import AsyncSay
+from slack_sdk.web.async_client import AsyncWebClient
+
+from shroud.slack import forwarding
+from shroud.slack.aio import app, ordered
+from shroud.slack.client import ScheduledWebClient
+from shroud.slack.handlers.dropdown import prompt_relay_key
+from shroud.utils import aio
+
+
+# Listener for the dropdown selection
+@ordered(app.action("report_forwarding"), key=prompt_relay_key)
+async def handle_selection(body):
+    selected_option = body["actions"][0]["selected_option"]["value"]
+    await aio.save_selection(
+        selection_ts=body["message"]["ts"], selection=selected_option
+    )
+
+
+# Listener for the submit button
+@ordered(app.action("submit_forwarding"), key=prompt_relay_key)
+async def handle_submission(body, say: AsyncSay, client: AsyncWebClient):
+    user_id = body["user"]["id"]
+
+    # Get the user's selection
+    message_record = await aio.get_record_by_ts(body["message"]["ts"])
+    user_selection = message_record.get("fields", {}).get("selection", None)
+    if user_selection is None:
+        await say("Please select an option before submitting.")
+        return
+
+    report = await aio.get_report_content(message_record, client)
+    # Outbox steps run on threads with a sync client, like the listings
+    job = forwarding.submit(
+        message_record, user_id, user_selection, report, ScheduledWebClient(token=client.token)
+    )
+    # See shroud.slack.handlers.dropdown.handle_submission
+    await asyncio.to_thread(job.wait, "finish_forward")
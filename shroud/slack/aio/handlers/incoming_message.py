@@ -0,0 +1,165 @@
+import asyncio
+
+from slack_sdk.web.async_client import AsyncWebClient
+
+from shroud import settings
+from shroud.slack.aio import app, ordered
+from shroud.slack.client import ScheduledWebClient
+from shroud.slack.handlers.incoming_message import (
+    FILE_UPLOADS_UNSUPPORTED,
+    NOT_PREFIXED,
+    MessageEvent,
+    edited_text,
+    hold_edit,
+    is_relevant,
+    is_report_edit,
+    parse_message_event,
+    relay_files,
+    relay_key,
+)
+from shroud.utils import aio, files, reports, stats, utils
+from shroud.utils.edits import debouncer
+
+
+async def record_first_reply(record: dict, reply_ts: str) -> None:
+    try:
+        formatted_time = utils.elapsed_since(record["fields"].get("forwarded_ts"), reply_ts)
+        await asyncio.gather(
+            aio.update_record(record["id"], {"reply_time": formatted_time}),
+            asyncio.to_thread(stats.store.replied, record["fields"].get("forwarded_ts"), reply_ts),
+        )
+    except Exception as e:  # noqa: BLE001
+        print(f"Failed to record first reply time diff: {e}")
+
+
+def from_timer(relay):
+    """
+    A debouncer `send` that runs `relay(original, new)` on this event loop, since the debouncer's timers run on threads
+    """
+    loop = asyncio.get_running_loop()
+
+    async def run(original: str, new: str) -> None:
+        try:
+            await relay(edited_text(original, new))
+        except Exception as e:  # noqa: BLE001
+            # Nothing awaits the future run_coroutine_threadsafe returns
+            print(f"Failed to relay an edit: {e}")
+
+    return lambda original, new: asyncio.run_coroutine_threadsafe(run(original, new), loop)
+
+
+# AsyncApp only takes coroutine matchers
+async def relevant(event) -> bool:
+    return is_relevant(event)
+
+
+# https://api.slack.com/events/message.im
+@ordered(app.event("message", matchers=[relevant]), key=relay_key)
+async def handle_message(event, client: AsyncWebClient):
+    message = parse_message_event(event)
+    if message is None:
+        return
+    record = await aio.get_record_by_ts(message.thread_ts or message.ts)
+
+    if message.subtype == MessageEvent.Subtypes.file_share and not (record and files.enabled()):
+        if record and message.is_dm:
+            await client.chat_postMessage(
+                channel=message.channel,
+                thread_ts=message.thread_ts or message.ts,
+                text=FILE_UPLOADS_UNSUPPORTED,
+            )
+        return
+
+    if message.subtype == MessageEvent.Subtypes.message_deleted:
+        # An edit still waiting to be relayed shouldn't be, since the message is gone
+        debouncer.cancel(message.channel, message.ts)
+
+    if is_report_edit(message, record):
+        # Keep the report's content current so submission forwards the edited version
+        reports.store.put(
+            message.channel, message.ts, message.content_post_update, message.attachments
+        )
+        await aio.update_record(record["id"], {"content": message.content_post_update})
+        if not record["fields"].get("forwarded_ts"):
+            # Not submitted yet, so there's nothing to relay the edit to
+            return
+
+    if message.return_to_sender and (message.is_dm or record is not None):
+        await client.chat_postEphemeral(
+            channel=message.channel,
+            user=message.user,
+            text=message.content,
+        )
+    elif (
+        record is None
+        and message.is_dm
+        and message.subtype == MessageEvent.Subtypes.normal
+    ):
+        await aio.begin_forward(message, client)
+    elif record is not None and message.is_dm:
+        async def relay(text: str) -> None:
+            await client.chat_postMessage(
+                channel=settings.channel,
+                text=text,
+                attachments=message.attachments,
+                thread_ts=record["fields"]["forwarded_ts"],
+            )
+
+        # Files can be shared without any text
+        if not hold_edit(message, from_timer(relay)) and message.content:
+            await relay(message.content)
+        if message.files:
+            await asyncio.to_thread(
+                relay_files,
+                message,
+                settings.channel,
+                record["fields"]["forwarded_ts"],
+                ScheduledWebClient(token=client.token),
+            )
+    elif record is not None and message.is_dm is False:
+        if message.content.startswith("!"):
+            await client.chat_postEphemeral(
+                channel=record["fields"]["dm_channel"],
+                thread_ts=record["fields"]["dm_ts"],
+                user=message.user,
+                text=NOT_PREFIXED,
+            )
+            return
+        prefix_info = message.get_prefix_info
+        if prefix_info.should_forward:
+            async def relay(text: str) -> None:
+                profile = await aio.get_profile(message.user, client)
+                await client.chat_postMessage(
+                    channel=record["fields"]["dm_channel"],
+                    thread_ts=record["fields"]["dm_ts"],
+                    text=text,
+                    username=profile.name,
+                    icon_url=profile.image_url,
+                )
+
+            work = []
+            # A file shared with nothing but `?` has no text to relay
+            if not hold_edit(message, from_timer(relay)) and prefix_info.content_without_prefix:
+                work.append(relay(prefix_info.content_without_prefix))
+            if not record["fields"].get("reply_time"):
+                # This is the first reply to the forwarded message
+                work.append(record_first_reply(record, message.ts))
+            await asyncio.gather(*work)
+            # After the text, so the files follow it in the thread
+            if message.files:
+                await asyncio.to_thread(
+                    relay_files,
+                    message,
+                    record["fields"]["dm_channel"],
+                    record["fields"]["dm_ts"],
+                    ScheduledWebClient(token=client.token),
+                )
+        else:
+            if message.subtype == MessageEvent.Subtypes.message_changed:
+                # Edited so it's no longer meant for the reporter
+                debouncer.cancel(message.channel, message.ts)
+            print("INFO: received a message not prefixed with `!` or `?`; ignoring it.")
+    else:
+        print(
+            "INFO: received an event that is not a DM and has no record; ignoring it."
+        )
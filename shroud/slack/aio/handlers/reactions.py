@@ -0,0 +1,106 @@
+import asyncio
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+
+from shroud.slack.aio import app, ordered
+from shroud.slack.handlers.reactions import hourglass_error, reaction_relay_key
+from shroud.utils import aio, stats, utils
+from shroud.utils.reaction_state import RESOLVING_REACTIONS, MessageReactions, tracker
+
+
+async def reaction_state(client: AsyncWebClient, channel: str, ts: str) -> MessageReactions:
+    # Messages forwarded before a restart, or evicted since, are read back once and then tracked from events
+    state = tracker.get(channel, ts)
+    if state is None:
+        resp = await client.reactions_get(channel=channel, timestamp=ts, full=True)
+        state = tracker.seed_from_message(channel, ts, resp["message"])
+    return state
+
+
+async def remove_hourglass(client: AsyncWebClient, channel: str, ts: str, state: MessageReactions) -> None:
+    try:
+        await client.reactions_remove(channel=channel, name="hourglass", timestamp=ts)
+    except Exception as e:  # noqa: BLE001
+        if hourglass_error(e) != "no_reaction":
+            print(f"Failed to remove :hourglass: reaction: {e}")
+            tracker.set_hourglass(state, True)
+
+
+async def set_resolve_time(record: dict) -> None:
+    # Set resolve_time in db to the time difference between forward and now
+    try:
+        forwarded_time = record["fields"].get("forwarded_ts")
+        if forwarded_time:
+            await asyncio.gather(
+                aio.update_record(
+                    record["id"], {"resolve_time": utils.elapsed_since(forwarded_time)}
+                ),
+                asyncio.to_thread(stats.store.resolved, forwarded_time),
+            )
+    except Exception as e:  # noqa: BLE001
+        print(f"Failed to set resolve_time: {e}")
+
+
+# Listen for reaction_added events to remove :hourglass: if :white_check_mark: or :x: is added
+@ordered(app.event("reaction_added"), key=reaction_relay_key)
+async def handle_reaction_added(event, client: AsyncWebClient):
+    reaction = event.get("reaction")
+    item = event.get("item", {})
+    channel = item.get("channel")
+    ts = item.get("ts")
+    # Only act on :white_check_mark: or :x:
+    if reaction not in RESOLVING_REACTIONS:
+        return
+    # Only care if the message thread is in the database
+    record = await aio.get_record_by_ts(ts)
+    if not record:
+        return
+    try:
+        state = await reaction_state(client, channel, ts)
+    except SlackApiError as e:
+        print(f"Failed to get reactions: {e}")
+        return
+    # Already resolved by someone else, so :hourglass: is gone and resolve_time is set
+    if not tracker.resolve(state, event.get("user"), reaction):
+        return
+    await asyncio.gather(remove_hourglass(client, channel, ts, state), set_resolve_time(record))
+
+
+# Listen for reaction_removed events to re-add :hourglass: if :white_check_mark: or :x: is removed and neither is present
+@ordered(app.event("reaction_removed"), key=reaction_relay_key)
+async def handle_reaction_removed(event, client: AsyncWebClient):
+    reaction = event.get("reaction")
+    item = event.get("item", {})
+    channel = item.get("channel")
+    ts = item.get("ts")
+    # Only act if :white_check_mark: or :x: is removed
+    if reaction not in RESOLVING_REACTIONS:
+        return
+    # Only care if the message thread is in the database
+    record = await aio.get_record_by_ts(ts)
+    if not record:
+        return
+    try:
+        state = await reaction_state(client, channel, ts)
+    except SlackApiError as e:
+        print(f"Failed to get reactions: {e}")
+        return
+    # Other :white_check_mark: or :x: reactions are still there
+    if not tracker.unresolve(state, event.get("user"), reaction):
+        return
+    try:
+        await client.reactions_add(channel=channel, name="hourglass", timestamp=ts)
+    except Exception as e:  # noqa: BLE001
+        # Anything but already_reacted rolls the tracked state back
+        if hourglass_error(e) != "already_reacted":
+            print(f"Failed to re-add :hourglass: reaction: {e}")
+            tracker.set_hourglass(state, False)
+            return
+    # Set resolve_time in db to blank string
+    try:
+        await aio.update_record(record["id"], {"resolve_time": ""})
+        if record["fields"].get("forwarded_ts"):
+            await asyncio.to_thread(stats.store.reopened, record["fields"]["forwarded_ts"])
+    except Exception as e:  # noqa: BLE001
+        print(f"Failed to reset resolve_time: {e}")
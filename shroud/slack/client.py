@@ -0,0 +1,82 @@
+import time
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+from shroud import settings
+from shroud.utils import metrics
+from shroud.utils.ratelimit import SlackScheduler
+
+# Shared by every client in the process, including the async one in shroud.slack.aio.client. Each Socket Mode worker
+# has its own, so they split the limits between them
+scheduler = SlackScheduler(background_reserve=settings.slack_background_reserve, workers=settings.socket_workers)
+
+
+def request_channel(kwargs: dict) -> str | None:
+    for key in ("json", "data", "params"):
+        args = kwargs.get(key)
+        if isinstance(args, dict) and args.get("channel"):
+            return args["channel"]
+    return None
+
+
+def _error_code(e: Exception) -> str:
+    if isinstance(e, SlackApiError) and e.response is not None:
+        return e.response.get("error") or str(e.response.status_code)
+    return type(e).__name__
+
+
+def observe_call(api_method: str, start: float, error: Exception | None) -> None:
+    metrics.slack_seconds.observe(time.perf_counter() - start, method=api_method)
+    metrics.slack_in_flight.dec(method=api_method)
+    if error is not None:
+        metrics.slack_errors.inc(method=api_method, error=_error_code(error))
+
+
+def retry_after_seconds(e: SlackApiError) -> float | None:
+    """
+    Seconds to wait before retrying, or None if the error isn't a rate limit
+    """
+    if e.response is None or e.response.status_code != 429:
+        return None
+    for name, value in e.response.headers.items():
+        if name.lower() == "retry-after":
+            return float(value[0] if isinstance(value, list) else value)
+    return 1.0
+
+
+class ScheduledWebClient(WebClient):
+    """
+    WebClient that takes a token from the scheduler before every call and retries after Slack's Retry-After on a 429
+    """
+
+    def api_call(self, api_method: str, **kwargs):
+        channel = request_channel(kwargs)
+        attempt = 0
+        while True:
+            metrics.slack_wait_seconds.inc(
+                scheduler.acquire(api_method, channel), method=api_method
+            )
+            metrics.slack_in_flight.inc(method=api_method)
+            start = time.perf_counter()
+            try:
+                response = super().api_call(api_method, **kwargs)
+            except Exception as e:
+                observe_call(api_method, start, e)
+                if not isinstance(e, SlackApiError):
+                    raise
+                retry_after = retry_after_seconds(e)
+                if retry_after is None or attempt >= settings.slack_max_retries:
+                    raise
+                attempt += 1
+                print(f"Rate limited on {api_method}, retrying in {retry_after}s")
+                scheduler.throttled(api_method, channel, retry_after)
+            else:
+                observe_call(api_method, start, None)
+                return response
+
+
+def print_stats() -> None:
+    for method, stats in sorted(scheduler.stats().items()):
+        if stats.delayed or stats.throttled or stats.near_limit:
+            print(f"Slack {method}: {stats}")
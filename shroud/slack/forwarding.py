@@ -0,0 +1,129 @@
+"""
+Forwarding a submitted report, as an outbox job. Posting the report comes first, then adding :hourglass:, saving
+forwarded_ts and telling the reporter all go at once, with the prompt updated alongside. A job interrupted by a crash
+is finished on the next start
+"""
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+from shroud import settings
+from shroud.utils import db, reports, stats, templates, utils
+from shroud.utils.outbox import Job, outbox
+from shroud.utils.reaction_state import tracker
+
+KIND = "forward_report"
+# Message metadata type carrying the job id on forwarded reports, so a replay can find a post it already made
+METADATA_EVENT_TYPE = "shroud_report_forwarded"
+
+
+def submit(record: dict, user_id: str, selection: str, report: reports.ReportContent, client: WebClient) -> Job:
+    fields = record["fields"]
+    return outbox.submit(
+        KIND,
+        {
+            "user_id": user_id,
+            "selection": selection,
+            "dm_channel": fields["dm_channel"],
+            "dm_ts": fields["dm_ts"],
+            "selection_ts": fields["selection_ts"],
+            "text": report.text,
+            "attachments": report.attachments,
+        },
+        client,
+    )
+
+
+def update_prompt(job: Job, replay: bool) -> None:
+    # Update the original message to prevent reuse
+    job.client.chat_update(
+        channel=job.payload["dm_channel"],
+        ts=job.payload["selection_ts"],
+        blocks=templates.submitted_blocks(job.payload["selection"]),
+        text="Report submitted",
+    )
+
+
+def find_posted(job: Job) -> str | None:
+    """
+    The forwarded report an earlier attempt at this job posted, if it got that far
+    """
+    cursor = None
+    while True:
+        resp = job.client.conversations_history(
+            channel=settings.channel,
+            # Slack's clock and ours may disagree a little
+            oldest=f"{job.created_at - 60:.6f}",
+            include_all_metadata=True,
+            limit=200,
+            cursor=cursor,
+        )
+        for message in resp["messages"]:
+            metadata = message.get("metadata") or {}
+            if (
+                metadata.get("event_type") == METADATA_EVENT_TYPE
+                and metadata.get("event_payload", {}).get("job_id") == job.id
+            ):
+                return message["ts"]
+        cursor = resp.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            return None
+
+
+def post_report(job: Job, replay: bool) -> dict:
+    payload = job.payload
+    forwarded_ts = find_posted(job) if replay else None
+    if forwarded_ts is None:
+        profile = (
+            utils.get_profile(payload["user_id"], job.client)
+            if payload["selection"] == "with_username"
+            else None
+        )
+        forwarded_ts = job.client.chat_postMessage(
+            channel=settings.channel,
+            text=payload["text"],
+            attachments=payload["attachments"],
+            username=profile.name if profile else None,
+            icon_url=profile.image_url if profile else None,
+            metadata={"event_type": METADATA_EVENT_TYPE, "event_payload": {"job_id": job.id}},
+        ).data["ts"]
+    # Edits from here on are relayed rather than folded into the report
+    reports.store.discard(payload["dm_channel"], payload["dm_ts"])
+    # Seeded before :hourglass: is added, since nobody can resolve the message before they've seen it
+    tracker.seed(settings.channel, forwarded_ts, hourglass=True)
+    return {"forwarded_ts": forwarded_ts}
+
+
+def add_hourglass(job: Job, replay: bool) -> None:
+    try:
+        job.client.reactions_add(
+            channel=settings.channel, name="hourglass", timestamp=job.results["forwarded_ts"]
+        )
+    except SlackApiError as e:
+        if e.response.get("error") != "already_reacted":
+            raise
+
+
+def finish_forward(job: Job, replay: bool) -> None:
+    db.finish_forward(dm_ts=job.payload["dm_ts"], forwarded_ts=job.results["forwarded_ts"])
+    stats.store.forwarded(job.results["forwarded_ts"])
+
+
+def notify_reporter(job: Job, replay: bool) -> None:
+    job.client.chat_postEphemeral(
+        channel=job.payload["dm_channel"],
+        user=job.payload["user_id"],
+        text=templates.FORWARDED_EPHEMERAL_TEXT,
+    )
+
+
+outbox.register(
+    KIND,
+    {
+        "update_prompt": ((), update_prompt),
+        "post_report": ((), post_report),
+        "add_hourglass": (("post_report",), add_hourglass),
+        "finish_forward": (("post_report",), finish_forward),
+        "notify_reporter": (("post_report",), notify_reporter),
+    },
+)
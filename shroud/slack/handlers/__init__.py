@@ -0,0 +1,19 @@
+import importlib
+
+# Every module that registers listeners on the App. Listed explicitly so startup doesn't have to scan the directory
+HANDLER_MODULES = (
+    "channels",
+    "commands",
+    "dropdown",
+    "incoming_message",
+    "reactions",
+    "users",
+)
+
+
+def register() -> None:
+    """
+    Import the handler modules, which registers their listeners
+    """
+    for name in HANDLER_MODULES:
+        importlib.import_module(f"{__name__}.{name}")
@@ -1,42 +1,73 @@
-import yaml
-import importlib.resources
+from slack_sdk.errors import SlackApiError
 from slack_sdk.web.client import WebClient
 from slack_bolt.context.respond import Respond
-from shroud.slack import app
-from shroud.utils import db, utils
+from shroud.slack import app, deferred
+from shroud.utils import allowlist, channels, db, stats, templates, utils
 from shroud import settings
 
-@app.command(utils.apply_command_prefix("clean-db"))
-def clean_db(ack, respond: Respond, client: WebClient):
+NOT_ALLOWED_TEXT = "You must be a member of the allowlist channel to use this command."
+
+
+def check_allowlisted(respond: Respond, client: WebClient, user_id: str) -> bool:
+    """
+    Gate for privileged commands. Tells the user why if they aren't allowed
+    """
+    try:
+        if allowlist.members.is_member(user_id, client):
+            return True
+        respond(NOT_ALLOWED_TEXT)
+    except SlackApiError as e:
+        respond(f"Failed to verify channel membership: {e}")
+    return False
+
+
+@deferred(app.command(utils.apply_command_prefix("clean-db")))
+def clean_db(respond: Respond, client: WebClient, command):
+    if not check_allowlisted(respond, client, command["user_id"]):
+        return
     print("Cleaning database")
-    ack()
-    db.clean_database(client)
+    dry_run = command.get("text", "").strip() == "dry-run"
     respond(
-        "Removed any records where the DM or the forwarded message no longer exists."
+        "Checking records for deleted messages (dry run)..." if dry_run else "Checking records for deleted messages..."
     )
-    print("Cleaned database")
+    summary = db.clean_database(client, respond=respond, dry_run=dry_run)
+    respond(format_cleanup_summary(summary))
+    print(f"Cleaned database: {summary}")
+
+def parse_user_mention(text: str) -> str | None:
+    """
+    Extract the user ID from the format <@U1234|user>
+    """
+    text = text.strip()
+    if text.startswith("<@") and "|" in text:
+        return text[2:].split("|")[0]
+    return None
+
 
-@app.command(utils.apply_command_prefix("create-dm"))
-def create_dm(ack, respond: Respond, client: WebClient, command):
-    ack()
+def format_cleanup_summary(summary: db.CleanupSummary) -> str:
+    return (
+        f"Scanned {summary.scanned} records. "
+        + (
+            f"{summary.deleted} would be removed"
+            if summary.dry_run
+            else f"Removed {summary.deleted} where the DM or the forwarded message no longer exists"
+        )
+        + f". {summary.errored} could not be checked."
+    )
+
+
+@deferred(app.command(utils.apply_command_prefix("create-dm")))
+def create_dm(respond: Respond, client: WebClient, command):
     allowlist_channel = settings.channel
     user_id = command["user_id"]
     target_user = command["text"].strip()
 
     # Check if user is in the allowlist channel
-    try:
-        members = client.conversations_members(channel=allowlist_channel)["members"]
-        if user_id not in members:
-            respond("You must be a member of the allowlist channel to use this command.")
-            return
-    except Exception as e:
-        respond(f"Failed to verify channel membership: {e}")
+    if not check_allowlisted(respond, client, user_id):
         return
 
-    # Extract the user ID from the format <@U1234|user>
-    if target_user.startswith("<@") and "|" in target_user:
-        target_user = target_user[2:].split("|")[0]
-    else:
+    target_user = parse_user_mention(target_user)
+    if target_user is None:
         respond("Unable to extract user ID.")
         return
 
@@ -55,19 +86,13 @@ def create_dm(ack, respond: Respond, client: WebClient, command):
         else:
             respond(f"Failed to create DM: {e}")
         # Get the channel ID from channel_name
-        private_channel = client.conversations_list(types="private_channel")["channels"]
-        # next function retrieves the first matching channel from the generator.
-        # If no match is found, it returns None.
-        private_channel = next(
-            (channel for channel in private_channel if channel["name"] == channel_name),
-            None,
-        )
+        private_channel = channels.directory.get(channel_name, client)
         if private_channel is None:
             respond("Unable to find the private channel.")
             return
-        private_channel = private_channel["id"]
         existed = True
     else:
+        channels.directory.add(private_channel, channel_name)
         respond(f"Created a prviate channel <#{private_channel}>")
     try:
         client.conversations_invite(
@@ -81,38 +106,24 @@ def create_dm(ack, respond: Respond, client: WebClient, command):
         # Send a message to the allowlist channel with a button to join the DM
         client.chat_postMessage(
             channel=allowlist_channel,
-            text=f"A private channel has been created: <#{private_channel}> with <@{target_user}>. Click the button below to join.",
-            blocks=[
-                {
-                    "type": "section",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": f"A private channel has been created: <#{private_channel}> with <@{target_user}>. Click the button below to join.",
-                    },
-                },
-                {
-                    "type": "actions",
-                    "elements": [
-                        {
-                            "type": "button",
-                            "text": {
-                                "type": "plain_text",
-                                "text": "Join private channel",
-                            },
-                            "action_id": "join_private_channel",
-                            "value": private_channel,
-                        }
-                    ],
-                },
-            ],
+            text=templates.join_channel_text(private_channel, target_user),
+            blocks=templates.join_channel_blocks(private_channel, target_user),
         )
 
-@app.action("join_private_channel")
-def join_dm(ack, body, client: WebClient):
-    ack()
+@deferred(app.action("join_private_channel"))
+def join_dm(body, client: WebClient):
     user_id = body["user"]["id"]
     private_channel = body["actions"][0]["value"]
 
+    # The button is only posted in the allowlist channel, but the action could come from anyone
+    if not allowlist.members.is_member(user_id, client):
+        client.chat_postEphemeral(
+            channel=body["channel"]["id"],
+            user=user_id,
+            text=NOT_ALLOWED_TEXT,
+        )
+        return
+
     try:
         # Invite the user to the DM channel
         client.conversations_invite(channel=private_channel, users=user_id)
@@ -136,46 +147,29 @@ def join_dm(ack, body, client: WebClient):
                 text=f"Failed to join channel: {e}",
             )
 
-@app.command(utils.apply_command_prefix("help"))
-def help_command(ack, respond: Respond):
-    ack()
-    # The package looks like shroud.slack and we only want shroud/manifest.yml
-    manifest_path = importlib.resources.files(__package__.split(".")[0]).parent / "manifest.yml"
-    with open(manifest_path, "r") as f:
-        features = yaml.safe_load(f)["features"]
-
-    help_text = "Commands:" if not settings.leading_help_text else settings.leading_help_text + "\nCommands:"
-    slash_commands = features.get("slash_commands", [])
-    for command in slash_commands:
-        try:
-            help_text += f"\n`{command['command']} {command['usage_hint']}`: {command['description']}"
-        except KeyError:
-            # Most likely means that usage_hint is not defined
-            help_text += f"\n`{command['command']}`: {command['description']}"
-    if len(slash_commands) == 0:
-        help_text += "\nNo commands available.\n"
-    else:
-        help_text += "\n"
-
-    shortcuts = features.get("shortcuts", [])
-    help_text += "\nShortcuts:"
-    message_shortcuts_text = "Message shortcuts:"
-    global_shortcuts_text = "Global shortcuts:"
-    for shortcut in shortcuts:
-        if shortcut["type"] == "message":
-            message_shortcuts_text += (
-                f"\n`{shortcut["name"]}`: {shortcut['description']}"
-            )
-        elif shortcut["type"] == "global":
-            global_shortcuts_text += (
-                f"\n`{shortcut["name"]}`: {shortcut['description']}"
-            )
-    if len(shortcuts) == 0:
-        help_text += "\nNo shortcuts available."
-    else:
-        if message_shortcuts_text != "Message shortcuts:":
-            help_text += f"\n{message_shortcuts_text}"
-        if global_shortcuts_text != "Global shortcuts:":
-            help_text += f"\n{global_shortcuts_text}"
+def parse_stats_weeks(text: str) -> int | None:
+    """
+    Weeks of trends /shroud-stats shows, 8 unless the text asks for 1 to 52
+    """
+    text = text.strip()
+    if not text:
+        return 8
+    if text.isdigit() and 1 <= int(text) <= 52:
+        return int(text)
+    return None
+
+
+@deferred(app.command(utils.apply_command_prefix("stats")))
+def stats_command(respond: Respond, client: WebClient, command):
+    if not check_allowlisted(respond, client, command["user_id"]):
+        return
+    weeks = parse_stats_weeks(command.get("text", ""))
+    if weeks is None:
+        respond(f"Usage: `/{settings.app_name}-stats [weeks]`, with weeks from 1 to 52.")
+        return
+    respond(stats.format_summary(stats.store.summary(weeks)))
+
 
-    respond(help_text)
\ No newline at end of file
+@deferred(app.command(utils.apply_command_prefix("help")))
+def help_command(respond: Respond):
+    respond(templates.help_text())
@@ -1,13 +1,15 @@
+import re
+from concurrent.futures import Future
 from enum import Enum
 from slack_bolt.context.say import Say
 from slack_sdk import WebClient
 from shroud import settings
-from shroud.slack import app
-from shroud.utils import db, utils
+from shroud.slack import app, ordered
+from shroud.utils import db, files, reports, stats, utils
+from shroud.utils.edits import debouncer
 from slack_bolt.context.respond import Respond
-from pydantic import BaseModel, StringConstraints, computed_field
-from typing import Annotated, Any
-import datetime
+from collections.abc import Callable
+from typing import Any, NamedTuple
 
 
 
@@ -17,17 +19,40 @@ class ValidationRegexs(Enum):
     user = r"^U[A-Z0-9]{8,}$"
 
 
-class MessageEvent(BaseModel):
-    channel: Annotated[str, StringConstraints(pattern=ValidationRegexs.channel.value)]
-    thread_ts: (
-        Annotated[str, StringConstraints(pattern=ValidationRegexs.ts.value)] | None
-    ) = None
-    ts: Annotated[str, StringConstraints(pattern=ValidationRegexs.ts.value)]
-    user: Annotated[str, StringConstraints(pattern=ValidationRegexs.user.value)]
-    content: str = None
-    content_post_update: str = None
-    # Probably only needs to be for message_changed
-    attachments: list[Any] = []
+# Compiled once. fullmatch, so a trailing newline doesn't slip past `$`
+_PATTERNS = {regex.name: re.compile(regex.value) for regex in ValidationRegexs}
+# Stands in for a record that hasn't been looked up yet, since None means there isn't one
+_UNRESOLVED = object()
+
+
+def _validated(field: str, value: Any, pattern: str, optional: bool = False) -> str | None:
+    if value is None and optional:
+        return None
+    if not isinstance(value, str) or _PATTERNS[pattern].fullmatch(value) is None:
+        raise ValueError(f"Invalid {field} in message event: {value!r}")
+    return value
+
+
+class MessageEvent:
+    """
+    The parts of a message event the handler uses. A plain class rather than a pydantic model, which cost more to build
+    than everything else in parsing an event, but the fields are checked the same way
+    """
+
+    __slots__ = (
+        "_record",
+        "attachments",
+        "channel",
+        "content",
+        "content_post_update",
+        "content_pre_update",
+        "files",
+        "return_to_sender",
+        "subtype",
+        "thread_ts",
+        "ts",
+        "user",
+    )
 
     class Subtypes(str, Enum):
         message_changed = "message_changed"
@@ -45,43 +70,64 @@ class MessageEvent(BaseModel):
                 # print("INFO: Received an event with subtype {value} that is not handled; ignoring it.")
                 return cls.other
 
-    subtype: Subtypes
+    class PrefixInfo(NamedTuple):
+        should_forward: bool
+        content_without_prefix: str
+
+    def __init__(
+        self,
+        channel: str,
+        ts: str,
+        user: str,
+        subtype: "MessageEvent.Subtypes",
+        thread_ts: str | None = None,
+        content: str | None = None,
+        content_pre_update: str | None = None,
+        content_post_update: str | None = None,
+        # Probably only needs to be for message_changed
+        attachments: list[Any] | None = None,
+        files: list[dict] | None = None,
+        # Don't return_to_sender if outside a DM or confirmed relay
+        return_to_sender: bool = False,
+    ):
+        self.channel = _validated("channel", channel, "channel")
+        self.thread_ts = _validated("thread_ts", thread_ts, "ts", optional=True)
+        self.ts = _validated("ts", ts, "ts")
+        self.user = _validated("user", user, "user")
+        for field, value in (
+            ("content", content),
+            ("content_pre_update", content_pre_update),
+            ("content_post_update", content_post_update),
+        ):
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f"Invalid {field} in message event: {value!r}")
+        if attachments is not None and not isinstance(attachments, list):
+            raise ValueError(f"Invalid attachments in message event: {attachments!r}")
+        if files is not None and not isinstance(files, list):
+            raise ValueError(f"Invalid files in message event: {files!r}")
+        self.content = content
+        self.content_pre_update = content_pre_update
+        self.content_post_update = content_post_update
+        self.attachments = attachments if attachments is not None else []
+        self.files = files if files is not None else []
+        self.subtype = subtype if isinstance(subtype, MessageEvent.Subtypes) else MessageEvent.Subtypes(subtype)
+        self.return_to_sender = bool(return_to_sender)
+        self._record = _UNRESOLVED
 
-    @computed_field
+    def __repr__(self) -> str:
+        return f"MessageEvent(subtype={self.subtype.value}, channel={self.channel}, ts={self.ts}, thread_ts={self.thread_ts})"
+
+    # Looked up the first time it's needed, then kept so the handler's if/elif chain only looks the record up once per event
     @property
-    def record(self) -> dict:
-        fetched_result = db.get_message_by_ts(self.thread_ts or self.ts)
-        return None if fetched_result is None else fetched_result
-
-    class Target(BaseModel):
-        channel: Annotated[
-            str, StringConstraints(pattern=ValidationRegexs.channel.value)
-        ]
-        thread_ts: (
-            Annotated[str, StringConstraints(pattern=ValidationRegexs.ts.value)] | None
-        ) = None
-
-    # class ForceReturn(Exception):
-    #     """
-    #     Error to be raised when the message event handling should be stopped as the event doesn't need to be handled
-    #     """
-    #     pass
-
-    # Don't return_to_sender if outside a DM or confirmed relay
-    return_to_sender: bool = False
-
-    # def is_im(self, client: WebClient) -> bool:
-    # return client.conversations_info(channel=self.channel).data["channel"]["is_im"]
-    @computed_field
+    def record(self) -> dict | None:
+        if self._record is _UNRESOLVED:
+            self._record = db.get_message_by_ts(self.thread_ts or self.ts)
+        return self._record
+
     @property
     def is_dm(self) -> bool:
         return self.channel.startswith("D")
 
-    class PrefixInfo(BaseModel):
-        should_forward: bool
-        content_without_prefix: str
-
-    @computed_field
     @property
     def get_prefix_info(self) -> PrefixInfo:
         content = self.content_post_update or self.content
@@ -94,26 +140,58 @@ class MessageEvent(BaseModel):
             )
         return self.PrefixInfo(should_forward=False, content_without_prefix=content)
 
-    # https://docs.pydantic.dev/2.3/usage/computed_fields/
-    # @<function_name>.setter can also be used with a @computed_field with the same function name
 
+FILE_UPLOADS_UNSUPPORTED = "File uploads are turned off. Please re-send the message with the file uploaded to something like https://catbox.moe/ and then send the link in your message. This message was not forwarded."
+NOT_PREFIXED = "`!` does nothing. By default, messages are not forwarded unless `?` is prepended to them."
 
-# https://api.slack.com/events/message.im
-@app.event("message")
-def handle_message(event, say: Say, client: WebClient, respond: Respond, ack):
-    # Acknowledge the event
-    ack()
 
-    # Depending on the subtype, pull out appropriate data and initialize the message model
-    # https://api.slack.com/events/message#subtypes
-    subtype = MessageEvent.Subtypes(event.get("subtype"))
+def edited_text(original: str, new: str) -> str:
+    return f"A message has been edited from ```{original}``` to ```{new}```"
 
+
+# Raw subtype -> Subtypes for the ones parse_message_event builds a MessageEvent for. Cheaper than going through _missing_
+_HANDLED_SUBTYPES = {
+    None: MessageEvent.Subtypes.normal,
+    "message_changed": MessageEvent.Subtypes.message_changed,
+    "file_share": MessageEvent.Subtypes.file_share,
+    "message_deleted": MessageEvent.Subtypes.message_deleted,
+}
+
+
+def is_relevant(event: dict) -> bool:
+    """
+    Cheap check on the raw event, made before it's parsed or queued, for message events that can't lead to anything whatever the database holds.
+    Private channels Shroud is in deliver every message, and most of them stop here
+    """
+    subtype = event.get("subtype")
+    if subtype not in _HANDLED_SUBTYPES:
+        return False
     # Deleting a message in a relay results in a message_changed event with a differing reply_count and potentially a different latest_reply
     # In this case, the top-level message will always be a bot_message that shouldn't change so it's easy to just ignore it if a bot message is changed
     # If there's another random thread that's not a relay that has a reply deleted or edited it'll be ignored anyway since there is no record for that relay
-    if event.get("message", {}).get("subtype") == "bot_message":
-        print("INFO: Received a bot message or update; ignoring it.")
-        return
+    message = event.get("message")
+    if message is not None and message.get("subtype") == "bot_message":
+        return False
+    # Files Shroud shares itself when it relays them
+    if subtype == "file_share" and event.get("bot_id"):
+        return False
+    if event.get("channel", "").startswith("D"):
+        return True
+    # Outside DMs file shares are only answered by relaying them, and a new message outside a thread can't belong to a relay
+    if subtype == "file_share" and not files.enabled():
+        return False
+    return not (subtype in (None, "file_share") and "thread_ts" not in event)
+
+
+def parse_message_event(event: dict) -> MessageEvent | None:
+    """
+    Build a MessageEvent from a raw message event, or return None if the event should be ignored
+    """
+    if not is_relevant(event):
+        return None
+    # Depending on the subtype, pull out appropriate data and initialize the message model
+    # https://api.slack.com/events/message#subtypes
+    subtype = _HANDLED_SUBTYPES[event.get("subtype")]
 
     match subtype:
         case MessageEvent.Subtypes.file_share:
@@ -123,15 +201,9 @@ def handle_message(event, say: Say, client: WebClient, respond: Respond, ack):
                 ts=event["ts"],
                 user=event.get("user"),
                 content=event.get("text", ""),
+                files=event.get("files", []),
                 subtype=subtype,
             )
-            if message.record and message.is_dm:
-                client.chat_postMessage(
-                    channel=event["channel"],
-                    thread_ts=event.get("thread_ts", event.get("ts")),
-                    text="File uploads are not supported yet. Please re-send the message with the file uploaded to something like https://catbox.moe/ and then send the link in your message. This message was not forwarded.",
-                )
-            return
         case MessageEvent.Subtypes.normal:
             message = MessageEvent(
                 channel=event["channel"],
@@ -148,12 +220,12 @@ def handle_message(event, say: Say, client: WebClient, respond: Respond, ack):
             # https://api.slack.com/events/message/message_changed
             # to_send = f"<@{user}> updated a <{client.chat_getPermalink(channel=event['channel'], message_ts=event["message"]["ts"]).data["permalink"]}|message> to {event["message"]["text"]}"
             # Initally linked the message... before realizing the user probably wouldn't have access to the linked message. Embed it eventually?
-            to_send = f"A message has been edited from ```{original_text}``` to ```{new_text}```"
             message = MessageEvent(
                 channel=event["channel"],
                 subtype=subtype,
                 ts=event["message"]["ts"],
-                content=to_send,
+                content=edited_text(original_text, new_text),
+                content_pre_update=original_text,
                 content_post_update=new_text,
                 user=user,
                 thread_ts=event["message"].get("thread_ts"),
@@ -170,6 +242,91 @@ def handle_message(event, say: Say, client: WebClient, respond: Respond, ack):
                 content="Message deletions are not forwarded.",
             )
         case MessageEvent.Subtypes.other:
+            return None
+    return message
+
+
+def is_report_edit(message: MessageEvent, record: dict | None) -> bool:
+    """
+    Whether the event is the reporter editing the DM that started a report
+    """
+    return (
+        record is not None
+        and message.subtype == MessageEvent.Subtypes.message_changed
+        and message.is_dm
+        and message.thread_ts is None
+        and record["fields"].get("dm_ts") == message.ts
+    )
+
+
+def hold_edit(message: MessageEvent, send: Callable[[str, str], Any]) -> bool:
+    """
+    Leave an edit for the debouncer to relay once the message stops changing. False if it should be relayed now
+    """
+    return message.subtype == MessageEvent.Subtypes.message_changed and debouncer.hold(
+        message.channel, message.ts, message.content_pre_update, message.content_post_update, send
+    )
+
+
+def relay_files(message: MessageEvent, channel: str, thread_ts: str, client: WebClient) -> None:
+    """
+    Copy the files shared in `message` to the other side of the relay, telling whoever shared them about any left out.
+    Returns once the copies have started, so they can land after messages sent while they run
+    """
+
+    def notify(relayed: Future) -> None:
+        notice = files.skipped_notice(relayed.result())
+        if not notice:
+            return
+        try:
+            client.chat_postEphemeral(
+                channel=message.channel, thread_ts=message.thread_ts, user=message.user, text=notice
+            )
+        except Exception as e:  # noqa: BLE001
+            # Runs as a done callback, so nothing would report it otherwise
+            print(f"Failed to tell {message.user} about files that weren't relayed: {e}")
+
+    files.start_relay(message.files, channel, thread_ts, client).add_done_callback(notify)
+
+
+def relay_key(body: dict) -> tuple[str, str]:
+    """
+    Messages in the same thread share a key. For a relay the thread root is the record's dm_ts on the DM side and its forwarded_ts in FD's channel, so this orders each direction of a relay without a database lookup
+    """
+    event = body["event"]
+    # message_changed and message_deleted describe the affected message in a nested object
+    message = event.get("message") or event.get("previous_message") or event
+    return event.get("channel"), message.get("thread_ts") or message.get("ts")
+
+
+# https://api.slack.com/events/message.im
+@ordered(app.event("message", matchers=[is_relevant]), key=relay_key)
+def handle_message(event, say: Say, client: WebClient, respond: Respond):
+    message = parse_message_event(event)
+    if message is None:
+        return
+
+    if message.subtype == MessageEvent.Subtypes.file_share and not (message.record and files.enabled()):
+        if message.record and message.is_dm:
+            client.chat_postMessage(
+                channel=message.channel,
+                thread_ts=message.thread_ts or message.ts,
+                text=FILE_UPLOADS_UNSUPPORTED,
+            )
+        return
+
+    if message.subtype == MessageEvent.Subtypes.message_deleted:
+        # An edit still waiting to be relayed shouldn't be, since the message is gone
+        debouncer.cancel(message.channel, message.ts)
+
+    if is_report_edit(message, message.record):
+        # Keep the report's content current so submission forwards the edited version
+        reports.store.put(
+            message.channel, message.ts, message.content_post_update, message.attachments
+        )
+        db.update_record(message.record["id"], {"content": message.content_post_update})
+        if not message.record["fields"].get("forwarded_ts"):
+            # Not submitted yet, so there's nothing to relay the edit to
             return
 
     if message.return_to_sender and (message.is_dm or message.record is not None):
@@ -185,30 +342,49 @@ def handle_message(event, say: Say, client: WebClient, respond: Respond, ack):
     ):
         utils.begin_forward(message, client)
     elif message.record is not None and message.is_dm:
-        client.chat_postMessage(
-            channel=settings.channel,
-            text=message.content,
-            attachments=message.attachments,
-            thread_ts=message.record["fields"]["forwarded_ts"],
-        )
+        def relay(text: str) -> None:
+            client.chat_postMessage(
+                channel=settings.channel,
+                text=text,
+                attachments=message.attachments,
+                thread_ts=message.record["fields"]["forwarded_ts"],
+            )
+
+        held = hold_edit(message, lambda original, new: relay(edited_text(original, new)))
+        # Files can be shared without any text
+        if not held and message.content:
+            relay(message.content)
+        if message.files:
+            relay_files(message, settings.channel, message.record["fields"]["forwarded_ts"], client)
     elif message.record is not None and message.is_dm is False:
         if message.content.startswith("!"):
             client.chat_postEphemeral(
                 channel=message.record["fields"]["dm_channel"],
                 thread_ts=message.record["fields"]["dm_ts"],
                 user=message.user,
-                text="`!` does nothing. By default, messages are not forwarded unless `?` is prepended to them.",
+                text=NOT_PREFIXED,
             )
             return
         prefix_info = message.get_prefix_info
         if prefix_info.should_forward:
-            client.chat_postMessage(
-                channel=message.record["fields"]["dm_channel"],
-                thread_ts=message.record["fields"]["dm_ts"],
-                text=prefix_info.content_without_prefix,
-                username=utils.get_name(message.user, client),
-                icon_url=utils.get_profile_picture_url(message.user, client),
-            )
+            def relay(text: str) -> None:
+                profile = utils.get_profile(message.user, client)
+                client.chat_postMessage(
+                    channel=message.record["fields"]["dm_channel"],
+                    thread_ts=message.record["fields"]["dm_ts"],
+                    text=text,
+                    username=profile.name,
+                    icon_url=profile.image_url,
+                )
+
+            held = hold_edit(message, lambda original, new: relay(edited_text(original, new)))
+            # A file shared with nothing but `?` has no text to relay
+            if not held and prefix_info.content_without_prefix:
+                relay(prefix_info.content_without_prefix)
+            if message.files:
+                relay_files(
+                    message, message.record["fields"]["dm_channel"], message.record["fields"]["dm_ts"], client
+                )
             if (
                 not message.record["fields"].get("reply_time")
             ):
@@ -216,14 +392,15 @@ def handle_message(event, say: Say, client: WebClient, respond: Respond, ack):
                 forwarded_time = message.record["fields"].get("forwarded_ts")
                 reply_time = message.ts
                 try:
-                    fwd_dt = datetime.datetime.fromtimestamp(float(forwarded_time), tz=datetime.timezone.utc)
-                    reply_dt = datetime.datetime.fromtimestamp(float(reply_time), tz=datetime.timezone.utc)
-                    time_diff = (reply_dt - fwd_dt).total_seconds()
-                    formatted_time = str(datetime.timedelta(seconds=int(time_diff)))
-                    db.get_table().update(message.record["id"], {"reply_time": formatted_time})
+                    formatted_time = utils.elapsed_since(forwarded_time, reply_time)
+                    db.update_record(message.record["id"], {"reply_time": formatted_time})
+                    stats.store.replied(forwarded_time, reply_time)
                 except Exception as e:
                     print(f"Failed to record first reply time diff: {e}")
         else:
+            if message.subtype == MessageEvent.Subtypes.message_changed:
+                # Edited so it's no longer meant for the reporter
+                debouncer.cancel(message.channel, message.ts)
             print("INFO: received a message not prefixed with `!` or `?`; ignoring it.")
     else:
         print(
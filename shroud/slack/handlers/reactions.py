@@ -1,22 +1,50 @@
 from slack_sdk import WebClient
-from shroud.slack import app
-from shroud.utils import db
-import datetime
+from slack_sdk.errors import SlackApiError
+from shroud.slack import app, ordered
+from shroud.utils import db, stats, utils
+from shroud.utils.reaction_state import RESOLVING_REACTIONS, MessageReactions, tracker
+
+def reaction_relay_key(body: dict) -> tuple[str, str]:
+    # Same key as replies in the forwarded message's thread, see incoming_message.relay_key
+    item = body["event"].get("item", {})
+    return item.get("channel"), item.get("ts")
+
+
+def hourglass_error(e: Exception) -> str | None:
+    # Slack's error code, e.g. no_reaction when :hourglass: was already gone
+    return e.response.get("error") if isinstance(e, SlackApiError) and e.response is not None else None
+
+
+def reaction_state(client: WebClient, channel: str, ts: str) -> MessageReactions:
+    # Messages forwarded before a restart, or evicted since, are read back once and then tracked from events
+    state = tracker.get(channel, ts)
+    if state is None:
+        resp = client.reactions_get(channel=channel, timestamp=ts, full=True)
+        state = tracker.seed_from_message(channel, ts, resp["message"])
+    return state
+
 
 # Listen for reaction_added events to remove :hourglass: if :white_check_mark: or :x: is added
-@app.event("reaction_added")
+@ordered(app.event("reaction_added"), key=reaction_relay_key)
 def handle_reaction_added(event, client: WebClient):
     reaction = event.get("reaction")
     item = event.get("item", {})
     channel = item.get("channel")
     ts = item.get("ts")
     # Only act on :white_check_mark: or :x:
-    if reaction in ("white_check_mark", "x"):
+    if reaction in RESOLVING_REACTIONS:
         # Only care if the message thread is in the database
         record = db.get_message_by_ts(ts)
         if not record:
             return
-        # Remove :hourglass: reaction if present
+        try:
+            state = reaction_state(client, channel, ts)
+        except SlackApiError as e:
+            print(f"Failed to get reactions: {e}")
+            return
+        # Already resolved by someone else, so :hourglass: is gone and resolve_time is set
+        if not tracker.resolve(state, event.get("user"), reaction):
+            return
         try:
             client.reactions_remove(
                 channel=channel,
@@ -24,50 +52,56 @@ def handle_reaction_added(event, client: WebClient):
                 timestamp=ts
             )
         except Exception as e:
-            print(f"Failed to remove :hourglass: reaction: {e}")
+            if hourglass_error(e) != "no_reaction":
+                print(f"Failed to remove :hourglass: reaction: {e}")
+                tracker.set_hourglass(state, True)
         # Set resolve_time in db to the time difference between forward and now
         try:
             forwarded_time = record["fields"].get("forwarded_ts")
             if forwarded_time:
-                fwd_dt = datetime.datetime.fromtimestamp(float(forwarded_time), tz=datetime.timezone.utc)
-                now_dt = datetime.datetime.now(datetime.timezone.utc)
-                time_diff = (now_dt - fwd_dt).total_seconds()
-                formatted_time = str(datetime.timedelta(seconds=int(time_diff)))
-                db.get_table().update(record["id"], {"resolve_time": formatted_time})
+                formatted_time = utils.elapsed_since(forwarded_time)
+                db.update_record(record["id"], {"resolve_time": formatted_time})
+                stats.store.resolved(forwarded_time)
         except Exception as e:
             print(f"Failed to set resolve_time: {e}")
 
 # Listen for reaction_removed events to re-add :hourglass: if :white_check_mark: or :x: is removed and neither is present
-@app.event("reaction_removed")
+@ordered(app.event("reaction_removed"), key=reaction_relay_key)
 def handle_reaction_removed(event, client: WebClient):
     reaction = event.get("reaction")
     item = event.get("item", {})
     channel = item.get("channel")
     ts = item.get("ts")
     # Only act if :white_check_mark: or :x: is removed
-    if reaction in ("white_check_mark", "x"):
+    if reaction in RESOLVING_REACTIONS:
         # Only care if the message thread is in the database
         record = db.get_message_by_ts(ts)
         if not record:
             return
-        # Fetch current reactions for the message
         try:
-            resp = client.reactions_get(channel=channel, timestamp=ts)
-            reactions = resp["message"].get("reactions", [])
-            # Count all check mark and x reactions
-            check_count = next((r["count"] for r in reactions if r["name"] == "white_check_mark"), 0)
-            x_count = next((r["count"] for r in reactions if r["name"] == "x"), 0)
-            if check_count == 0 and x_count == 0:
-                # Re-add :hourglass: if neither is present
-                client.reactions_add(
-                    channel=channel,
-                    name="hourglass",
-                    timestamp=ts
-                )
-                # Set resolve_time in db to blank string
-                try:
-                    db.get_table().update(record["id"], {"resolve_time": ""})
-                except Exception as e:
-                    print(f"Failed to reset resolve_time: {e}")
+            state = reaction_state(client, channel, ts)
+        except SlackApiError as e:
+            print(f"Failed to get reactions: {e}")
+            return
+        # Other :white_check_mark: or :x: reactions are still there
+        if not tracker.unresolve(state, event.get("user"), reaction):
+            return
+        try:
+            client.reactions_add(
+                channel=channel,
+                name="hourglass",
+                timestamp=ts
+            )
+        except Exception as e:  # noqa: BLE001
+            # Anything but already_reacted rolls the tracked state back
+            if hourglass_error(e) != "already_reacted":
+                print(f"Failed to re-add :hourglass: reaction: {e}")
+                tracker.set_hourglass(state, False)
+                return
+        # Set resolve_time in db to blank string
+        try:
+            db.update_record(record["id"], {"resolve_time": ""})
+            if record["fields"].get("forwarded_ts"):
+                stats.store.reopened(record["fields"]["forwarded_ts"])
         except Exception as e:
-            print(f"Failed to re-add :hourglass: reaction: {e}")
+            print(f"Failed to reset resolve_time: {e}")
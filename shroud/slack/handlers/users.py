@@ -0,0 +1,9 @@
+from shroud.slack import app, deferred
+from shroud.utils import users
+
+
+# https://api.slack.com/events/user_change
+# Keeps relayed names and profile pictures current after a user edits their profile
+@deferred(app.event("user_change"))
+def handle_user_change(event):
+    users.profiles.update(event["user"])
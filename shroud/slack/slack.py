@@ -1,10 +1,23 @@
+import functools
+import signal
+import sys
+import threading
 from shroud import settings
+from shroud.slack import client as slack_client, supervisor
+from shroud.utils import allowlist, channels, db, events, metrics, stats, templates
+from shroud.utils.edits import debouncer
+from shroud.utils.outbox import outbox
+from shroud.utils.dispatch import OrderedDispatcher
+from shroud.utils.workers import WorkerPool
 
 # Slack imports
 from slack_bolt import App, BoltResponse
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 
 from slack_bolt.context.respond import Respond
+from slack_bolt.kwargs_injection import build_required_kwargs
+from slack_bolt.request import BoltRequest
+from slack_bolt.util.utils import get_arg_names_of_callable
 from slack_sdk.errors import SlackApiError
 
 # To avoid a log message about unhandled requests
@@ -13,12 +26,182 @@ from slack_bolt.error import BoltUnhandledRequestError
 
 SLACK_BOT_TOKEN = settings.slack_bot_token
 SLACK_APP_TOKEN = settings.slack_app_token
-app = App(token=SLACK_BOT_TOKEN, raise_error_for_unhandled_request=True)
+ERROR_MESSAGE = "Something went wrong. If this persists, please contact <@U075RTSLDQ8>."
+
+# Deferred listener work runs here. Listeners ack on the Socket Mode thread (process_before_response) so a busy pool never delays an ack
+worker_pool = WorkerPool(
+    max_workers=settings.worker_pool_size,
+    max_queue=settings.worker_queue_size,
+    name="listener",
+)
+# Listeners whose order matters within a relay share the pool but are serialized per relay
+dispatcher = OrderedDispatcher(
+    worker_pool,
+    max_pending=settings.worker_pool_size + settings.worker_queue_size,
+)
+app = App(
+    client=slack_client.ScheduledWebClient(token=SLACK_BOT_TOKEN),
+    raise_error_for_unhandled_request=True,
+    process_before_response=True,
+    listener_executor=worker_pool,
+)
+
+
+def claim_request(body, next):
+    """
+    With several Socket Mode workers Slack may deliver a request, or its retry, to any of them. Only the first to claim it runs it
+    """
+    key = events.event_key(body)
+    if key is not None:
+        claimed = events.store.claim(key, settings.socket_worker_id)
+        metrics.socket_requests.inc(
+            worker=str(settings.socket_worker_id),
+            result="claimed" if claimed else "duplicate",
+        )
+        if not claimed:
+            return BoltResponse(status=200, body="")
+    next()
+
+
+if events.store is not None:
+    app.middleware(claim_request)
+
+
+# Bolt builds a plain WebClient for every request. Listeners get the shared scheduling client instead so all calls count against one set of limits
+@app.middleware
+def use_scheduled_client(context, next):
+    context["client"] = app.client
+    next()
+
+
+def _ack(ack):
+    ack()
+
+
+def _reporting_errors(func):
+    """
+    Bolt only logs exceptions from work it runs in the background, so report them the way handle_errors would
+    """
+
+    @functools.wraps(func)
+    def run(**kwargs):
+        try:
+            with metrics.timed(
+                metrics.listener_seconds,
+                metrics.listener_errors,
+                metrics.listeners_in_flight,
+                handler=func.__name__,
+                subtype=metrics.listener_subtype(kwargs),
+            ):
+                func(**kwargs)
+        except Exception as e:  # noqa: BLE001
+            # Like handle_errors, which Bolt calls with whatever a listener raised
+            print(f"Error in {func.__name__}: {e}")
+            if "respond" in kwargs:
+                try:
+                    kwargs["respond"](ERROR_MESSAGE)
+                except SlackApiError as e:
+                    print(f"Error sending message: {e.response['error']}")
+
+    return run
+
+
+def deferred(register):
+    """
+    Register the decorated function as a lazy listener behind an immediate ack, e.g. `@deferred(app.event("message"))`
+    """
+
+    def decorator(func):
+        register(ack=_ack, lazy=[_reporting_errors(func)])
+        return func
+
+    return decorator
+
+
+def ordered(register, key):
+    """
+    Like deferred, but requests for which `key(body)` is equal run one at a time in the order Slack delivered them.
+    Requests with different keys still run concurrently on the worker pool.
+    """
+
+    def decorator(func):
+        run = _reporting_errors(func)
+        arg_names = get_arg_names_of_callable(func)
+
+        def run_request(request: BoltRequest):
+            run(
+                **build_required_kwargs(
+                    logger=app.logger,
+                    required_arg_names=arg_names,
+                    request=request,
+                    response=None,
+                    this_func=func,
+                )
+            )
+
+        # Dispatching from the ack is what fixes the order, since socket_mode_handler handles envelopes one at a time in
+        # the order they arrived
+        def ack_and_dispatch(ack, body, request: BoltRequest):
+            ack()
+            dispatcher.submit(key(body), run_request, request.to_copyable())
+
+        register(ack_and_dispatch)
+        return func
+
+    return decorator
+
+
+def socket_mode_handler() -> SocketModeHandler:
+    # slack_sdk hands envelopes to 10 threads by default, which lets two events for one relay reach `ordered` out of
+    # order. One is enough, since listener work is deferred and acks only queue it
+    return SocketModeHandler(app, SLACK_APP_TOKEN, concurrency=1)
 
 
 def start_app():
     global app
-    SocketModeHandler(app, SLACK_APP_TOKEN).start()
+    if settings.socket_workers > 1 and not settings.socket_worker_id:
+        from shroud.slack.supervisor import supervise
+
+        supervise(settings.socket_workers)
+        return
+    if settings.runtime == "async":
+        import asyncio
+
+        from shroud.slack.aio import start_app as start_async_app
+
+        asyncio.run(start_async_app())
+        return
+    if settings.metrics_port:
+        metrics.serve(settings.metrics_host, supervisor.metrics_port())
+    # Turn `docker stop` into SystemExit so the pool gets drained below
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    handler = socket_mode_handler()
+    try:
+        handler.connect()
+        print(f"Connected to Slack as Socket Mode worker {settings.socket_worker_id}" if settings.socket_worker_id else "Connected to Slack")
+        # Set the backend up and index record timestamps now that events can arrive, without holding up the connection
+        threading.Thread(target=db.warm, name="init-backend", daemon=True).start()
+        channels.directory.warm(app.client)
+        allowlist.members.warm(app.client)
+        # Finish forwarding reports a previous run was interrupted in the middle of
+        outbox.start(app.client)
+        # Read the manifest for /help now rather than on the first call
+        templates.help_text()
+        threading.Event().wait()
+    finally:
+        print("Shutting down, finishing queued work...")
+        handler.close()
+        worker_pool.shutdown(wait=True)
+        print(f"Worker pool drained: {worker_pool.stats()}")
+        # Outbox steps save to the database, so they're finished before it's closed
+        # Edits still being held are relayed rather than lost
+        debouncer.flush()
+        outbox.close()
+        stats.store.close()
+        db.close()
+        if events.store is not None:
+            events.store.close()
+        slack_client.print_stats()
 
 
 # https://github.com/slackapi/bolt-python/issues/299#issuecomment-823590042
@@ -29,9 +212,7 @@ def handle_errors(error, body, respond: Respond):
     else:
         print(f"Error: {str(error)}")   
         try:
-            respond(
-                "Something went wrong. If this persists, please contact <@U075RTSLDQ8>."
-            )
+            respond(ERROR_MESSAGE)
         except SlackApiError as e:
             print(f"Error sending message: {e.response['error']}")
         return BoltResponse(status=500, body="Something Wrong")
@@ -0,0 +1,59 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from shroud import settings
+
+# Seconds to wait before restarting a worker that exited, so one that can't start doesn't spin
+RESTART_DELAY = 5
+
+
+def _spawn(worker_id: int) -> subprocess.Popen:
+    # A fresh interpreter per worker, so nothing started in this process (threads, connections) is inherited
+    env = {**os.environ, "SHROUD_SOCKET_WORKER_ID": str(worker_id)}
+    process = subprocess.Popen([sys.executable, "-m", "shroud"], env=env)
+    print(f"Started Socket Mode worker {worker_id} (pid {process.pid})")
+    return process
+
+
+def supervise(count: int) -> None:
+    """
+    Run `count` Socket Mode workers, restarting any that exit, until this process is told to stop
+    """
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    workers = {worker_id: _spawn(worker_id) for worker_id in range(1, count + 1)}
+    restart_at: dict[int, float] = {}
+    try:
+        while not stopping.wait(1):
+            for worker_id, process in workers.items():
+                if process.poll() is None:
+                    continue
+                if worker_id not in restart_at:
+                    print(f"Socket Mode worker {worker_id} exited with {process.returncode}, restarting in {RESTART_DELAY}s")
+                    restart_at[worker_id] = time.monotonic() + RESTART_DELAY
+                elif time.monotonic() >= restart_at[worker_id]:
+                    del restart_at[worker_id]
+                    workers[worker_id] = _spawn(worker_id)
+    finally:
+        print("Stopping Socket Mode workers...")
+        # The same signal `docker stop` sends a single process
+        for process in workers.values():
+            if process.poll() is None:
+                process.terminate()
+        for worker_id, process in workers.items():
+            process.wait()
+            print(f"Socket Mode worker {worker_id} stopped")
+
+
+def metrics_port() -> int:
+    """
+    metrics_port for a single process. Workers serve theirs on consecutive ports from it, worker 1 on metrics_port itself
+    """
+    if not settings.metrics_port or not settings.socket_worker_id:
+        return settings.metrics_port
+    return settings.metrics_port + settings.socket_worker_id - 1
@@ -0,0 +1,127 @@
+"""
+Async counterparts of the db and utils helpers, used by the asyncio runtime.
+Storage backends are synchronous, so database calls that miss the cache run in a worker thread.
+"""
+
+import asyncio
+from typing import TYPE_CHECKING
+
+from slack_sdk.web.async_client import AsyncWebClient
+
+from shroud.utils import allowlist, db, reports, templates, users
+from shroud.utils.reports import ReportContent
+from shroud.utils.users import UserProfile
+
+if TYPE_CHECKING:
+    from shroud.slack.handlers.incoming_message import MessageEvent
+
+# user id -> users.info request currently running, so concurrent misses share it
+_pending_profiles: dict[str, asyncio.Task] = {}
+
+
+async def get_record_by_ts(ts: str) -> dict | None:
+    cached = db.cache.get(ts)
+    if cached is not None:
+        return cached
+    # No need for a thread if the filter already knows there's no record
+    if not db.might_have_record(ts):
+        return None
+    return await asyncio.to_thread(db.get_message_by_ts, ts)
+
+
+async def save_forward_start(content: str, dm_ts: str, selection_ts: str, dm_channel: str) -> None:
+    await asyncio.to_thread(
+        db.save_forward_start,
+        content=content,
+        dm_ts=dm_ts,
+        selection_ts=selection_ts,
+        dm_channel=dm_channel,
+    )
+
+
+async def finish_forward(dm_ts: str, forwarded_ts: str) -> None:
+    await asyncio.to_thread(db.finish_forward, dm_ts=dm_ts, forwarded_ts=forwarded_ts)
+
+
+async def save_selection(selection_ts: str, selection: str) -> None:
+    await asyncio.to_thread(
+        db.save_selection, selection_ts=selection_ts, selection=selection
+    )
+
+
+async def update_record(record_id: str, fields: dict) -> None:
+    await asyncio.to_thread(db.update_record, record_id, fields)
+
+
+async def get_message_by_ts(ts: str, channel: str, client: AsyncWebClient) -> dict | None:
+    messages = (
+        await client.conversations_history(
+            channel=channel, oldest=ts, inclusive=True, limit=1
+        )
+    ).data["messages"]
+    if messages:
+        return messages[0]
+    # This might be because it's a threaded message
+    messages = (
+        await client.conversations_replies(
+            channel=channel, ts=ts, oldest=ts, inclusive=True, limit=1
+        )
+    ).data["messages"]
+    return messages[0] if messages else None
+
+
+async def get_report_content(record: dict, client: AsyncWebClient) -> ReportContent | None:
+    fields = record["fields"]
+    content = reports.store.get(fields["dm_channel"], fields["dm_ts"])
+    if content is not None:
+        return content
+    message = await get_message_by_ts(ts=fields["dm_ts"], channel=fields["dm_channel"], client=client)
+    if message is None:
+        return None
+    return ReportContent(text=message["text"], attachments=message.get("attachments", []))
+
+
+async def is_allowlisted(user_id: str, client: AsyncWebClient) -> bool:
+    if allowlist.members.on_demand or not allowlist.members.loaded:
+        # Listed with a sync client on a thread, like the startup listing
+        from shroud.slack.client import ScheduledWebClient
+
+        return await asyncio.to_thread(allowlist.members.is_member, user_id, ScheduledWebClient(token=client.token))
+    return user_id in allowlist.members
+
+
+async def _fetch_profile(user_id: str, client: AsyncWebClient) -> UserProfile:
+    try:
+        user = (await client.users_info(user=user_id))["user"]
+        users.profiles.put(user)
+        return UserProfile.from_user(user)
+    finally:
+        del _pending_profiles[user_id]
+
+
+async def get_profile(user_id: str, client: AsyncWebClient) -> UserProfile:
+    cached = users.profiles.peek(user_id)
+    if cached is not None:
+        return cached
+    task = _pending_profiles.get(user_id)
+    if task is None:
+        task = _pending_profiles[user_id] = asyncio.create_task(
+            _fetch_profile(user_id, client)
+        )
+    return await task
+
+
+async def begin_forward(message: "MessageEvent", client: AsyncWebClient) -> None:
+    reports.store.put(message.channel, message.ts, message.content, message.attachments)
+    selection_prompt = await client.chat_postMessage(
+        channel=message.channel,
+        text=templates.SELECTION_PROMPT_TEXT,
+        thread_ts=message.ts,  # Thread the prompt under the user's message
+        blocks=templates.selection_prompt_blocks(),
+    )
+    await save_forward_start(
+        dm_ts=message.ts,
+        content=message.content,
+        selection_ts=selection_prompt.data["ts"],
+        dm_channel=message.channel,
+    )
@@ -0,0 +1,150 @@
+import contextvars
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import Future
+
+from slack_sdk import WebClient
+
+from shroud import settings
+from shroud.utils import ratelimit
+
+# conversations.members returns at most 1000 members a page
+PAGE_SIZE = 1000
+
+
+class Allowlist:
+    """
+    Members of the allowlist channel, who may use privileged commands and actions.
+    Listed once with conversations.members, kept current from member_joined_channel and member_left_channel,
+    and listed again every `reconcile_interval` seconds in case an event was missed.
+    With `on_demand`, nothing is kept and every check lists the channel's members
+    """
+
+    def __init__(self, channel: str, reconcile_interval: float, on_demand: bool = False):
+        self.channel = channel
+        self.reconcile_interval = reconcile_interval
+        self.on_demand = on_demand
+        self._members: set[str] = set()
+        self._loading: Future | None = None
+        self._loaded = False
+        # Members changed by events while a listing was running. The listing may predate those changes
+        self._changed: set[str] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def is_member(self, user_id: str, client: WebClient) -> bool:
+        """
+        Whether the user is in the allowlist channel, listing its members first if that hasn't happened yet
+        """
+        if self.on_demand:
+            return self._check(user_id, client)
+        if not self._loaded:
+            self.load(client)
+        return user_id in self
+
+    def __contains__(self, user_id: str) -> bool:
+        with self._lock:
+            return user_id in self._members
+
+    def load(self, client: WebClient, reload: bool = False) -> None:
+        """
+        Page through conversations.members. Concurrent callers share one listing
+        """
+        with self._lock:
+            if self._loaded and not reload:
+                return
+            loading = self._loading
+            if loading is None:
+                loading = self._loading = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            loading.result()
+            return
+
+        try:
+            members = self._list(client)
+        except Exception as e:
+            with self._lock:
+                self._loading = None
+                self._changed.clear()
+            loading.set_exception(e)
+            raise
+        with self._lock:
+            # Keep whatever events said about members that changed mid-listing
+            kept = self._members & self._changed
+            self._members = (members - self._changed) | kept
+            self._changed.clear()
+            self._loaded = True
+            self._loading = None
+        loading.set_result(None)
+
+    def _pages(self, client: WebClient) -> Iterator[list[str]]:
+        cursor = None
+        while True:
+            response = client.conversations_members(channel=self.channel, limit=PAGE_SIZE, cursor=cursor)
+            yield response["members"]
+            cursor = response.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                return
+
+    def _list(self, client: WebClient) -> set[str]:
+        members = set()
+        with ratelimit.background():
+            for page in self._pages(client):
+                members.update(page)
+        return members
+
+    def _check(self, user_id: str, client: WebClient) -> bool:
+        # Someone is waiting on this one, so it isn't background work, and it stops at the page the user is on
+        return any(user_id in page for page in self._pages(client))
+
+    def warm(self, client: WebClient) -> None:
+        """
+        Load in the background, then reconcile every `reconcile_interval` seconds (if it's set)
+        """
+        if self.on_demand:
+            return
+
+        def run():
+            reload = False
+            while True:
+                try:
+                    self.load(client, reload=reload)
+                    print(f"Allowlist has {len(self._members)} members")
+                except Exception as e:  # noqa: BLE001
+                    # Tried again at the next interval, so the thread mustn't die
+                    print(f"Failed to list allowlist members: {e}")
+                if not self.reconcile_interval:
+                    return
+                reload = True
+                time.sleep(self.reconcile_interval)
+
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(run,), name="allowlist", daemon=True).start()
+
+    def add(self, user_id: str) -> None:
+        with self._lock:
+            self._members.add(user_id)
+            if self._loading is not None:
+                self._changed.add(user_id)
+
+    def remove(self, user_id: str) -> None:
+        with self._lock:
+            self._members.discard(user_id)
+            if self._loading is not None:
+                self._changed.add(user_id)
+
+
+# A worker only hears the join and leave events Slack delivers to it, so with several each check asks Slack instead.
+# Otherwise the others would keep allowing someone who left until their next listing
+members = Allowlist(
+    channel=settings.channel,
+    reconcile_interval=settings.allowlist_reconcile_interval,
+    on_demand=settings.socket_workers > 1,
+)
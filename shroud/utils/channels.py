@@ -0,0 +1,184 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import Future
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+from shroud import settings
+from shroud.utils import ratelimit
+
+# conversations.list returns at most 1000 channels a page. Slack may return fewer, or none with a cursor to follow
+PAGE_SIZE = 1000
+
+
+class ChannelDirectory:
+    """
+    Name -> ID index of the private channels Shroud is in, so commands can find a channel without listing them.
+    Built by paging through conversations.list, kept current from channel events, and listed again every
+    `reconcile_interval` seconds in case an event was missed. Lookups check what they find with conversations.info,
+    and list the channels again on a miss
+    """
+
+    def __init__(self, reconcile_interval: float):
+        self.reconcile_interval = reconcile_interval
+        self._ids: dict[str, str] = {}
+        # id -> name, so renames and archives (which only carry the id) can find the old entry
+        self._names: dict[str, str] = {}
+        self._loading: Future | None = None
+        self._loaded = False
+        # Channels changed by events while a listing was running. The listing may predate those changes
+        self._changed: set[str] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self, name: str, client: WebClient) -> str | None:
+        """
+        ID of the channel named `name`, listing the channels first if that hasn't happened yet
+        """
+        listed = not self._loaded
+        if listed:
+            self.load(client)
+        with self._lock:
+            channel_id = self._ids.get(name)
+        if channel_id is None and not listed:
+            # Created, renamed or joined through an event that was missed, or that another worker received
+            self.load(client, reload=True)
+            with self._lock:
+                channel_id = self._ids.get(name)
+        if channel_id is None:
+            return None
+        return channel_id if self._check(channel_id, name, client) else None
+
+    def _check(self, channel_id: str, name: str, client: WebClient) -> bool:
+        """
+        Whether the channel is still called `name` and open, fixing its entry if not
+        """
+        try:
+            channel = client.conversations_info(channel=channel_id)["channel"]
+        except SlackApiError as e:
+            if e.response.get("error") != "channel_not_found":
+                raise
+            self.remove(channel_id)
+            return False
+        if channel.get("is_archived"):
+            self.remove(channel_id)
+            return False
+        if channel["name"] != name:
+            self.add(channel_id, channel["name"])
+            return False
+        return True
+
+    def load(self, client: WebClient, reload: bool = False) -> None:
+        """
+        Page through conversations.list. Concurrent callers share one listing
+        """
+        with self._lock:
+            if self._loaded and not reload:
+                return
+            loading = self._loading
+            if loading is None:
+                loading = self._loading = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            loading.result()
+            return
+
+        try:
+            channels = self._list(client)
+        except Exception as e:
+            with self._lock:
+                self._loading = None
+                self._changed.clear()
+            loading.set_exception(e)
+            raise
+        with self._lock:
+            # Keep whatever events said about channels that changed mid-listing, and drop the rest of the old index
+            kept = {channel_id: self._names[channel_id] for channel_id in self._changed if channel_id in self._names}
+            self._ids, self._names = {}, {}
+            for channel_id, name in channels.items():
+                if channel_id not in self._changed:
+                    self._set(channel_id, name)
+            for channel_id, name in kept.items():
+                self._set(channel_id, name)
+            self._changed.clear()
+            self._loaded = True
+            self._loading = None
+        loading.set_result(None)
+        print(f"Indexed {len(channels)} private channels")
+
+    def _list(self, client: WebClient) -> dict[str, str]:
+        channels = {}
+        cursor = None
+        # Leaves room in conversations.list's bucket for anything interactive
+        with ratelimit.background():
+            while True:
+                response = client.conversations_list(
+                    types="private_channel",
+                    exclude_archived=True,
+                    limit=PAGE_SIZE,
+                    cursor=cursor,
+                )
+                for channel in response["channels"]:
+                    channels[channel["id"]] = channel["name"]
+                cursor = response.get("response_metadata", {}).get("next_cursor")
+                if not cursor:
+                    return channels
+
+    def warm(self, client: WebClient) -> None:
+        """
+        Load in the background so the first command doesn't wait on the listing, then reconcile every
+        `reconcile_interval` seconds (if it's set)
+        """
+
+        def run():
+            reload = False
+            while True:
+                try:
+                    self.load(client, reload=reload)
+                except Exception as e:  # noqa: BLE001
+                    # Tried again at the next interval, so the thread mustn't die
+                    print(f"Failed to index private channels: {e}")
+                if not self.reconcile_interval:
+                    return
+                reload = True
+                time.sleep(self.reconcile_interval)
+
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(run,), name="channel-directory", daemon=True).start()
+
+    def _set(self, channel_id: str, name: str) -> None:
+        old_name = self._names.get(channel_id)
+        if old_name is not None and self._ids.get(old_name) == channel_id:
+            del self._ids[old_name]
+        self._ids[name] = channel_id
+        self._names[channel_id] = name
+
+    def add(self, channel_id: str, name: str) -> None:
+        """
+        Record a channel that was created, renamed or unarchived
+        """
+        with self._lock:
+            self._set(channel_id, name)
+            if self._loading is not None:
+                self._changed.add(channel_id)
+
+    def remove(self, channel_id: str) -> None:
+        """
+        Forget a channel that was archived or deleted, or that Shroud left
+        """
+        with self._lock:
+            name = self._names.pop(channel_id, None)
+            if name is not None and self._ids.get(name) == channel_id:
+                del self._ids[name]
+            if self._loading is not None:
+                self._changed.add(channel_id)
+
+
+directory = ChannelDirectory(reconcile_interval=settings.channel_reconcile_interval)
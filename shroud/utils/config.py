@@ -29,16 +29,28 @@ settings.validators.register(
             default="C07JX2TK0UX",
         ),
         Validator(
-            "airtable_token",
-            must_exist=True,
+            "db_backend",
+            default="airtable",
+            is_in=["airtable", "sqlite"],
         ),
         Validator(
-            "airtable_base_id",
-            must_exist=True,
+            "sqlite_path",
+            default="shroud.db",
+        ),
+        # Asynchronously copy SQLite writes to Airtable for FD's reporting views
+        Validator(
+            "airtable_mirror",
+            default=False,
+            is_type_of=bool,
         ),
+        # Airtable is only needed when it's the backend or a mirror
         Validator(
+            "airtable_token",
+            "airtable_base_id",
             "airtable_table_name",
             must_exist=True,
+            when=Validator("db_backend", eq="airtable")
+            | Validator("airtable_mirror", eq=True),
         ),
 
         # Optional settings
@@ -50,7 +62,278 @@ settings.validators.register(
             "app_name",
             default="shroud",
         ),
+        # "async" runs the listeners in shroud.slack.aio on an AsyncApp
+        Validator(
+            "runtime",
+            default="sync",
+            is_in=["sync", "async"],
+        ),
+        # Socket Mode connections, each in a process of its own. With more than one, every request is claimed in
+        # event_store_path so only one worker handles it, and the in-process caches below are turned off
+        Validator(
+            "socket_workers",
+            default=1,
+            is_type_of=int,
+            condition=lambda x: x > 0,
+            messages={"condition": "Must be at least 1"},
+        ),
+        # Set for each worker by the process that starts them, 0 in that process itself
+        Validator(
+            "socket_worker_id",
+            default=0,
+            is_type_of=int,
+        ),
+        Validator(
+            "event_store_path",
+            default="shroud-events.db",
+        ),
+        # Seconds a claimed request is remembered for. Slack stops retrying well within the default
+        Validator(
+            "event_store_ttl",
+            default=3600,
+            is_type_of=(int, float),
+            condition=lambda x: x > 0,
+            messages={"condition": "Must be a positive number of seconds"},
+        ),
+        # Response times for /shroud-stats, shared by every socket worker
+        Validator(
+            "stats_path",
+            default="shroud-stats.db",
+        ),
+        # Forwarding a report is recorded here before any of it happens, so a crash partway through is finished on the next start
+        Validator(
+            "outbox_path",
+            default="shroud-outbox.db",
+        ),
+        # Threads running outbox steps. Nearly all of their time is spent waiting on Slack
+        Validator(
+            "outbox_workers",
+            default=16,
+            is_type_of=int,
+            condition=lambda x: x > 0,
+            messages={"condition": "Must be at least 1"},
+        ),
+        # Tries at each step before it's left for the next start
+        Validator(
+            "outbox_max_attempts",
+            default=5,
+            is_type_of=int,
+            condition=lambda x: x > 0,
+            messages={"condition": "Must be at least 1"},
+        ),
+        # Listener work runs on a bounded pool after the request is acked
+        Validator(
+            "worker_pool_size",
+            default=8,
+            is_type_of=int,
+            condition=lambda x: x > 0,
+            messages={"condition": "Must be at least 1"},
+        ),
+        Validator(
+            "worker_queue_size",
+            default=100,
+            is_type_of=int,
+            condition=lambda x: x > 0,
+            messages={"condition": "Must be at least 1"},
+        ),
+        # Prometheus metrics are served on this port when it's set
+        Validator(
+            "metrics_port",
+            default=0,
+            is_type_of=int,
+        ),
+        Validator(
+            "metrics_host",
+            default="127.0.0.1",
+        ),
+        # Outbound Slack calls
+        Validator(
+            "slack_max_retries",
+            default=3,
+            is_type_of=int,
+            condition=lambda x: x >= 0,
+            messages={"condition": "Must not be negative"},
+        ),
+        # Fraction of each rate limit bucket that background work (like /clean-db) leaves for interactive replies
+        Validator(
+            "slack_background_reserve",
+            default=0.5,
+            is_type_of=(int, float),
+            condition=lambda x: 0 <= x < 1,
+            messages={"condition": "Must be at least 0 and less than 1"},
+        ),
+        # /clean-db
+        Validator(
+            "clean_db_workers",
+            default=4,
+            is_type_of=int,
+            condition=lambda x: x > 0,
+            messages={"condition": "Must be at least 1"},
+        ),
+        Validator(
+            "clean_db_progress_interval",
+            default=30,
+            is_type_of=(int, float),
+        ),
+        # python -m shroud export
+        Validator(
+            "export_workers",
+            default=4,
+            is_type_of=int,
+            condition=lambda x: x > 0,
+            messages={"condition": "Must be at least 1"},
+        ),
+        # Records written between checkpoints
+        Validator(
+            "export_checkpoint_interval",
+            default=100,
+            is_type_of=int,
+            condition=lambda x: x > 0,
+            messages={"condition": "Must be at least 1"},
+        ),
+        # Seconds a user's name and profile picture are cached for
+        Validator(
+            "user_cache_ttl",
+            default=3600,
+            is_type_of=(int, float),
+        ),
+        # Users whose name and profile picture are cached, least recently used dropped first. 0 turns the cache off
+        Validator(
+            "user_cache_size",
+            default=1024,
+            is_type_of=int,
+        ),
+        # Seconds record updates may wait to be batched together. 0 writes each update immediately
+        Validator(
+            "write_behind_delay",
+            default=2,
+            is_type_of=(int, float),
+            condition=lambda x: x >= 0,
+            messages={"condition": "Must not be negative"},
+        ),
+        # Reports waiting to be submitted are kept in memory so submitting doesn't read the DM back from Slack
+        Validator(
+            "report_store_size",
+            default=1024,
+            is_type_of=int,
+        ),
+        Validator(
+            "report_store_ttl",
+            default=86400,
+            is_type_of=(int, float),
+            condition=lambda x: x > 0,
+            messages={"condition": "Must be a positive number of seconds"},
+        ),
+        # Files shared in a relay are copied to the other side if they're at most this many bytes. 0 turns file relay off
+        Validator(
+            "file_relay_max_size",
+            default=100 * 1024 * 1024,
+            is_type_of=int,
+            condition=lambda x: x >= 0,
+            messages={"condition": "Must not be negative"},
+        ),
+        # Bytes of files relayed from one message
+        Validator(
+            "file_relay_max_total",
+            default=200 * 1024 * 1024,
+            is_type_of=int,
+            condition=lambda x: x > 0,
+            messages={"condition": "Must be a positive number of bytes"},
+        ),
+        # Files being copied at once, across every relay
+        Validator(
+            "file_relay_concurrency",
+            default=4,
+            is_type_of=int,
+            condition=lambda x: x > 0,
+            messages={"condition": "Must be at least 1"},
+        ),
+        # Bytes read from Slack and sent on at a time, so roughly the memory each copy takes
+        Validator(
+            "file_relay_chunk_size",
+            default=1024 * 1024,
+            is_type_of=int,
+            condition=lambda x: x > 0,
+            messages={"condition": "Must be a positive number of bytes"},
+        ),
+        # Seconds an edit in a relay waits for further edits to the same message before they're relayed together.
+        # 0 relays every edit as it happens
+        Validator(
+            "edit_relay_window",
+            default=10,
+            is_type_of=(int, float),
+            condition=lambda x: x >= 0,
+            messages={"condition": "Must not be negative"},
+        ),
+        # Forwarded messages whose reactions are tracked, so :hourglass: is only added or removed when it has to be.
+        # Messages past this are read back with reactions.get the next time they're reacted to
+        Validator(
+            "reaction_state_size",
+            default=4096,
+            is_type_of=int,
+        ),
+        # Seconds between full listings of the allowlist channel's members, on top of join and leave events. 0 only lists them at startup
+        Validator(
+            "allowlist_reconcile_interval",
+            default=900,
+            is_type_of=(int, float),
+            condition=lambda x: x >= 0,
+            messages={"condition": "Must not be negative"},
+        ),
+        # Seconds between full listings of Shroud's private channels, on top of channel events. 0 only lists them at startup
+        Validator(
+            "channel_reconcile_interval",
+            default=900,
+            is_type_of=(int, float),
+            condition=lambda x: x >= 0,
+            messages={"condition": "Must not be negative"},
+        ),
+        # Filter of every record's timestamps, so lookups for threads and reactions that aren't relays skip the database.
+        # "bloom" is sized for ts_filter_capacity timestamps at ts_filter_fp_rate, "exact" keeps every timestamp
+        Validator(
+            "ts_filter",
+            default="bloom",
+            is_in=["bloom", "exact", "off"],
+        ),
+        Validator(
+            "ts_filter_capacity",
+            default=100000,
+            is_type_of=int,
+            condition=lambda x: x > 0,
+            messages={"condition": "Must be at least 1"},
+        ),
+        Validator(
+            "ts_filter_fp_rate",
+            default=0.001,
+            is_type_of=(int, float),
+            condition=lambda x: 0 < x < 1,
+            messages={"condition": "Must be between 0 and 1"},
+        ),
+        # In-process record cache in front of the database
+        Validator(
+            "record_cache_size",
+            default=1024,
+            is_type_of=int,
+        ),
+        Validator(
+            "record_cache_ttl",
+            default=300,
+            is_type_of=(int, float),
+            condition=lambda x: x > 0,
+            messages={"condition": "Must be a positive number of seconds"},
+        ),
     ],
 )
 
 settings.validators.validate()
+
+# Each Socket Mode worker only sees the events Slack delivers to its connection, so anything one keeps in memory
+# would go stale as soon as another handles the next event for the same report
+if settings.socket_workers > 1:
+    settings.set("write_behind_delay", 0)
+    settings.set("record_cache_size", 0)
+    settings.set("report_store_size", 0)
+    settings.set("reaction_state_size", 0)
+    settings.set("ts_filter", "off")
+    # An edit's burst can be spread across workers, and a deletion may not reach the worker holding the edit
+    settings.set("edit_relay_window", 0)
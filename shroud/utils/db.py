@@ -1,9 +1,102 @@
-from pyairtable import Api, Table
-from pyairtable.formulas import match
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Any
+from pydantic import BaseModel
 from shroud import settings
+from shroud.utils import metrics, ratelimit, tsfilter
+from shroud.utils.storage import (
+    TS_FIELDS,
+    AirtableBackend,
+    AirtableMirror,
+    Backend,
+    SQLiteBackend,
+    WriteBehind,
+)
 from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
 
-table = None
+if TYPE_CHECKING:
+    from pyairtable import Table
+
+# Created on first use by init_backend
+backend: Backend = None
+_backend_lock = threading.Lock()
+cache = None
+# Queues record updates for batched writes, None when writes go straight to the backend
+writes: WriteBehind | None = None
+
+
+class RecordCache:
+    """
+    Bounded LRU cache of records with a TTL, indexed by every timestamp field so any of them resolves to the same record
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        # record id -> (expiry, record), least recently used first
+        self._records: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        # timestamp -> record id
+        self._index: dict[str, str] = {}
+        # Bolt runs listeners on a thread pool
+        self._lock = threading.Lock()
+
+    def get(self, ts: str) -> dict | None:
+        with self._lock:
+            record_id = self._index.get(ts)
+            if record_id is None:
+                return None
+            expiry, record = self._records[record_id]
+            if expiry < time.monotonic():
+                self._remove(record_id)
+                return None
+            self._records.move_to_end(record_id)
+            return {"id": record["id"], "fields": dict(record["fields"])}
+
+    def put(self, record: dict) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if record["id"] in self._records:
+                self._remove(record["id"])
+            self._records[record["id"]] = (
+                time.monotonic() + self.ttl,
+                {"id": record["id"], "fields": dict(record["fields"])},
+            )
+            for field in TS_FIELDS:
+                ts = record["fields"].get(field)
+                if ts:
+                    self._index[ts] = record["id"]
+            while len(self._records) > self.max_size:
+                self._remove(next(iter(self._records)))
+
+    def update(self, record_id: str, fields: dict) -> None:
+        """
+        Apply a partial update to a cached record, if it's cached. Refreshes the TTL since the record is known to be current
+        """
+        with self._lock:
+            if record_id not in self._records:
+                return
+            _, record = self._records[record_id]
+        # Backends omit empty fields, so cleared fields are dropped rather than cached as None
+        merged = {k: v for k, v in {**record["fields"], **fields}.items() if v is not None}
+        self.put({"id": record_id, "fields": merged})
+
+    def discard(self, record_id: str) -> None:
+        with self._lock:
+            if record_id in self._records:
+                self._remove(record_id)
+
+    def _remove(self, record_id: str) -> None:
+        _, record = self._records.pop(record_id)
+        for field in TS_FIELDS:
+            ts = record["fields"].get(field)
+            if ts and self._index.get(ts) == record_id:
+                del self._index[ts]
 
 # class RelayRecord(BaseModel):
 #     dm_ts: Annotated[str, StringConstraints(pattern=r"^[0-9]{10}\.[0-9]{6}$")]
@@ -13,60 +106,129 @@ table = None
 #     selection: str = None
 #     dm_channel: str = None
 
-def get_table() -> Table:
+def get_table() -> "Table":
+    # pyairtable is slow to import, and SQLite-only deployments never need it
+    from pyairtable import Api
+
     api = Api(api_key=settings.airtable_token)
     table = api.table(settings.airtable_base_id, settings.airtable_table_name)
     return table
 
 
-def clean_database(client: WebClient) -> None:
-    """
-    If either the DM or the forwarded message no longer exists, remove the record from the database
-    """
-    global table
-    for list_of_records in table.iterate():
-        for full_record in list_of_records:
-            messages = []
-            r = full_record["fields"]
-            try:
-                messages.extend(
-                    [
-                        m
-                        for m in client.conversations_history(
-                            channel=r["dm_channel"],
-                            inclusive=True,
-                            oldest=r["dm_ts"],
-                            limit=1,
-                        ).data["messages"]
-                    ]
-                )
-                messages.extend(
-                    [
-                        m
-                        for m in client.conversations_history(
-                            channel=settings.channel,
-                            inclusive=True,
-                            oldest=r["forwarded_ts"],
-                            limit=1,
-                        ).data["messages"]
-                    ]
-                )
-            except KeyError:
-                table.delete(full_record["id"])
-                continue
-            
-            if len(messages) < 2:
-                table.delete(full_record["id"])
+def get_backend() -> Backend:
+    match settings.db_backend:
+        case "sqlite":
+            mirror = (
+                AirtableMirror(get_table(), settings.sqlite_path)
+                if settings.airtable_mirror
+                else None
+            )
+            return SQLiteBackend(settings.sqlite_path, mirror=mirror)
+        case _:
+            return AirtableBackend(get_table())
+
+
+# A response_url can only be used 5 times, and the final summary needs one
+MAX_PROGRESS_UPDATES = 3
+
+
+class CleanupSummary(BaseModel):
+    scanned: int = 0
+    deleted: int = 0
+    errored: int = 0
+    dry_run: bool = False
+
 
-            for m in messages:
-                if m.get("subtype") == "tombstone":
-                    table.delete(full_record["id"])
-                    break
+def _message_exists(client: WebClient, channel: str, ts: str) -> bool:
+    messages = client.conversations_history(
+        channel=channel, inclusive=True, oldest=ts, latest=ts, limit=1
+    ).data["messages"]
+    return len(messages) > 0 and messages[0].get("subtype") != "tombstone"
 
 
+def _is_stale(record: dict, client: WebClient) -> bool:
+    r = record["fields"]
+    # Records missing either side of the relay were never finished
+    if not all(r.get(f) for f in ("dm_channel", "dm_ts", "forwarded_ts")):
+        return True
+    return not (
+        _message_exists(client, r["dm_channel"], r["dm_ts"])
+        and _message_exists(client, settings.channel, r["forwarded_ts"])
+    )
+
+
+@metrics.timed_db
+def clean_database(
+    client: WebClient,
+    respond: Callable[[str], Any] | None = None,
+    dry_run: bool = False,
+) -> CleanupSummary:
+    """
+    If either the DM or the forwarded message no longer exists, remove the record from the database.
+    Records are checked concurrently and deleted in batches. The checks are background Slack calls, so with a scheduling
+    client they leave room under the conversations.history limit for interactive work.
+    """
+    init_backend()
+    summary = CleanupSummary(dry_run=dry_run)
+    to_delete: list[str] = []
+    last_progress = time.monotonic()
+    progress_updates = 0
+    # A relay whose forwarded_ts is still queued would otherwise look unfinished
+    if writes:
+        writes.flush()
+
+    def flush_deletes() -> None:
+        if not dry_run and to_delete:
+            backend.batch_delete(to_delete)
+            if writes:
+                writes.discard(to_delete)
+            for record_id in to_delete:
+                cache.discard(record_id)
+        to_delete.clear()
+
+    with ratelimit.background(), ThreadPoolExecutor(
+        max_workers=settings.clean_db_workers, thread_name_prefix="clean-db"
+    ) as pool:
+        for list_of_records in backend.iterate():
+            # Submitting a page at a time bounds how many checks are queued
+            futures = {
+                # Each check carries this thread's context so the background priority applies in the pool
+                pool.submit(contextvars.copy_context().run, _is_stale, record, client): record["id"]
+                for record in list_of_records
+            }
+            for future in as_completed(futures):
+                summary.scanned += 1
+                try:
+                    stale = future.result()
+                except (SlackApiError, OSError) as e:
+                    # Slack refused the lookup or couldn't be reached, so the record is left for the next run
+                    print(f"Failed to check record {futures[future]}: {e}")
+                    summary.errored += 1
+                    continue
+                if stale:
+                    summary.deleted += 1
+                    to_delete.append(futures[future])
+            if len(to_delete) >= 10:
+                flush_deletes()
+
+            if (
+                respond
+                and progress_updates < MAX_PROGRESS_UPDATES
+                and time.monotonic() - last_progress >= settings.clean_db_progress_interval
+            ):
+                last_progress = time.monotonic()
+                progress_updates += 1
+                respond(
+                    f"Still cleaning: {summary.scanned} records checked, {summary.deleted} stale so far."
+                )
+    flush_deletes()
+    return summary
+
+
+@metrics.timed_db
 def save_forward_start(content: str, dm_ts: str, selection_ts: str, dm_channel: str) -> None:
-    global table
-    table.create(
+    init_backend()
+    record = backend.create(
         {
             "dm_ts": dm_ts,
             "content": content,
@@ -74,49 +236,195 @@ def save_forward_start(content: str, dm_ts: str, selection_ts: str, dm_channel:
             "dm_channel": dm_channel,
         }
     )
+    cache.put(record)
+    _index_ts(dm_ts, selection_ts)
+
+
+def _index_ts(*timestamps: str) -> None:
+    for ts in timestamps:
+        ts_filter.add(ts)
+    if ts_filter.enabled:
+        metrics.ts_filter_items.set(len(ts_filter.index))
+        metrics.ts_filter_false_positive_rate.set(ts_filter.index.false_positive_rate())
+
+
+def might_have_record(ts: str) -> bool:
+    """
+    False if no record has `ts` in any of its timestamp fields, without asking the database
+    """
+    if ts_filter.might_contain(ts):
+        return True
+    metrics.ts_filter_lookups.inc(result="skipped")
+    return False
+
+
+def build_ts_filter() -> None:
+    """
+    Stream every record's timestamps into the filter. Until this finishes every lookup goes to the database
+    """
+    init_backend()
+    if not ts_filter.enabled:
+        return
+    try:
+        ts_filter.build(backend.iterate(list(TS_FIELDS)), TS_FIELDS)
+    except Exception as e:  # noqa: BLE001
+        # Best effort, lookups fall back to the database
+        print(f"Failed to build the timestamp filter, lookups will all go to the database: {e}")
+        return
+    _index_ts()
+
+
+def warm() -> None:
+    """
+    Set the backend up and build the timestamp filter. Run in the background once Shroud is connected
+    """
+    init_backend()
+    build_ts_filter()
+
+
+def _find(ts: str, field: str | None = None) -> dict | None:
+    """
+    Look a record up in the backend, including updates that haven't been written yet
+    """
+    init_backend()
+    if writes is None:
+        return backend.find(ts, field=field)
+    if writes.pending_id(ts) is not None:
+        # The timestamp only exists in a queued update, so write it out first. Rare, since the cache usually has it
+        writes.flush()
+    record = backend.find(ts, field=field)
+    return None if record is None else writes.overlay(record)
 
 
+def _find_by_field(field: str, ts: str) -> dict | None:
+    record = cache.get(ts)
+    if record is not None and record["fields"].get(field) == ts:
+        return record
+    record = _find(ts, field=field)
+    if record is not None:
+        cache.put(record)
+    return record
+
+
+@metrics.timed_db
+def update_record(record_id: str, fields: dict, durable: bool = False) -> None:
+    """
+    Update a record and keep the cached copy in sync so later lookups don't see stale fields.
+    With write-behind enabled the backend write is queued and batched with others, unless it's `durable`,
+    in which case it's written (with anything queued before it) before returning
+    """
+    init_backend()
+    if writes and durable:
+        writes.write_now(record_id, fields)
+    elif writes:
+        writes.update(record_id, fields)
+    else:
+        backend.update(record_id, fields)
+    cache.update(record_id, fields)
+
+
+@metrics.timed_db
 def finish_forward(dm_ts, forwarded_ts) -> None:
-    global table
-    record = table.first(formula=match({"dm_ts": dm_ts}))
+    record = _find_by_field("dm_ts", dm_ts)
     if record is None:
         raise ValueError(f"Record with timestamp {dm_ts} not found")
-    # Empty the selection so it's harder to figure out anonymous reports if a user sends an indentifiable message
-    table.update(record["id"], {"forwarded_ts": forwarded_ts, "selection": None})
+    _index_ts(forwarded_ts)
+    # Empty the selection so it's harder to figure out anonymous reports if a user sends an indentifiable message.
+    # Durable, since the forwarding job counts this step as done once it returns
+    update_record(record["id"], {"forwarded_ts": forwarded_ts, "selection": None}, durable=True)
 
 
+@metrics.timed_db
 def save_selection(selection_ts, selection) -> None:
-    global table
-    record = table.first(formula=match({"selection_ts": selection_ts}))
+    record = _find_by_field("selection_ts", selection_ts)
     if record is None:
         raise ValueError(f"Record with timestamp {selection_ts} not found")
     
-    table.update(record["id"], {"selection": selection})
+    update_record(record["id"], {"selection": selection})
 
 
+@metrics.timed_db
 def get_message_by_ts(ts) -> dict:
-    global table
-    # https://pyairtable.readthedocs.io/en/stable/tables.html#formulas
-    # formula = OR(
-    #     match({"forwarded_ts": ts}),
-    #     match({"dm_ts": ts}),
-    #     match({"selection_ts": ts})
-    # )
-    #
-    # From the docs: "If match_any=True, expressions are grouped with OR(), record is return if any of the values match."
-    formula = match(
-        {"dm_ts": ts, "forwarded_ts": ts, "selection_ts": ts}, match_any=True
-    )
-    record = table.first(formula=formula)
+    # Cache hits never touch the backend
+    cached = cache.get(ts)
+    if cached is not None:
+        return cached
+    # Most thread and reaction timestamps aren't relays, and the filter knows without a request
+    if not might_have_record(ts):
+        return None
+    record = _find(ts)
+    if ts_filter.ready:
+        metrics.ts_filter_lookups.inc(result="found" if record is not None else "false_positive")
     if record is None:
         return None
         # raise ValueError(f"Record with timestamp {ts} not found")
+    cache.put(record)
     return record
 
 
-def main():
-    global table
-    table = get_table()
+def close() -> None:
+    """
+    Write anything still queued, then let the backend finish its own. Called on shutdown
+    """
+    if writes:
+        writes.close()
+    if backend is not None:
+        backend.close()
+
+
+def _forget(record_id: str) -> None:
+    # The cache already has the update write-behind gave up on, so it's read back from the backend next time
+    if cache is not None:
+        cache.discard(record_id)
+
+
+def _set_backend(new_backend: Backend) -> None:
+    global backend, writes
+    instrumented = metrics.InstrumentedBackend(new_backend)
+    # writes is set first so a thread that sees the backend also sees its queue
+    writes = (
+        WriteBehind(instrumented, delay=settings.write_behind_delay, on_dropped=_forget)
+        if settings.write_behind_delay > 0
+        else None
+    )
+    backend = instrumented
+
+
+def init_backend() -> Backend:
+    """
+    Create the configured backend the first time it's needed, so importing this module stays cheap on startup
+    """
+    if backend is None:
+        with _backend_lock:
+            if backend is None:
+                _set_backend(get_backend())
+    return backend
+
+
+def use_backend(new_backend: Backend) -> None:
+    """
+    Store records in `new_backend`, starting with an empty cache and write queue and a timestamp filter built from it
+    """
+    global cache, ts_filter
+    close()
+    cache = RecordCache(
+        max_size=settings.record_cache_size, ttl=settings.record_cache_ttl
+    )
+    ts_filter = _create_ts_filter()
+    with _backend_lock:
+        _set_backend(new_backend)
+    build_ts_filter()
+
+
+def _create_ts_filter() -> tsfilter.TimestampFilter:
+    return tsfilter.create(
+        settings.ts_filter,
+        capacity=settings.ts_filter_capacity,
+        fp_rate=settings.ts_filter_fp_rate,
+    )
 
 
-main()
+cache = RecordCache(
+    max_size=settings.record_cache_size, ttl=settings.record_cache_ttl
+)
+ts_filter = _create_ts_filter()
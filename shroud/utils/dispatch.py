@@ -0,0 +1,78 @@
+import asyncio
+import threading
+from collections import deque
+from collections.abc import Hashable
+from concurrent.futures import Executor, Future
+from typing import Any
+
+
+class OrderedDispatcher:
+    """
+    Runs work on an executor so that items sharing a key run one at a time in submission order, while different keys run concurrently.
+    Each key with pending work occupies at most one worker, which drains that key's queue.
+    """
+
+    def __init__(self, executor: Executor, max_pending: int):
+        self.executor = executor
+        # key -> work waiting behind the item that's currently running
+        self._queues: dict[Hashable, deque] = {}
+        self._lock = threading.Lock()
+        # Caps work held across every key so a flood still pushes back on the caller
+        self._pending = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, key: Hashable, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        self._pending.acquire()
+        with self._lock:
+            queue = self._queues.get(key)
+            start = queue is None
+            if start:
+                queue = self._queues[key] = deque()
+            queue.append((future, fn, args, kwargs))
+        if start:
+            self.executor.submit(self._drain, key)
+        return future
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(q) for q in self._queues.values())
+
+    def _drain(self, key: Hashable) -> None:
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                future, fn, args, kwargs = queue.popleft()
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:  # noqa: BLE001
+                        # Handed to whoever waits on the future, as ThreadPoolExecutor does
+                        future.set_exception(e)
+            finally:
+                self._pending.release()
+
+
+class AsyncOrderedDispatcher:
+    """
+    asyncio counterpart of OrderedDispatcher. Coroutines sharing a key run one at a time in the order run() was called
+    """
+
+    def __init__(self):
+        # key -> (lock, number of coroutines holding or waiting for it)
+        self._locks: dict[Hashable, list] = {}
+
+    async def run(self, key: Hashable, coro) -> Any:
+        # Taking a place in the lock's FIFO before the first await is what preserves order
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await coro
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
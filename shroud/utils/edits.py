@@ -0,0 +1,93 @@
+import threading
+from collections.abc import Callable
+from typing import Any
+
+from shroud import settings
+
+
+class PendingEdit:
+    __slots__ = ("final", "original", "send", "timer")
+
+    def __init__(self, original: str, final: str, send: Callable[[str, str], Any]):
+        self.original = original
+        self.final = final
+        self.send = send
+        self.timer: threading.Timer | None = None
+
+
+class EditDebouncer:
+    """
+    Holds the relay of an edited message for `window` seconds after its latest edit, so a burst of edits is relayed once,
+    from the text before the first edit to the text after the last. `send(original, final)` does the relaying
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        # (channel, ts) of the edited message -> its pending relay
+        self._pending: dict[tuple[str, str], PendingEdit] = {}
+        self._lock = threading.Lock()
+
+    def hold(self, channel: str, ts: str, original: str, final: str, send: Callable[[str, str], Any]) -> bool:
+        """
+        Hold an edit's relay, folding it into one that's already waiting. False if edits are relayed right away
+        """
+        if self.window <= 0:
+            return False
+        key = (channel, ts)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = PendingEdit(original, final, send)
+            else:
+                pending.timer.cancel()
+                pending.final = final
+                # The latest event's client and record
+                pending.send = send
+            pending.timer = threading.Timer(self.window, self._fire, (key, pending))
+            pending.timer.daemon = True
+            pending.timer.start()
+        return True
+
+    def cancel(self, channel: str, ts: str) -> bool:
+        """
+        Drop the relay waiting for a message, e.g. because it was deleted. True if there was one
+        """
+        with self._lock:
+            pending = self._pending.pop((channel, ts), None)
+        if pending is None:
+            return False
+        pending.timer.cancel()
+        return True
+
+    def _fire(self, key: tuple[str, str], pending: PendingEdit) -> None:
+        with self._lock:
+            # Replaced by a later edit or cancelled since the timer started
+            if self._pending.get(key) is not pending:
+                return
+            del self._pending[key]
+        self._send(pending)
+
+    @staticmethod
+    def _send(pending: PendingEdit) -> Any:
+        # Edited back to what it was, so there's nothing to relay
+        if pending.original == pending.final:
+            return None
+        try:
+            return pending.send(pending.original, pending.final)
+        except Exception as e:  # noqa: BLE001
+            # Runs on a timer thread, where nothing else would catch it
+            print(f"Failed to relay an edit: {e}")
+            return None
+
+    def flush(self) -> list[Any]:
+        """
+        Relay everything that's waiting now. Called on shutdown. Returns what each `send` returned
+        """
+        with self._lock:
+            pending, self._pending = list(self._pending.values()), {}
+        for edit in pending:
+            edit.timer.cancel()
+        return [self._send(edit) for edit in pending]
+
+
+debouncer = EditDebouncer(window=settings.edit_relay_window)
@@ -0,0 +1,83 @@
+import sqlite3
+import threading
+import time
+
+from shroud import settings
+
+
+def event_key(body: dict) -> str | None:
+    """
+    What identifies a request across Socket Mode connections and Slack's retries: the event id for Events API
+    payloads and the trigger id for commands, shortcuts and interactions. None for anything with neither
+    """
+    if body.get("event_id"):
+        return f"event:{body['event_id']}"
+    if body.get("trigger_id"):
+        return f"trigger:{body['trigger_id']}"
+    return None
+
+
+class EventStore:
+    """
+    Keys of requests a Socket Mode worker has taken, shared by every worker through one SQLite file.
+    Whichever worker claims a key first handles the request, and the rest ack it without running anything.
+    Keys are kept for `ttl` seconds, which only needs to outlast Slack's retries
+    """
+
+    # Seconds between deleting expired keys
+    PRUNE_INTERVAL = 60
+
+    def __init__(self, path: str, ttl: float):
+        self.ttl = ttl
+        # Listeners are acked from Bolt's threads, so the connection is shared behind a lock
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # Losing the last claims to a power cut only risks handling a retry twice
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS claimed_events (
+                    key TEXT PRIMARY KEY,
+                    worker INTEGER NOT NULL,
+                    claimed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS claimed_events_claimed_at ON claimed_events (claimed_at)"
+            )
+
+    def claim(self, key: str, worker: int) -> bool:
+        """
+        True if this worker is the first to claim `key`
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            claimed = (
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO claimed_events (key, worker, claimed_at) VALUES (?, ?, ?)",
+                    (key, worker, now),
+                ).rowcount
+                == 1
+            )
+            if now >= self._next_prune:
+                self._next_prune = now + self.PRUNE_INTERVAL
+                self._conn.execute(
+                    "DELETE FROM claimed_events WHERE claimed_at < ?", (now - self.ttl,)
+                )
+        return claimed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# Only needed when several workers share the app's Socket Mode connections
+store = (
+    EventStore(settings.event_store_path, ttl=settings.event_store_ttl)
+    if settings.socket_workers > 1
+    else None
+)
@@ -0,0 +1,168 @@
+"""
+Relaying files shared in a relay. Each file is streamed from Slack's url_private_download straight into an upload URL
+from files.getUploadURLExternal, `file_relay_chunk_size` bytes at a time, so no file is ever held in memory whole.
+files_upload_v2 reads the whole file before uploading it, which is why its steps are done here instead.
+Copies run on their own pool, not the listener's, so a large file doesn't hold up other relays while it copies
+"""
+
+import threading
+import urllib.request
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from pydantic import BaseModel
+from slack_sdk import WebClient
+
+from shroud import settings
+
+# Seconds a download or upload may go without any progress
+TIMEOUT = 60
+
+
+class FileRelayError(Exception):
+    pass
+
+
+class RelayResult(BaseModel):
+    relayed: list[str] = []
+    # File name -> why it wasn't relayed
+    skipped: dict[str, str] = {}
+
+
+def enabled() -> bool:
+    return settings.file_relay_max_size > 0
+
+
+def format_size(size: int) -> str:
+    return f"{size / 1024 / 1024:.0f} MB"
+
+
+def _chunks(download, length: int, chunk_size: int) -> Iterator[bytes]:
+    sent = 0
+    while chunk := download.read(chunk_size):
+        sent += len(chunk)
+        if sent > length:
+            raise FileRelayError(f"got more than the {length} bytes expected")
+        yield chunk
+    if sent < length:
+        raise FileRelayError(f"got {sent} of {length} bytes")
+
+
+def transfer(file: dict, client: WebClient) -> str:
+    """
+    Copy a file into a new upload. Returns the new file's id, ready for files.completeUploadExternal
+    """
+    request = urllib.request.Request(
+        file["url_private_download"], headers={"Authorization": f"Bearer {client.token}"}
+    )
+    with urllib.request.urlopen(request, timeout=TIMEOUT) as download:
+        # Slack answers with its sign-in page rather than an error when the token can't read files
+        if download.headers.get_content_type() == "text/html" and file.get("mimetype") != "text/html":
+            raise FileRelayError("Slack didn't send the file. Does the app have the files:read scope?")
+        length = int(download.headers.get("Content-Length") or file["size"])
+        if length > settings.file_relay_max_size:
+            raise FileRelayError(f"it's over {format_size(settings.file_relay_max_size)}")
+        upload = client.files_getUploadURLExternal(filename=file.get("name") or file["id"], length=length)
+        request = urllib.request.Request(
+            upload["upload_url"],
+            data=_chunks(download, length, settings.file_relay_chunk_size),
+            method="POST",
+            headers={"Content-Length": str(length), "Content-Type": "application/octet-stream"},
+        )
+        with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+            response.read()
+    return upload["file_id"]
+
+
+def _file_info(file: dict, client: WebClient) -> dict:
+    # Events can leave out everything but the id, see https://api.slack.com/events/message/file_share
+    if file.get("url_private_download") or file.get("file_access") != "check_file_info":
+        return file
+    return client.files_info(file=file["id"])["file"]
+
+
+def start_relay(files: list[dict], channel: str, thread_ts: str, client: WebClient) -> "Future[RelayResult]":
+    """
+    Share copies of `files` in a thread, as one message. Files over the size caps, or that fail to copy, are left out.
+    Only the checks run on the calling thread. The copies run on `transfers`, and the last to finish shares them
+    """
+    result = RelayResult()
+    to_copy: list[dict] = []
+    total = 0
+    for file in files:
+        file = _file_info(file, client)
+        name = file.get("name") or file["id"]
+        size = file.get("size") or 0
+        if not file.get("url_private_download"):
+            # External files, and ones hidden or deleted by the time the event arrived
+            result.skipped[name] = "it can't be downloaded"
+        elif size > settings.file_relay_max_size:
+            result.skipped[name] = f"it's over {format_size(settings.file_relay_max_size)}"
+        elif total + size > settings.file_relay_max_total:
+            result.skipped[name] = f"the files in the message add up to over {format_size(settings.file_relay_max_total)}"
+        else:
+            total += size
+            to_copy.append(file)
+
+    done: Future[RelayResult] = Future()
+    futures = [(file, transfers.submit(transfer, file, client)) for file in to_copy]
+    remaining = len(futures)
+    lock = threading.Lock()
+
+    def share() -> None:
+        uploaded = []
+        for file, future in futures:
+            name = file.get("name") or file["id"]
+            try:
+                uploaded.append({"id": future.result(), "title": file.get("title") or name})
+                result.relayed.append(name)
+            except Exception as e:  # noqa: BLE001
+                # Whatever the copy raised, the other files are still shared
+                print(f"Failed to relay file {file['id']}: {e}")
+                result.skipped[name] = str(e) if isinstance(e, FileRelayError) else "copying it failed"
+        if uploaded:
+            try:
+                client.files_completeUploadExternal(files=uploaded, channel_id=channel, thread_ts=thread_ts)
+            except Exception as e:  # noqa: BLE001
+                # `done` must still be resolved, or the notice would never be sent
+                print(f"Failed to share relayed files: {e}")
+                for name in result.relayed:
+                    result.skipped[name] = "sharing it failed"
+                result.relayed = []
+        done.set_result(result)
+
+    def copied(_: Future) -> None:
+        nonlocal remaining
+        with lock:
+            remaining -= 1
+            if remaining:
+                return
+        share()
+
+    if not futures:
+        share()
+    for _, future in futures:
+        future.add_done_callback(copied)
+    return done
+
+
+def relay(files: list[dict], channel: str, thread_ts: str, client: WebClient) -> RelayResult:
+    """
+    start_relay, waiting for the files to be shared
+    """
+    return start_relay(files, channel, thread_ts, client).result()
+
+
+def skipped_notice(result: RelayResult) -> str | None:
+    """
+    What to tell whoever shared the files about the ones that weren't relayed
+    """
+    if not result.skipped:
+        return None
+    return "These files were not forwarded:\n" + "\n".join(
+        f"• `{name}`: {reason}" for name, reason in result.skipped.items()
+    )
+
+
+# Bounds the transfers running at once across every relay
+transfers = ThreadPoolExecutor(max_workers=settings.file_relay_concurrency, thread_name_prefix="file-relay")
@@ -0,0 +1,312 @@
+import contextlib
+import functools
+import threading
+import time
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from shroud.utils.storage import Backend
+
+# Seconds. Slack calls usually land in the tens of milliseconds and Airtable requests in the hundreds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key: tuple[str, ...], value) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # Per-bucket counts (not cumulative), then sum and count
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _render_value(self, key: tuple[str, ...], value) -> list[str]:
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            le = f'le="{bound}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+        le = 'le="+Inf"'
+        lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+REGISTRY: list[_Metric] = []
+
+listener_seconds = Histogram(
+    "shroud_listener_duration_seconds",
+    "Time spent running a listener after it was acked",
+    ("handler", "subtype"),
+)
+listener_errors = Counter(
+    "shroud_listener_errors_total",
+    "Listener runs that raised",
+    ("handler", "subtype"),
+)
+listeners_in_flight = Gauge(
+    "shroud_listeners_in_flight", "Listeners currently running", ("handler",)
+)
+slack_seconds = Histogram(
+    "shroud_slack_api_duration_seconds",
+    "Time Slack took to answer a Web API call, excluding rate limit waits",
+    ("method",),
+)
+slack_wait_seconds = Counter(
+    "shroud_slack_api_wait_seconds_total",
+    "Time Web API calls spent waiting for the rate limit scheduler",
+    ("method",),
+)
+slack_errors = Counter(
+    "shroud_slack_api_errors_total",
+    "Web API calls that failed, by Slack's error code",
+    ("method", "error"),
+)
+slack_in_flight = Gauge(
+    "shroud_slack_api_in_flight", "Web API calls waiting on Slack", ("method",)
+)
+db_seconds = Histogram(
+    "shroud_db_operation_duration_seconds",
+    "Time spent in a shroud.utils.db operation, including cache hits",
+    ("operation",),
+)
+db_errors = Counter(
+    "shroud_db_operation_errors_total", "db operations that raised", ("operation",)
+)
+backend_seconds = Histogram(
+    "shroud_backend_request_duration_seconds",
+    "Time the record backend (Airtable or SQLite) took to answer a request",
+    ("backend", "operation"),
+)
+backend_errors = Counter(
+    "shroud_backend_request_errors_total",
+    "Backend requests that raised",
+    ("backend", "operation"),
+)
+backend_in_flight = Gauge(
+    "shroud_backend_requests_in_flight", "Backend requests waiting on a response", ("backend",)
+)
+
+ts_filter_lookups = Counter(
+    "shroud_ts_filter_lookups_total",
+    "Record lookups checked against the timestamp filter. skipped never reached the database, false_positive did and found nothing",
+    ("result",),
+)
+ts_filter_items = Gauge("shroud_ts_filter_items", "Timestamps added to the timestamp filter")
+ts_filter_false_positive_rate = Gauge(
+    "shroud_ts_filter_false_positive_rate",
+    "Estimated chance that the timestamp filter lets an unknown timestamp through to the database",
+)
+
+socket_requests = Counter(
+    "shroud_socket_requests_total",
+    "Requests a Socket Mode worker received. duplicate ones had already been claimed, by another worker or an earlier delivery",
+    ("worker", "result"),
+)
+
+
+@contextlib.contextmanager
+def timed(histogram: Histogram, errors: Counter, in_flight: Gauge | None = None, **labels: str):
+    """
+    Observe how long the block takes, counting it as an error if it raises
+    """
+    if in_flight is not None:
+        in_flight.inc(**labels)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        errors.inc(**labels)
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+        if in_flight is not None:
+            in_flight.dec(**labels)
+
+
+def timed_db(func):
+    """
+    Decorator for shroud.utils.db operations
+    """
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        with timed(db_seconds, db_errors, operation=func.__name__):
+            return func(*args, **kwargs)
+
+    return run
+
+
+def listener_subtype(kwargs: dict) -> str:
+    """
+    Label a listener run with the event subtype, action or command it handled
+    """
+    if "event" in kwargs:
+        return kwargs["event"].get("subtype") or kwargs["event"].get("type", "")
+    if "body" in kwargs and kwargs["body"].get("actions"):
+        return kwargs["body"]["actions"][0].get("action_id", "")
+    if "command" in kwargs:
+        return kwargs["command"].get("command", "")
+    return ""
+
+
+class InstrumentedBackend(Backend):
+    """
+    Times every request made to the wrapped backend
+    """
+
+    def __init__(self, backend: Backend):
+        self.backend = backend
+        self.name = type(backend).__name__
+
+    def _timed(self, operation: str):
+        return timed(
+            backend_seconds,
+            backend_errors,
+            backend_in_flight,
+            backend=self.name,
+            operation=operation,
+        )
+
+    def _call(self, operation: str, *args):
+        with self._timed(operation):
+            return getattr(self.backend, operation)(*args)
+
+    def create(self, fields: dict) -> dict:
+        return self._call("create", fields)
+
+    def find(self, ts: str, field: str | None = None) -> dict | None:
+        return self._call("find", ts, field)
+
+    def update(self, record_id: str, fields: dict) -> None:
+        self._call("update", record_id, fields)
+
+    def batch_update(self, records: list[dict]) -> None:
+        self._call("batch_update", records)
+
+    def delete(self, record_id: str) -> None:
+        self._call("delete", record_id)
+
+    def batch_delete(self, record_ids: list[str]) -> None:
+        self._call("batch_delete", record_ids)
+
+    def iterate(self, fields: list[str] | None = None, after: dict | None = None) -> Iterator[list[dict]]:
+        pages = self.backend.iterate(fields, after)
+        while True:
+            # Each page is a separate request
+            with self._timed("iterate"):
+                page = next(pages, None)
+            if page is None:
+                return
+            yield page
+
+    def close(self) -> None:
+        self.backend.close()
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown out everything else
+        pass
+
+
+def serve(host: str, port: int) -> ThreadingHTTPServer:
+    """
+    Serve /metrics in Prometheus' text format on a background thread
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
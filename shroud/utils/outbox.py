@@ -0,0 +1,264 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+from slack_sdk import WebClient
+
+from shroud import settings
+
+
+class Job:
+    """
+    One run of a job kind. `results` collects what each finished step returned, so later steps (and replays) can use it
+    """
+
+    def __init__(self, id: str, kind: str, payload: dict, results: dict, created_at: float, client: WebClient):
+        self.id = id
+        self.kind = kind
+        self.payload = payload
+        self.results = results
+        self.created_at = created_at
+        self.client = client
+        self.done: set[str] = set()
+        self.started: set[str] = set()
+        self.running: set[str] = set()
+        # Given up on until the next start
+        self.failed: set[str] = set()
+        self.attempts: dict[str, int] = {}
+        self.futures: dict[str, Future] = {}
+        self.lock = threading.Lock()
+
+    def wait(self, step: str, timeout: float | None = None) -> None:
+        """
+        Block until `step` has finished, raising its error if it was given up on
+        """
+        self.futures[step].result(timeout)
+
+
+# A step gets the job and whether it was already started by a run that didn't finish it, and returns results for later steps
+Step = Callable[[Job, bool], dict | None]
+
+
+class Outbox:
+    """
+    Durable, pipelined multi-step work. A job is written to SQLite before any of its steps run, and each step is recorded
+    once it's done, so jobs a crash interrupted are picked up again by `start`. Every step runs on the pool as soon as the
+    steps it depends on are done, and may run more than once, so steps have to be idempotent
+    """
+
+    def __init__(self, path: str, workers: int, max_attempts: int):
+        self.max_attempts = max_attempts
+        # kind -> step -> (steps it waits for, function)
+        self.kinds: dict[str, dict[str, tuple[tuple[str, ...], Step]]] = {}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="outbox")
+        self._jobs: dict[str, Job] = {}
+        self._closed = False
+        self._path = path
+        # Steps run on the pool, so the connection is shared behind a lock
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def _db(self) -> sqlite3.Connection:
+        """
+        Open the database the first time it's needed, so importing this module doesn't create the file
+        """
+        # Called with _lock held
+        if self._conn is None:
+            conn = sqlite3.connect(self._path, check_same_thread=False)
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        kind TEXT NOT NULL,
+                        payload TEXT NOT NULL,
+                        results TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )
+                    """
+                )
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS steps (
+                        job_id TEXT NOT NULL,
+                        step TEXT NOT NULL,
+                        done INTEGER NOT NULL,
+                        PRIMARY KEY (job_id, step)
+                    )
+                    """
+                )
+            self._conn = conn
+        return self._conn
+
+    def register(self, kind: str, steps: dict[str, tuple[tuple[str, ...], Step]]) -> None:
+        self.kinds[kind] = steps
+
+    def submit(self, kind: str, payload: dict[str, Any], client: WebClient) -> Job:
+        """
+        Record a job and start running it. Returns once the job is on disk
+        """
+        job = Job(uuid.uuid4().hex, kind, payload, {}, time.time(), client)
+        with self._lock, self._db() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload, results, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job.id, kind, json.dumps(payload), "{}", job.created_at),
+            )
+        self._add(job)
+        return job
+
+    def start(self, client: WebClient) -> int:
+        """
+        Pick up the jobs a previous run left unfinished. Returns how many there were
+        """
+        with self._lock:
+            conn = self._db()
+            rows = conn.execute("SELECT id, kind, payload, results, created_at FROM jobs").fetchall()
+            steps = conn.execute("SELECT job_id, step, done FROM steps").fetchall()
+        jobs = {}
+        for id, kind, payload, results, created_at in rows:
+            if id in self._jobs or kind not in self.kinds:
+                continue
+            jobs[id] = Job(id, kind, json.loads(payload), json.loads(results), created_at, client)
+        for job_id, step, done in steps:
+            if job_id in jobs:
+                (jobs[job_id].done if done else jobs[job_id].started).add(step)
+        for job in jobs.values():
+            print(f"Resuming {job.kind} job {job.id} after {', '.join(sorted(job.done)) or 'no steps'}")
+            self._add(job)
+        return len(jobs)
+
+    def _add(self, job: Job) -> None:
+        steps = self.kinds[job.kind]
+        for step in steps:
+            job.futures[step] = Future()
+            if step in job.done:
+                job.futures[step].set_result(None)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._advance(job)
+
+    def _advance(self, job: Job) -> None:
+        steps = self.kinds[job.kind]
+        with job.lock:
+            if len(job.done) == len(steps):
+                ready = []
+            else:
+                ready = [
+                    step
+                    for step, (after, _) in steps.items()
+                    if step not in job.done
+                    and step not in job.running
+                    and step not in job.failed
+                    and all(dependency in job.done for dependency in after)
+                ]
+                job.running.update(ready)
+        if len(job.done) == len(steps):
+            self._finish(job)
+            return
+        if self._closed:
+            return
+        for step in ready:
+            self._pool.submit(self._run, job, step)
+
+    def _run(self, job: Job, step: str) -> None:
+        _, func = self.kinds[job.kind][step]
+        replay = step in job.started
+        if not replay:
+            # Recorded before the step runs, so a replay knows it may have got partway
+            with self._lock, self._db() as conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO steps (job_id, step, done) VALUES (?, ?, 0)", (job.id, step)
+                )
+            job.started.add(step)
+        job.attempts[step] = job.attempts.get(step, 0) + 1
+        try:
+            result = func(job, replay) or {}
+        except Exception as e:  # noqa: BLE001
+            # Retried with backoff, or given up on until restart
+            with job.lock:
+                job.running.discard(step)
+                if job.attempts[step] >= self.max_attempts:
+                    job.failed.add(step)
+            if step in job.failed:
+                print(f"Giving up on {step} of {job.kind} job {job.id} until restart: {e}")
+                # Nothing waiting on this step or anything after it should wait forever
+                for blocked in self._blocked_by(job.kind, step):
+                    job.futures[blocked].set_exception(e)
+                return
+            delay = min(60, 2 ** job.attempts[step])
+            print(f"Failed {step} of {job.kind} job {job.id}, retrying in {delay}s: {e}")
+            timer = threading.Timer(delay, self._advance, (job,))
+            timer.daemon = True
+            timer.start()
+            return
+        with job.lock:
+            job.results.update(result)
+            results = json.dumps(job.results)
+        with self._lock, self._db() as conn:
+            conn.execute("UPDATE jobs SET results = ? WHERE id = ?", (results, job.id))
+            conn.execute(
+                "UPDATE steps SET done = 1 WHERE job_id = ? AND step = ?", (job.id, step)
+            )
+        with job.lock:
+            job.done.add(step)
+            job.running.discard(step)
+        job.futures[step].set_result(None)
+        self._advance(job)
+
+    def _blocked_by(self, kind: str, step: str) -> set[str]:
+        steps = self.kinds[kind]
+        blocked = {step}
+        while True:
+            more = {name for name, (after, _) in steps.items() if name not in blocked and blocked.intersection(after)}
+            if not more:
+                return blocked
+            blocked |= more
+
+    def _finish(self, job: Job) -> None:
+        with self._lock:
+            if self._jobs.pop(job.id, None) is None:
+                return
+            with self._db() as conn:
+                # Payloads can hold report text, so nothing is kept once it's been forwarded
+                conn.execute("DELETE FROM steps WHERE job_id = ?", (job.id,))
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job.id,))
+            self._idle.notify_all()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        """
+        Block until every job has finished
+        """
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._jobs, timeout=timeout)
+
+    def close(self) -> None:
+        """
+        Let running steps finish. Anything left is resumed by the next `start`
+        """
+        self._closed = True
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+
+
+def _path() -> str:
+    # Workers each replay their own jobs, see socket_workers
+    if not settings.socket_worker_id:
+        return settings.outbox_path
+    stem, dot, suffix = settings.outbox_path.rpartition(".")
+    return f"{stem}-{settings.socket_worker_id}.{suffix}" if dot else f"{settings.outbox_path}-{settings.socket_worker_id}"
+
+
+outbox = Outbox(_path(), workers=settings.outbox_workers, max_attempts=settings.outbox_max_attempts)
@@ -0,0 +1,252 @@
+import asyncio
+import contextlib
+import contextvars
+import threading
+import time
+from enum import Enum
+
+from pydantic import BaseModel
+
+# https://api.slack.com/apis/rate-limits
+# Requests per minute for each Web API tier
+TIER_LIMITS = {
+    1: 1,
+    2: 20,
+    3: 50,
+    4: 100,
+}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `rate` tokens are added per second, up to `capacity`
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        # Set after a 429 so nothing is sent until Slack's Retry-After has passed
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_tier(cls, tier: int, share: int = 1) -> "TokenBucket":
+        """
+        A bucket for 1/`share` of a tier's limit, for when `share` processes split it
+        """
+        per_minute = TIER_LIMITS[tier] / share
+        # Slack tolerates short bursts, so allow a few seconds' worth at once
+        return cls(rate=per_minute / 60, capacity=max(1, per_minute / 10))
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def _wait_time(self, tokens: float, reserve: float) -> float:
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._refill()
+        if self._tokens - tokens >= reserve:
+            return 0.0
+        return (tokens + reserve - self._tokens) / self.rate
+
+    @property
+    def idle(self) -> bool:
+        """
+        Full and not paused, so the same as a new bucket
+        """
+        with self._lock:
+            self._refill()
+            return self._tokens >= self.capacity and time.monotonic() >= self._paused_until
+
+    def wait_time(self, tokens: float = 1, reserve: float = 0) -> float:
+        with self._lock:
+            return self._wait_time(tokens, reserve)
+
+    def try_acquire(self, tokens: float = 1, reserve: float = 0) -> bool:
+        with self._lock:
+            if self._wait_time(tokens, reserve) > 0:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def acquire(self, tokens: float = 1, reserve: float = 0) -> float:
+        """
+        Block until `tokens` are available and take them, leaving at least `reserve` behind. Returns how long the caller waited
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                wait = self._wait_time(tokens, reserve)
+                if wait <= 0:
+                    self._tokens -= tokens
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._tokens = 0
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# https://api.slack.com/methods, for the methods Shroud calls. Anything missing is assumed to be Tier 3
+METHOD_TIERS = {
+    "auth.test": 4,
+    "chat.delete": 3,
+    "chat.getPermalink": 4,
+    "chat.postEphemeral": 4,
+    "chat.update": 3,
+    "conversations.create": 2,
+    "conversations.history": 3,
+    "conversations.info": 3,
+    "conversations.invite": 3,
+    "conversations.list": 2,
+    "conversations.members": 4,
+    "conversations.replies": 3,
+    "files.completeUploadExternal": 4,
+    "files.getUploadURLExternal": 4,
+    "files.info": 4,
+    "reactions.add": 3,
+    "reactions.get": 3,
+    "reactions.remove": 2,
+    "users.info": 4,
+}
+# chat.postMessage is limited per channel rather than by tier
+POST_MESSAGE_PER_SECOND = 1
+# Seconds between sweeps for chat.postMessage buckets that are idle, so one isn't kept for every channel ever posted to
+IDLE_SWEEP_INTERVAL = 60
+
+
+class Priority(str, Enum):
+    interactive = "interactive"
+    background = "background"
+
+
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    "slack_priority", default=Priority.interactive
+)
+
+
+@contextlib.contextmanager
+def background():
+    """
+    Mark Slack calls made inside this block as background work, which leaves part of every bucket for interactive replies.
+    Threads don't inherit context variables, so work handed to a pool should be run with contextvars.copy_context().run
+    """
+    token = _priority.set(Priority.background)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class MethodStats(BaseModel):
+    calls: int = 0
+    # Calls that had to wait for a token
+    delayed: int = 0
+    wait_seconds: float = 0.0
+    # Calls made with less than a fifth of the bucket left
+    near_limit: int = 0
+    # 429 responses from Slack
+    throttled: int = 0
+
+
+class SlackScheduler:
+    """
+    Token buckets for every Slack Web API method, shared by all clients so the whole app stays under Slack's limits.
+    Slack's limits are per app, so with `workers` processes each one's scheduler gets 1/`workers` of every limit
+    """
+
+    def __init__(self, background_reserve: float, workers: int = 1):
+        # Fraction of each bucket that background calls leave for interactive ones
+        self.background_reserve = background_reserve
+        self.workers = workers
+        # Turned off by the benchmark, which talks to a fake Slack
+        self.enabled = True
+        self._buckets: dict[tuple[str, str | None], TokenBucket] = {}
+        self._stats: dict[str, MethodStats] = {}
+        self._swept = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _sweep(self) -> None:
+        # Called with the lock held. An idle bucket is dropped rather than kept full, since a new one starts the same way
+        self._swept = time.monotonic()
+        for key in [key for key, bucket in self._buckets.items() if key[1] is not None and bucket.idle]:
+            del self._buckets[key]
+
+    def _bucket(self, method: str, channel: str | None) -> TokenBucket:
+        key = (method, channel if method == "chat.postMessage" else None)
+        with self._lock:
+            if time.monotonic() - self._swept > IDLE_SWEEP_INTERVAL:
+                self._sweep()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if method == "chat.postMessage":
+                    # Slack allows short bursts over 1/s per channel
+                    rate = POST_MESSAGE_PER_SECOND / self.workers
+                    bucket = TokenBucket(rate=rate, capacity=max(1, 3 * rate))
+                else:
+                    bucket = TokenBucket.for_tier(METHOD_TIERS.get(method, 3), share=self.workers)
+                self._buckets[key] = bucket
+            if method not in self._stats:
+                self._stats[method] = MethodStats()
+            return bucket
+
+    def _reserve(self, bucket: TokenBucket) -> float:
+        if _priority.get() == Priority.background:
+            return bucket.capacity * self.background_reserve
+        return 0
+
+    def _record(self, method: str, bucket: TokenBucket, waited: float) -> None:
+        near_limit = bucket.tokens < bucket.capacity / 5
+        with self._lock:
+            stats = self._stats[method]
+            stats.calls += 1
+            stats.wait_seconds += waited
+            if waited > 0:
+                stats.delayed += 1
+            if near_limit:
+                stats.near_limit += 1
+
+    def acquire(self, method: str, channel: str | None = None) -> float:
+        if not self.enabled:
+            return 0.0
+        bucket = self._bucket(method, channel)
+        waited = bucket.acquire(reserve=self._reserve(bucket))
+        self._record(method, bucket, waited)
+        return waited
+
+    async def acquire_async(self, method: str, channel: str | None = None) -> float:
+        if not self.enabled:
+            return 0.0
+        bucket = self._bucket(method, channel)
+        reserve = self._reserve(bucket)
+        waited = 0.0
+        while not bucket.try_acquire(reserve=reserve):
+            wait = bucket.wait_time(reserve=reserve)
+            await asyncio.sleep(wait)
+            waited += wait
+        self._record(method, bucket, waited)
+        return waited
+
+    def throttled(self, method: str, channel: str | None, retry_after: float) -> None:
+        self._bucket(method, channel).pause(retry_after)
+        with self._lock:
+            self._stats[method].throttled += 1
+
+    def stats(self) -> dict[str, MethodStats]:
+        with self._lock:
+            return {m: s.model_copy() for m, s in self._stats.items()}
@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+
+from shroud import settings
+
+# Reactions that mark a forwarded report as handled
+RESOLVING_REACTIONS = ("white_check_mark", "x")
+
+
+class MessageReactions:
+    __slots__ = ("hourglass", "resolvers")
+
+    def __init__(self, hourglass: bool, resolvers: set[tuple[str, str]]):
+        self.hourglass = hourglass
+        # (user, reaction) for every resolving reaction on the message
+        self.resolvers = resolvers
+
+
+class ReactionTracker:
+    """
+    Whether each forwarded message has :hourglass: and who has resolved it, kept from reaction events so handlers
+    only call Slack when :hourglass: actually has to come or go.
+    Messages Shroud hasn't seen yet (forwarded before a restart, or evicted) are seeded once from reactions.get
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        # (channel, ts) -> state, least recently used first
+        self._messages: OrderedDict[tuple[str, str], MessageReactions] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, channel: str, ts: str) -> MessageReactions | None:
+        with self._lock:
+            state = self._messages.get((channel, ts))
+            if state is not None:
+                self._messages.move_to_end((channel, ts))
+            return state
+
+    def seed(self, channel: str, ts: str, hourglass: bool, resolvers: set[tuple[str, str]] | None = None) -> MessageReactions:
+        # Returned even if it's evicted straight away, so the caller can still act on it
+        state = MessageReactions(hourglass, resolvers or set())
+        with self._lock:
+            self._messages[(channel, ts)] = state
+            self._messages.move_to_end((channel, ts))
+            while len(self._messages) > max(self.max_size, 0):
+                self._messages.popitem(last=False)
+        return state
+
+    def seed_from_message(self, channel: str, ts: str, message: dict) -> MessageReactions:
+        """
+        Seed from a message as reactions.get returns it (with full=True, so every user is listed)
+        """
+        reactions = message.get("reactions", [])
+        return self.seed(
+            channel,
+            ts,
+            hourglass=any(r["name"] == "hourglass" for r in reactions),
+            resolvers={
+                (user, r["name"])
+                for r in reactions
+                if r["name"] in RESOLVING_REACTIONS
+                for user in r.get("users", [])
+            },
+        )
+
+    def resolve(self, state: MessageReactions, user: str, reaction: str) -> bool:
+        """
+        Record a resolving reaction. True if :hourglass: needs removing
+        """
+        with self._lock:
+            state.resolvers.add((user, reaction))
+            if not state.hourglass:
+                return False
+            state.hourglass = False
+            return True
+
+    def unresolve(self, state: MessageReactions, user: str, reaction: str) -> bool:
+        """
+        Record a resolving reaction being removed. True if that was the last one and :hourglass: needs adding back
+        """
+        with self._lock:
+            state.resolvers.discard((user, reaction))
+            if state.resolvers or state.hourglass:
+                return False
+            state.hourglass = True
+            return True
+
+    def set_hourglass(self, state: MessageReactions, present: bool) -> None:
+        """
+        Correct the state after a reactions.add or reactions.remove didn't go through
+        """
+        with self._lock:
+            state.hourglass = present
+
+
+tracker = ReactionTracker(max_size=settings.reaction_state_size)
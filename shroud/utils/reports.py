@@ -0,0 +1,54 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from pydantic import BaseModel
+
+from shroud import settings
+
+
+class ReportContent(BaseModel):
+    text: str
+    attachments: list[Any] = []
+
+
+class ReportStore:
+    """
+    Text and attachments of reports waiting to be submitted, captured from the DM and kept current with its edits
+    so submitting doesn't have to read the DM back from Slack
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        # (dm channel, dm ts) -> (expiry, content), least recently used first
+        self._reports: OrderedDict[tuple[str, str], tuple[float, ReportContent]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, channel: str, ts: str, text: str, attachments: list[Any] | None = None) -> None:
+        if self.max_size <= 0:
+            return
+        content = ReportContent(text=text, attachments=attachments or [])
+        with self._lock:
+            self._reports[(channel, ts)] = (time.monotonic() + self.ttl, content)
+            self._reports.move_to_end((channel, ts))
+            while len(self._reports) > self.max_size:
+                self._reports.popitem(last=False)
+
+    def get(self, channel: str, ts: str) -> ReportContent | None:
+        with self._lock:
+            cached = self._reports.get((channel, ts))
+            if cached is None:
+                return None
+            if cached[0] < time.monotonic():
+                del self._reports[(channel, ts)]
+                return None
+            return cached[1]
+
+    def discard(self, channel: str, ts: str) -> None:
+        with self._lock:
+            self._reports.pop((channel, ts), None)
+
+
+store = ReportStore(max_size=settings.report_store_size, ttl=settings.report_store_ttl)
@@ -0,0 +1,313 @@
+"""
+Response time analytics for /shroud-stats. Every forward, first reply and resolution updates per-week histograms of
+seconds as it happens, so a summary only reads those histograms, never every report
+"""
+
+import contextlib
+import datetime
+import math
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+
+from pydantic import BaseModel
+
+from shroud import settings
+
+# Histogram buckets are within this much of the timings they hold, so percentiles are too
+RELATIVE_ACCURACY = 0.02
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+METRICS = ("reply", "resolve")
+
+
+def bucket_of(seconds: float) -> int:
+    # Everything under a second shares a bucket
+    return max(0, math.ceil(math.log(max(seconds, 1)) / _LOG_GAMMA))
+
+
+def bucket_value(bucket: int) -> float:
+    return 2 * _GAMMA**bucket / (_GAMMA + 1)
+
+
+def week_of(ts: str) -> str:
+    """
+    The Monday (UTC) of the week a Slack timestamp falls in
+    """
+    day = datetime.datetime.fromtimestamp(float(ts), tz=datetime.UTC).date()
+    return (day - datetime.timedelta(days=day.weekday())).isoformat()
+
+
+def percentile(counts: list[tuple[int, int]], p: float) -> float | None:
+    """
+    Nearest-rank percentile of (bucket, count) pairs sorted by bucket
+    """
+    total = sum(count for _, count in counts)
+    if total <= 0:
+        return None
+    rank = max(1, math.ceil(p / 100 * total))
+    seen = 0
+    for bucket, count in counts:
+        seen += count
+        if seen >= rank:
+            return bucket_value(bucket)
+    return bucket_value(counts[-1][0])
+
+
+class Timings(BaseModel):
+    count: int
+    p50: float | None
+    p90: float | None
+    p99: float | None
+
+
+class WeekSummary(BaseModel):
+    week: str
+    forwarded: int
+    reply_p50: float | None
+    resolve_p50: float | None
+
+
+class Summary(BaseModel):
+    forwarded: int
+    open: int
+    reply: Timings
+    resolve: Timings
+    weeks: list[WeekSummary]
+
+
+class StatsStore:
+    """
+    Timings in seconds per forwarded report, with histograms and counters kept up to date alongside them.
+    Reports forwarded before the store existed are picked up when they're replied to or resolved, but never count as open
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        """
+        Open the database the first time it's needed, so importing this module doesn't create the file
+        """
+        # Called with _lock held
+        if self._conn is not None:
+            return self._conn
+        # Commits are explicit so read-modify-writes hold the lock, since socket_workers share the file
+        conn = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS reports (
+                forwarded_ts TEXT PRIMARY KEY,
+                week TEXT NOT NULL,
+                reply_seconds REAL,
+                resolve_seconds REAL,
+                counted_open INTEGER NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS histograms (
+                metric TEXT NOT NULL,
+                week TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (metric, week, bucket)
+            )
+            """
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS weeks (week TEXT PRIMARY KEY, forwarded INTEGER NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        conn.execute("COMMIT")
+        self._conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            conn = self._db()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _count(conn: sqlite3.Connection, metric: str, week: str, seconds: float, amount: int) -> None:
+        conn.execute(
+            """
+            INSERT INTO histograms (metric, week, bucket, count) VALUES (?, ?, ?, ?)
+            ON CONFLICT (metric, week, bucket) DO UPDATE SET count = count + excluded.count
+            """,
+            (metric, week, bucket_of(seconds), amount),
+        )
+
+    @staticmethod
+    def _add_open(conn: sqlite3.Connection, amount: int) -> None:
+        conn.execute(
+            """
+            INSERT INTO counters (name, value) VALUES ('open', ?)
+            ON CONFLICT (name) DO UPDATE SET value = value + excluded.value
+            """,
+            (amount,),
+        )
+
+    @staticmethod
+    def _report(conn: sqlite3.Connection, forwarded_ts: str) -> tuple[str, float | None, float | None, int]:
+        row = conn.execute(
+            "SELECT week, reply_seconds, resolve_seconds, counted_open FROM reports WHERE forwarded_ts = ?",
+            (forwarded_ts,),
+        ).fetchone()
+        if row is not None:
+            return row
+        week = week_of(forwarded_ts)
+        conn.execute(
+            "INSERT INTO reports (forwarded_ts, week, counted_open) VALUES (?, ?, 0)", (forwarded_ts, week)
+        )
+        return week, None, None, 0
+
+    def forwarded(self, forwarded_ts: str) -> None:
+        week = week_of(forwarded_ts)
+        with self._transaction() as conn:
+            if conn.execute(
+                "INSERT OR IGNORE INTO reports (forwarded_ts, week, counted_open) VALUES (?, ?, 1)",
+                (forwarded_ts, week),
+            ).rowcount == 0:
+                return
+            conn.execute(
+                """
+                INSERT INTO weeks (week, forwarded) VALUES (?, 1)
+                ON CONFLICT (week) DO UPDATE SET forwarded = forwarded + 1
+                """,
+                (week,),
+            )
+            self._add_open(conn, 1)
+
+    def replied(self, forwarded_ts: str, reply_ts: str) -> None:
+        """
+        Record the first reply. Later ones are ignored
+        """
+        seconds = max(0.0, float(reply_ts) - float(forwarded_ts))
+        with self._transaction() as conn:
+            week, reply_seconds, _, _ = self._report(conn, forwarded_ts)
+            if reply_seconds is not None:
+                return
+            conn.execute(
+                "UPDATE reports SET reply_seconds = ? WHERE forwarded_ts = ?", (seconds, forwarded_ts)
+            )
+            self._count(conn, "reply", week, seconds, 1)
+
+    def resolved(self, forwarded_ts: str, resolved_at: float | None = None) -> None:
+        seconds = max(0.0, (resolved_at or time.time()) - float(forwarded_ts))
+        with self._transaction() as conn:
+            week, _, resolve_seconds, counted_open = self._report(conn, forwarded_ts)
+            if resolve_seconds is not None:
+                return
+            conn.execute(
+                "UPDATE reports SET resolve_seconds = ? WHERE forwarded_ts = ?", (seconds, forwarded_ts)
+            )
+            self._count(conn, "resolve", week, seconds, 1)
+            if counted_open:
+                self._add_open(conn, -1)
+
+    def reopened(self, forwarded_ts: str) -> None:
+        """
+        Undo `resolved` once a report has no resolving reactions left
+        """
+        with self._transaction() as conn:
+            week, _, resolve_seconds, counted_open = self._report(conn, forwarded_ts)
+            if resolve_seconds is None:
+                return
+            conn.execute(
+                "UPDATE reports SET resolve_seconds = NULL WHERE forwarded_ts = ?", (forwarded_ts,)
+            )
+            self._count(conn, "resolve", week, resolve_seconds, -1)
+            if counted_open:
+                self._add_open(conn, 1)
+
+    def summary(self, weeks: int) -> Summary:
+        """
+        Percentiles over every report, plus the last `weeks` weeks one by one
+        """
+        since = week_of(str(time.time() - (weeks - 1) * 7 * 86400))
+        with self._lock:
+            conn = self._db()
+            overall = {
+                metric: conn.execute(
+                    "SELECT bucket, SUM(count) FROM histograms WHERE metric = ? GROUP BY bucket ORDER BY bucket",
+                    (metric,),
+                ).fetchall()
+                for metric in METRICS
+            }
+            recent = conn.execute(
+                "SELECT metric, week, bucket, count FROM histograms WHERE week >= ? ORDER BY week, bucket",
+                (since,),
+            ).fetchall()
+            forwarded = dict(conn.execute("SELECT week, forwarded FROM weeks").fetchall())
+            row = conn.execute("SELECT value FROM counters WHERE name = 'open'").fetchone()
+
+        by_week: dict[str, dict[str, list[tuple[int, int]]]] = {}
+        for metric, week, bucket, count in recent:
+            by_week.setdefault(week, {}).setdefault(metric, []).append((bucket, count))
+        return Summary(
+            forwarded=sum(forwarded.values()),
+            open=row[0] if row else 0,
+            **{
+                metric: Timings(
+                    count=sum(count for _, count in counts),
+                    p50=percentile(counts, 50),
+                    p90=percentile(counts, 90),
+                    p99=percentile(counts, 99),
+                )
+                for metric, counts in overall.items()
+            },
+            weeks=[
+                WeekSummary(
+                    week=week,
+                    forwarded=forwarded.get(week, 0),
+                    reply_p50=percentile(by_week.get(week, {}).get("reply", []), 50),
+                    resolve_p50=percentile(by_week.get(week, {}).get("resolve", []), 50),
+                )
+                for week in sorted(set(by_week) | {w for w in forwarded if w >= since}, reverse=True)
+            ],
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+
+
+def format_seconds(seconds: float | None) -> str:
+    # Same format as reply_time and resolve_time in the records
+    return "-" if seconds is None else str(datetime.timedelta(seconds=round(seconds)))
+
+
+def format_summary(summary: Summary) -> str:
+    lines = [f"*Reports:* {summary.forwarded} forwarded, {summary.open} open"]
+    for label, timings in (("Time to first reply", summary.reply), ("Time to resolve", summary.resolve)):
+        lines.append(
+            f"*{label}* ({timings.count} reports): p50 {format_seconds(timings.p50)}, "
+            f"p90 {format_seconds(timings.p90)}, p99 {format_seconds(timings.p99)}"
+        )
+    if summary.weeks:
+        lines.append("*By week* (forwarded, median first reply, median resolve):")
+        for week in summary.weeks:
+            lines.append(
+                f"`{week.week}` {week.forwarded}, {format_seconds(week.reply_p50)}, {format_seconds(week.resolve_p50)}"
+            )
+    return "\n".join(lines)
+
+
+store = StatsStore(settings.stats_path)
@@ -0,0 +1,624 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from typing import Any
+
+# Every field a relay can be looked up by
+TS_FIELDS = ("dm_ts", "forwarded_ts", "selection_ts")
+
+
+class Backend(ABC):
+    """
+    Storage for relay records. Records are shaped like Airtable's, {"id": ..., "fields": {...}}, so handlers don't care which backend is in use
+    """
+
+    @abstractmethod
+    def create(self, fields: dict) -> dict: ...
+
+    @abstractmethod
+    def find(self, ts: str, field: str | None = None) -> dict | None:
+        """
+        Return the record with `ts` in `field`, or in any of TS_FIELDS if no field is given
+        """
+
+    @abstractmethod
+    def update(self, record_id: str, fields: dict) -> None: ...
+
+    def batch_update(self, records: list[dict]) -> None:
+        """
+        Apply several partial updates, each shaped like a record
+        """
+        for record in records:
+            self.update(record["id"], record["fields"])
+
+    @abstractmethod
+    def delete(self, record_id: str) -> None: ...
+
+    def batch_delete(self, record_ids: list[str]) -> None:
+        for record_id in record_ids:
+            self.delete(record_id)
+
+    @abstractmethod
+    def iterate(self, fields: list[str] | None = None, after: dict | None = None) -> Iterator[list[dict]]:
+        """
+        Yield every record, a page at a time, always in the same order. Given `fields`, records only need to include those.
+        Given `after`, a record listed earlier, only the records that come after it are listed, even if it's since been deleted
+        """
+
+    def close(self) -> None:
+        """
+        Finish any writes still running in the background. Called on shutdown
+        """
+
+
+class AirtableBackend(Backend):
+    def __init__(self, table):
+        self.table = table
+
+    def create(self, fields: dict) -> dict:
+        return self.table.create(fields)
+
+    def find(self, ts: str, field: str | None = None) -> dict | None:
+        from pyairtable.formulas import match
+
+        # https://pyairtable.readthedocs.io/en/stable/tables.html#formulas
+        # From the docs: "If match_any=True, expressions are grouped with OR(), record is return if any of the values match."
+        fields = (field,) if field else TS_FIELDS
+        return self.table.first(
+            formula=match({f: ts for f in fields}, match_any=True)
+        )
+
+    def update(self, record_id: str, fields: dict) -> None:
+        self.table.update(record_id, fields)
+
+    def batch_update(self, records: list[dict]) -> None:
+        self.table.batch_update(records)
+
+    def delete(self, record_id: str) -> None:
+        self.table.delete(record_id)
+
+    def batch_delete(self, record_ids: list[str]) -> None:
+        # pyairtable splits this into requests of 10 records, Airtable's maximum
+        self.table.batch_delete(record_ids)
+
+    def iterate(self, fields: list[str] | None = None, after: dict | None = None) -> Iterator[list[dict]]:
+        # Record ids aren't in creation order, but dm_ts is set when a record is created and never changes.
+        # Its digits are fixed width, so sorting it as text sorts records by when they were created
+        options = {"sort": ["dm_ts"]}
+        if fields:
+            options["fields"] = fields
+        if after is None:
+            yield from self.table.iterate(**options)
+            return
+        last = (after["fields"]["dm_ts"], after["id"])
+        # Airtable can't compare text, so this is as a number, a little early to allow for rounding. Records it lets
+        # through at or before `after` are dropped here
+        options["formula"] = f"VALUE({{dm_ts}}) >= {float(last[0]) - 0.001:.6f}"
+        for page in self.table.iterate(**options):
+            page = [r for r in page if (r["fields"].get("dm_ts", ""), r["id"]) > last]
+            if page:
+                yield page
+
+
+class SQLiteBackend(Backend):
+    """
+    Local backend with real indexes on every timestamp field. Fields are stored as JSON next to the indexed columns
+    """
+
+    PAGE_SIZE = 100
+
+    def __init__(self, path: str, mirror: "AirtableMirror | None" = None):
+        self.mirror = mirror
+        # Bolt runs listeners on a thread pool, so the connection is shared behind a lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS records (
+                    id TEXT PRIMARY KEY,
+                    dm_ts TEXT,
+                    forwarded_ts TEXT,
+                    selection_ts TEXT,
+                    fields TEXT NOT NULL
+                )
+                """
+            )
+            for field in TS_FIELDS:
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS records_{field} ON records ({field})"
+                )
+
+    @staticmethod
+    def _row_to_record(row) -> dict:
+        return {"id": row[0], "fields": json.loads(row[1])}
+
+    def create(self, fields: dict) -> dict:
+        # Airtable omits empty fields, so do the same
+        fields = {k: v for k, v in fields.items() if v is not None}
+        record = {"id": f"loc{uuid.uuid4().hex}", "fields": fields}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO records (id, dm_ts, forwarded_ts, selection_ts, fields) VALUES (?, ?, ?, ?, ?)",
+                (
+                    record["id"],
+                    *(fields.get(f) for f in TS_FIELDS),
+                    json.dumps(fields),
+                ),
+            )
+        if self.mirror:
+            self.mirror.create(record["id"], fields)
+        return record
+
+    def find(self, ts: str, field: str | None = None) -> dict | None:
+        if field is not None and field not in TS_FIELDS:
+            raise ValueError(f"{field} is not an indexed field")
+        fields = (field,) if field else TS_FIELDS
+        where = " OR ".join(f"{f} = ?" for f in fields)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT id, fields FROM records WHERE {where} LIMIT 1",
+                (ts,) * len(fields),
+            ).fetchone()
+        return None if row is None else self._row_to_record(row)
+
+    def _update(self, record_id: str, fields: dict) -> None:
+        row = self._conn.execute(
+            "SELECT fields FROM records WHERE id = ?", (record_id,)
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Record {record_id} not found")
+        merged = {
+            k: v
+            for k, v in {**json.loads(row[0]), **fields}.items()
+            if v is not None
+        }
+        self._conn.execute(
+            "UPDATE records SET dm_ts = ?, forwarded_ts = ?, selection_ts = ?, fields = ? WHERE id = ?",
+            (*(merged.get(f) for f in TS_FIELDS), json.dumps(merged), record_id),
+        )
+
+    def update(self, record_id: str, fields: dict) -> None:
+        with self._lock, self._conn:
+            self._update(record_id, fields)
+        if self.mirror:
+            self.mirror.update(record_id, fields)
+
+    def batch_update(self, records: list[dict]) -> None:
+        # One transaction for the whole batch
+        with self._lock, self._conn:
+            for record in records:
+                self._update(record["id"], record["fields"])
+        if self.mirror:
+            for record in records:
+                self.mirror.update(record["id"], record["fields"])
+
+    def delete(self, record_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM records WHERE id = ?", (record_id,))
+        if self.mirror:
+            self.mirror.delete(record_id)
+
+    def batch_delete(self, record_ids: list[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM records WHERE id = ?", [(i,) for i in record_ids]
+            )
+        if self.mirror:
+            for record_id in record_ids:
+                self.mirror.delete(record_id)
+
+    def iterate(self, fields: list[str] | None = None, after: dict | None = None) -> Iterator[list[dict]]:
+        # Keyset pagination so the lock isn't held while the caller works on a page
+        last_id = after["id"] if after else ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, fields FROM records WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, self.PAGE_SIZE),
+                ).fetchall()
+            if not rows:
+                return
+            yield [self._row_to_record(row) for row in rows]
+            last_id = rows[-1][0]
+
+    def close(self) -> None:
+        if self.mirror:
+            self.mirror.close()
+
+
+class AirtableMirror:
+    """
+    Replays local writes to Airtable on a background thread so FD's reporting views stay populated without Airtable being in the relay's critical path.
+    Writes wait in a SQLite table until Airtable has them, so they survive restarts, and one that fails is retried with backoff
+    rather than dropped. Each record's writes are replayed in order, so an update waits for its record's create
+    """
+
+    # Seconds before the first retry, doubled for each one after up to MAX_BACKOFF
+    BACKOFF = 5
+    MAX_BACKOFF = 600
+    # Seconds a worker process has to replay a write before another may take it over
+    LEASE = 60
+
+    def __init__(self, table, conn_path: str):
+        self.table = table
+        # Writes are queued from listener threads, so the connection is shared behind a lock
+        self._conn = sqlite3.connect(conn_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        # Set when a write is queued, so one queued while the thread was looking isn't slept through
+        self._queued = False
+        self._closing = False
+        with self._lock, self._conn:
+            # Local id -> Airtable id, persisted so a restart doesn't duplicate rows
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS airtable_ids (local_id TEXT PRIMARY KEY, airtable_id TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS airtable_pending (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    op TEXT NOT NULL,
+                    local_id TEXT NOT NULL,
+                    fields TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL DEFAULT 0
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS airtable_pending_local_id ON airtable_pending (local_id, seq)"
+            )
+        self._thread = threading.Thread(
+            target=self._run, name="airtable-mirror", daemon=True
+        )
+        self._thread.start()
+
+    def create(self, local_id: str, fields: dict) -> None:
+        self._queue("create", local_id, fields)
+
+    def update(self, local_id: str, fields: dict) -> None:
+        self._queue("update", local_id, fields)
+
+    def delete(self, local_id: str) -> None:
+        self._queue("delete", local_id, None)
+
+    def _queue(self, op: str, local_id: str, fields: dict | None) -> None:
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO airtable_pending (op, local_id, fields) VALUES (?, ?, ?)",
+                    (op, local_id, None if fields is None else json.dumps(fields)),
+                )
+            self._queued = True
+            self._wake.notify()
+
+    def _claim(self) -> tuple | None:
+        """
+        Take the oldest write that's due and is next for its record, leasing it so other workers sharing the file skip it
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                """
+                SELECT seq, op, local_id, fields, attempts FROM airtable_pending AS p
+                WHERE next_attempt <= ? AND NOT EXISTS (
+                    SELECT 1 FROM airtable_pending WHERE local_id = p.local_id AND seq < p.seq
+                )
+                ORDER BY seq LIMIT 1
+                """,
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE airtable_pending SET next_attempt = ? WHERE seq = ?", (now + self.LEASE, row[0])
+            )
+        return row
+
+    def _replay(self, op: str, local_id: str, fields: dict | None) -> None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT airtable_id FROM airtable_ids WHERE local_id = ?",
+                (local_id,),
+            ).fetchone()
+        if op == "create":
+            # Already created by an attempt that failed after Airtable had the row
+            if row is not None:
+                return
+            airtable_id = self.table.create(fields)["id"]
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO airtable_ids VALUES (?, ?)",
+                    (local_id, airtable_id),
+                )
+        elif row is None:
+            # Records from before the mirror was turned on
+            print(f"INFO: {local_id} was never mirrored to Airtable; skipping {op}.")
+        elif op == "update":
+            self.table.update(row[0], fields)
+        elif op == "delete":
+            self.table.delete(row[0])
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "DELETE FROM airtable_ids WHERE local_id = ?", (local_id,)
+                )
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                closing = self._closing
+                self._queued = False
+            claimed = self._claim()
+            if claimed is None:
+                if closing:
+                    return
+                with self._lock:
+                    # Woken by a new write or by close, or checks again for retries that have come due
+                    self._wake.wait_for(lambda: self._queued or self._closing, timeout=self.BACKOFF)
+                continue
+            seq, op, local_id, fields, attempts = claimed
+            try:
+                self._replay(op, local_id, None if fields is None else json.loads(fields))
+            except Exception as e:  # noqa: BLE001
+                # Whatever went wrong, the thread keeps going and the operation is retried later
+                backoff = min(self.BACKOFF * 2**attempts, self.MAX_BACKOFF)
+                print(f"Failed to mirror {op} of {local_id} to Airtable, retrying in {backoff}s: {e}")
+                with self._lock, self._conn:
+                    self._conn.execute(
+                        "UPDATE airtable_pending SET attempts = ?, next_attempt = ? WHERE seq = ?",
+                        (attempts + 1, time.time() + backoff, seq),
+                    )
+                continue
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM airtable_pending WHERE seq = ?", (seq,))
+
+    def close(self, timeout: float | None = None) -> None:
+        """
+        Replay every write that's due, then stop. Writes waiting on a retry are replayed after the next start
+        """
+        with self._lock:
+            self._closing = True
+            self._wake.notify()
+        self._thread.join(timeout)
+        with self._lock:
+            left = self._conn.execute("SELECT COUNT(*) FROM airtable_pending").fetchone()[0]
+            if left:
+                print(f"{left} writes are still waiting to be mirrored to Airtable")
+            if not self._thread.is_alive():
+                self._conn.close()
+
+
+class WriteBehind:
+    """
+    Coalesces updates per record and writes them with Backend.batch_update on a background thread,
+    once `max_batch` records are waiting or the oldest update has waited `delay` seconds.
+    A record that can't be written is queued again, waiting twice as long each time. After `max_attempts` its update is
+    dropped and `on_dropped(record_id)` is called, so whatever assumed the write would land can forget it
+    """
+
+    def __init__(
+        self,
+        backend: Backend,
+        delay: float,
+        max_batch: int = 10,
+        max_attempts: int = 4,
+        on_dropped: Callable[[str], Any] | None = None,
+    ):
+        self.backend = backend
+        self.delay = delay
+        # Airtable accepts at most 10 records per request
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.on_dropped = on_dropped
+        # record id -> failed writes of its pending fields so far
+        self._attempts: dict[str, int] = {}
+        # record id -> fields not yet written, oldest first. None clears a field, like Backend.update
+        self._pending: OrderedDict[str, dict] = OrderedDict()
+        self._queued_at: dict[str, float] = {}
+        # Taken off _pending but not yet written, so reads still see them
+        self._inflight: dict[str, dict] = {}
+        # timestamp -> record id, for timestamps that only exist in pending writes
+        self._index: dict[str, str] = {}
+        self._cond = threading.Condition()
+        # Serializes writers so two batches for the same record can't land out of order
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="write-behind", daemon=True
+        )
+        self._thread.start()
+
+    def update(self, record_id: str, fields: dict) -> None:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Write-behind queue is closed")
+            if record_id in self._pending:
+                self._pending[record_id].update(fields)
+            else:
+                self._pending[record_id] = dict(fields)
+                self._queued_at[record_id] = time.monotonic()
+            for field in TS_FIELDS:
+                if fields.get(field):
+                    self._index[fields[field]] = record_id
+            self._cond.notify()
+
+    def overlay(self, record: dict) -> dict:
+        """
+        Apply unwritten updates to a record read from the backend
+        """
+        with self._cond:
+            fields = {
+                **record["fields"],
+                **self._inflight.get(record["id"], {}),
+                **self._pending.get(record["id"], {}),
+            }
+        return {
+            "id": record["id"],
+            "fields": {k: v for k, v in fields.items() if v is not None},
+        }
+
+    def pending_id(self, ts: str) -> str | None:
+        """
+        Record id for a timestamp the backend won't know about until pending writes are flushed
+        """
+        with self._cond:
+            return self._index.get(ts)
+
+    def discard(self, record_ids: list[str]) -> None:
+        with self._cond:
+            for record_id in record_ids:
+                self._pending.pop(record_id, None)
+                self._queued_at.pop(record_id, None)
+                self._attempts.pop(record_id, None)
+            self._index = {
+                ts: i for ts, i in self._index.items() if i not in record_ids
+            }
+
+    def write_now(self, record_id: str, fields: dict) -> None:
+        """
+        Write `fields` to the backend before returning, along with anything already queued for the record.
+        Raises if the write fails, leaving what was queued to be retried as usual
+        """
+        with self._write_lock:
+            with self._cond:
+                queued = self._pending.pop(record_id, None)
+                queued_at = self._queued_at.pop(record_id, None)
+            try:
+                self.backend.update(record_id, {**(queued or {}), **fields})
+            except Exception:
+                if queued is not None:
+                    with self._cond:
+                        newer = self._pending.pop(record_id, {})
+                        self._pending[record_id] = {**queued, **newer}
+                        self._queued_at[record_id] = queued_at
+                raise
+            with self._cond:
+                self._attempts.pop(record_id, None)
+                if record_id not in self._pending:
+                    self._index = {ts: i for ts, i in self._index.items() if i != record_id}
+
+    def flush(self) -> None:
+        """
+        Write everything that's pending before returning
+        """
+        with self._write_lock:
+            while True:
+                batch = self._take(ready_only=False)
+                if not batch:
+                    return
+                self._write(batch)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+
+    def _ready(self, record_id: str, now: float) -> bool:
+        """
+        Whether a record can go in the next batch: anything not being retried, or a retry whose backoff has passed
+        """
+        # Called with _cond held
+        return record_id not in self._attempts or self._queued_at[record_id] + self.delay <= now
+
+    def _take(self, ready_only: bool = True) -> list[dict]:
+        with self._cond:
+            now = time.monotonic()
+            batch = []
+            for record_id in list(self._pending):
+                if len(batch) >= self.max_batch:
+                    break
+                if ready_only and not self._ready(record_id, now):
+                    continue
+                fields = self._pending.pop(record_id)
+                del self._queued_at[record_id]
+                self._inflight[record_id] = fields
+                batch.append({"id": record_id, "fields": fields})
+            return batch
+
+    def _write(self, batch: list[dict]) -> None:
+        failed = []
+        try:
+            self.backend.batch_update(batch)
+        except Exception as e:  # noqa: BLE001
+            # One bad record (e.g. deleted in Airtable) shouldn't lose the rest of the batch
+            print(f"Batch update failed, retrying records one at a time: {e}")
+            for record in batch:
+                try:
+                    self.backend.update(record["id"], record["fields"])
+                except Exception as e:  # noqa: BLE001
+                    # Queued again or dropped below, whatever the backend raised
+                    print(f"Failed to update {record['id']}: {e}")
+                    failed.append(record)
+        finally:
+            dropped = []
+            with self._cond:
+                for record in failed:
+                    if self._retry(record):
+                        continue
+                    dropped.append(record["id"])
+                for record in batch:
+                    self._inflight.pop(record["id"], None)
+                    if record not in failed:
+                        self._attempts.pop(record["id"], None)
+                    if record["id"] not in self._pending:
+                        self._index = {
+                            ts: i
+                            for ts, i in self._index.items()
+                            if i != record["id"]
+                        }
+            for record_id in dropped:
+                print(f"Gave up updating {record_id} after {self.max_attempts} attempts")
+                if self.on_dropped:
+                    self.on_dropped(record_id)
+
+    def _retry(self, record: dict) -> bool:
+        """
+        Queue a failed write again, under any updates made since. False once it's been tried `max_attempts` times
+        """
+        # Called with _cond held
+        attempts = self._attempts.get(record["id"], 0) + 1
+        if attempts >= self.max_attempts:
+            self._attempts.pop(record["id"], None)
+            return False
+        self._attempts[record["id"]] = attempts
+        newer = self._pending.pop(record["id"], {})
+        self._pending[record["id"]] = {**record["fields"], **newer}
+        # Due after delay * 2 ** attempts
+        self._queued_at.pop(record["id"], None)
+        self._queued_at[record["id"]] = time.monotonic() + self.delay * (2**attempts - 1)
+        return True
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.monotonic()
+                    if sum(self._ready(record_id, now) for record_id in self._pending) >= self.max_batch:
+                        break
+                    if self._pending:
+                        # Not always the first, since retries are queued to come due later
+                        timeout = (
+                            min(self._queued_at.values())
+                            + self.delay
+                            - now
+                        )
+                        if timeout <= 0:
+                            break
+                    else:
+                        timeout = None
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+            with self._write_lock:
+                batch = self._take()
+                if batch:
+                    self._write(batch)
@@ -0,0 +1,171 @@
+"""
+Text and Block Kit payloads Shroud sends over and over, built once instead of per message.
+Templates are shared between calls, so nothing may modify what these functions return
+"""
+
+import importlib.resources
+import threading
+
+from shroud import settings
+
+_help_text: str | None = None
+_help_lock = threading.Lock()
+
+
+def build_help_text() -> str:
+    # The package looks like shroud.utils and we only want shroud/manifest.yml
+    # Only needed for /help, so yaml isn't imported on startup
+    import yaml
+
+    manifest_path = importlib.resources.files(__package__.split(".")[0]).parent / "manifest.yml"
+    with open(manifest_path, "r") as f:
+        features = yaml.safe_load(f)["features"]
+
+    help_text = "Commands:" if not settings.leading_help_text else settings.leading_help_text + "\nCommands:"
+    slash_commands = features.get("slash_commands", [])
+    for command in slash_commands:
+        try:
+            help_text += f"\n`{command['command']} {command['usage_hint']}`: {command['description']}"
+        except KeyError:
+            # Most likely means that usage_hint is not defined
+            help_text += f"\n`{command['command']}`: {command['description']}"
+    if len(slash_commands) == 0:
+        help_text += "\nNo commands available.\n"
+    else:
+        help_text += "\n"
+
+    shortcuts = features.get("shortcuts", [])
+    help_text += "\nShortcuts:"
+    message_shortcuts_text = "Message shortcuts:"
+    global_shortcuts_text = "Global shortcuts:"
+    for shortcut in shortcuts:
+        if shortcut["type"] == "message":
+            message_shortcuts_text += (
+                f"\n`{shortcut["name"]}`: {shortcut['description']}"
+            )
+        elif shortcut["type"] == "global":
+            global_shortcuts_text += (
+                f"\n`{shortcut["name"]}`: {shortcut['description']}"
+            )
+    if len(shortcuts) == 0:
+        help_text += "\nNo shortcuts available."
+    else:
+        if message_shortcuts_text != "Message shortcuts:":
+            help_text += f"\n{message_shortcuts_text}"
+        if global_shortcuts_text != "Global shortcuts:":
+            help_text += f"\n{global_shortcuts_text}"
+    return help_text
+
+
+def help_text() -> str:
+    """
+    The /help response. The manifest is read the first time this is called, which start_app does once it's connected
+    """
+    global _help_text
+    if _help_text is None:
+        with _help_lock:
+            if _help_text is None:
+                _help_text = build_help_text()
+    return _help_text
+
+
+SELECTION_PROMPT_TEXT = "Select how this message should be forwarded"
+SELECTION_PROMPT_BLOCKS = [
+    {
+        "type": "section",
+        "text": {
+            "type": "mrkdwn",
+            "text": "Do you want to forward this report anonymously or with your username?",
+        },
+        "accessory": {
+            "type": "static_select",
+            "action_id": "report_forwarding",
+            "placeholder": {"type": "plain_text", "text": "Choose an option"},
+            "options": [
+                {
+                    "text": {
+                        "type": "plain_text",
+                        "text": "Forward Anonymously",
+                    },
+                    "value": "anonymous",
+                },
+                {
+                    "text": {
+                        "type": "plain_text",
+                        "text": "Forward with Username",
+                    },
+                    "value": "with_username",
+                },
+            ],
+        },
+    },
+    {
+        "type": "actions",
+        "elements": [
+            {
+                "type": "button",
+                "text": {"type": "plain_text", "text": "Submit"},
+                "style": "primary",
+                "action_id": "submit_forwarding",
+            }
+        ],
+    },
+]
+
+
+def selection_prompt_blocks() -> list[dict]:
+    return SELECTION_PROMPT_BLOCKS
+
+
+# One per selection, since that's the only thing that varies
+SUBMITTED_BLOCKS = {
+    selection: [
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": f"{'This report has been submitted' if selection == "with_username" else 'This report has been submitted anonymously'}. We've received your report and should get back to you within a couple hours.",
+            },
+        }
+    ]
+    for selection in ("anonymous", "with_username")
+}
+
+
+def submitted_blocks(user_selection: str) -> list[dict]:
+    return SUBMITTED_BLOCKS.get(user_selection, SUBMITTED_BLOCKS["anonymous"])
+
+
+FORWARDED_EPHEMERAL_TEXT = "Message content forwarded. Any replies to the forwarded message will be sent back to you as a threaded reply. If you wish to add additional context, reply in the thread."
+
+
+def join_channel_text(private_channel: str, target_user: str) -> str:
+    return f"A private channel has been created: <#{private_channel}> with <@{target_user}>. Click the button below to join."
+
+
+_JOIN_CHANNEL_SECTION = {"type": "section", "text": {"type": "mrkdwn"}}
+_JOIN_CHANNEL_BUTTON = {
+    "type": "button",
+    "text": {
+        "type": "plain_text",
+        "text": "Join private channel",
+    },
+    "action_id": "join_private_channel",
+}
+
+
+def join_channel_blocks(private_channel: str, target_user: str) -> list[dict]:
+    # Only the dicts on the way to the two fields that vary are new, the rest is shared with the skeleton
+    return [
+        {
+            **_JOIN_CHANNEL_SECTION,
+            "text": {
+                **_JOIN_CHANNEL_SECTION["text"],
+                "text": join_channel_text(private_channel, target_user),
+            },
+        },
+        {
+            "type": "actions",
+            "elements": [{**_JOIN_CHANNEL_BUTTON, "value": private_channel}],
+        },
+    ]
@@ -0,0 +1,127 @@
+import hashlib
+import math
+import threading
+import time
+from collections.abc import Iterator
+
+
+class ExactFilter:
+    """
+    Every timestamp, so there are no false positives. Costs roughly 100 bytes per timestamp
+    """
+
+    def __init__(self):
+        self._items: set[str] = set()
+
+    def add(self, ts: str) -> None:
+        self._items.add(ts)
+
+    def __contains__(self, ts: str) -> bool:
+        return ts in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def false_positive_rate(self) -> float:
+        return 0.0
+
+    def describe(self) -> str:
+        return "exact set"
+
+
+class BloomFilter:
+    """
+    Sized for `capacity` timestamps at `fp_rate`. The estimated rate rises past that if more are added.
+    Nothing is ever removed, so deleted records only cost a database lookup
+    """
+
+    def __init__(self, capacity: int, fp_rate: float):
+        self.size = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._count = 0
+        # Setting a bit is a read-modify-write of its byte, and two adds losing one of each other's bits would hide a relay
+        self._lock = threading.Lock()
+
+    def _positions(self, ts: str) -> Iterator[int]:
+        digest = hashlib.blake2b(ts.encode(), digest_size=16).digest()
+        # Double hashing: k positions from two 64-bit halves
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, ts: str) -> None:
+        positions = list(self._positions(ts))
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self._count += 1
+
+    def __contains__(self, ts: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(ts))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def false_positive_rate(self) -> float:
+        return (1 - math.exp(-self.hashes * self._count / self.size)) ** self.hashes
+
+    def describe(self) -> str:
+        return f"bloom filter of {self.size} bits with {self.hashes} hashes"
+
+
+class TimestampFilter:
+    """
+    Answers whether a timestamp could belong to a record, so lookups for thread and reaction timestamps that definitely don't can skip the database.
+    Until `build` has read every record, everything could
+    """
+
+    def __init__(self, index: ExactFilter | BloomFilter | None):
+        self.index = index
+        self._ready = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.index is not None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def add(self, ts: str | None) -> None:
+        if self.index is not None and ts:
+            self.index.add(ts)
+
+    def might_contain(self, ts: str) -> bool:
+        if not self._ready:
+            return True
+        return ts in self.index
+
+    def build(self, pages: Iterator[list[dict]], fields: tuple[str, ...]) -> None:
+        """
+        Add every timestamp in `pages`. Timestamps added while this runs are kept, so it can run alongside new relays
+        """
+        if self.index is None:
+            return
+        start = time.perf_counter()
+        for page in pages:
+            for record in page:
+                for field in fields:
+                    self.add(record["fields"].get(field))
+        self._ready = True
+        print(
+            f"Indexed {len(self.index)} record timestamps in {time.perf_counter() - start:.1f}s "
+            f"({self.index.describe()}, estimated false positive rate {self.index.false_positive_rate():.2%})"
+        )
+
+
+def create(mode: str, capacity: int, fp_rate: float) -> TimestampFilter:
+    match mode:
+        case "exact":
+            return TimestampFilter(ExactFilter())
+        case "bloom":
+            return TimestampFilter(BloomFilter(capacity, fp_rate))
+        case _:
+            return TimestampFilter(None)
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from pydantic import BaseModel
+from slack_sdk import WebClient
+
+from shroud import settings
+
+
+class UserProfile(BaseModel):
+    name: str
+    image_url: str | None = None
+
+    @classmethod
+    def from_user(cls, user: dict) -> "UserProfile":
+        return cls(
+            name=user.get("real_name") or user["profile"].get("real_name", ""),
+            image_url=user["profile"].get("image_512"),
+        )
+
+
+class ProfileCache:
+    """
+    Bounded LRU cache of the fields relays need from users.info, with a TTL. Concurrent misses for the same user share a single request
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        # user id -> (expiry, profile), least recently used first
+        self._profiles: OrderedDict[str, tuple[float, UserProfile]] = OrderedDict()
+        # user id -> fetch that's currently running
+        self._pending: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, user_id: str) -> UserProfile | None:
+        # Called with the lock held
+        cached = self._profiles.get(user_id)
+        if cached is None:
+            return None
+        if cached[0] < time.monotonic():
+            del self._profiles[user_id]
+            return None
+        self._profiles.move_to_end(user_id)
+        return cached[1]
+
+    def _put(self, user_id: str, profile: UserProfile) -> None:
+        # Called with the lock held
+        if self.max_size <= 0:
+            return
+        self._profiles[user_id] = (time.monotonic() + self.ttl, profile)
+        self._profiles.move_to_end(user_id)
+        while len(self._profiles) > self.max_size:
+            self._profiles.popitem(last=False)
+
+    def peek(self, user_id: str) -> UserProfile | None:
+        """
+        Return the cached profile without fetching it on a miss
+        """
+        with self._lock:
+            return self._cached(user_id)
+
+    def get(self, user_id: str, client: WebClient) -> UserProfile:
+        with self._lock:
+            cached = self._cached(user_id)
+            if cached is not None:
+                return cached
+            pending = self._pending.get(user_id)
+            if pending is None:
+                pending = self._pending[user_id] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            return pending.result()
+
+        profile = None
+        try:
+            profile = UserProfile.from_user(client.users_info(user=user_id)["user"])
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                # A user_change or invalidate that arrived mid-fetch already took this fetch out, and a newer one may
+                # have taken its place. Either way its result isn't cached
+                if self._pending.get(user_id) is pending:
+                    del self._pending[user_id]
+                    if profile is not None:
+                        self._put(user_id, profile)
+            # Whatever happens, callers waiting on this fetch are let go
+            if not pending.done():
+                pending.set_result(profile)
+        return profile
+
+    def put(self, user: dict) -> None:
+        """
+        Cache a profile from a users.info response fetched elsewhere
+        """
+        with self._lock:
+            self._put(user["id"], UserProfile.from_user(user))
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._profiles.pop(user_id, None)
+            self._pending.pop(user_id, None)
+
+    def update(self, user: dict) -> None:
+        """
+        Refresh a profile from the user object in a user_change event, if it's cached or being fetched.
+        Every user in the workspace sends these, so anyone else is left out
+        """
+        with self._lock:
+            # A fetch that's running may have started before the change
+            wanted = user["id"] in self._profiles or self._pending.pop(user["id"], None) is not None
+            if wanted:
+                self._put(user["id"], UserProfile.from_user(user))
+
+
+profiles = ProfileCache(max_size=settings.user_cache_size, ttl=settings.user_cache_ttl)
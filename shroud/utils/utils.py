@@ -1,6 +1,9 @@
+import datetime
 from slack_sdk import WebClient
 from shroud import settings
-from shroud.utils import db
+from shroud.utils import db, reports, templates, users
+from shroud.utils.reports import ReportContent
+from shroud.utils.users import UserProfile
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from shroud.slack.handlers.incoming_message import MessageEvent
@@ -24,63 +27,54 @@ def get_message_by_ts(ts: str, channel: str, client: WebClient) -> str:
 
 
 
+def get_report_content(record: dict, client: WebClient) -> ReportContent | None:
+    """
+    The text and attachments to forward for a report, read back from the DM only if the report store doesn't have them
+    """
+    fields = record["fields"]
+    content = reports.store.get(fields["dm_channel"], fields["dm_ts"])
+    if content is not None:
+        return content
+    message = get_message_by_ts(ts=fields["dm_ts"], channel=fields["dm_channel"], client=client)
+    if message is None:
+        return None
+    return ReportContent(text=message["text"], attachments=message.get("attachments", []))
+
+
+def get_profile(user_id, client: WebClient) -> UserProfile:
+    # Name and picture come from the same cached users.info call
+    return users.profiles.get(user_id, client)
+
+
 def get_profile_picture_url(user_id, client: WebClient) -> str:
-    user_info = client.users_info(user=user_id)
-    profile_picture_url = user_info["user"]["profile"]["image_512"]
-    return profile_picture_url
+    return get_profile(user_id, client).image_url
 
 
 def get_name(user_id, client: WebClient) -> str:
-    user_info = client.users_info(user=user_id)
-    return user_info.data["user"]["real_name"]
+    return get_profile(user_id, client).name
+
+
+def elapsed_since(start_ts: str, end_ts: str | None = None) -> str:
+    """
+    Format the time between two Slack timestamps (or between `start_ts` and now) like `str(timedelta)`
+    """
+    start_dt = datetime.datetime.fromtimestamp(float(start_ts), tz=datetime.UTC)
+    end_dt = (
+        datetime.datetime.fromtimestamp(float(end_ts), tz=datetime.UTC)
+        if end_ts
+        else datetime.datetime.now(datetime.UTC)
+    )
+    time_diff = (end_dt - start_dt).total_seconds()
+    return str(datetime.timedelta(seconds=int(time_diff)))
 
 
 def begin_forward(message: "MessageEvent", client: WebClient) -> str:
+    reports.store.put(message.channel, message.ts, message.content, message.attachments)
     selection_prompt = client.chat_postMessage(
         channel=message.channel,
-        text="Select how this message should be forwarded",
+        text=templates.SELECTION_PROMPT_TEXT,
         thread_ts=message.ts,  # Thread the prompt under the user's message
-        blocks=[
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": "Do you want to forward this report anonymously or with your username?",
-                },
-                "accessory": {
-                    "type": "static_select",
-                    "action_id": "report_forwarding",
-                    "placeholder": {"type": "plain_text", "text": "Choose an option"},
-                    "options": [
-                        {
-                            "text": {
-                                "type": "plain_text",
-                                "text": "Forward Anonymously",
-                            },
-                            "value": "anonymous",
-                        },
-                        {
-                            "text": {
-                                "type": "plain_text",
-                                "text": "Forward with Username",
-                            },
-                            "value": "with_username",
-                        },
-                    ],
-                },
-            },
-            {
-                "type": "actions",
-                "elements": [
-                    {
-                        "type": "button",
-                        "text": {"type": "plain_text", "text": "Submit"},
-                        "style": "primary",
-                        "action_id": "submit_forwarding",
-                    }
-                ],
-            },
-        ],
+        blocks=templates.selection_prompt_blocks(),
     )
     selection_ts = selection_prompt.data["ts"]
 
@@ -0,0 +1,196 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Executor, Future
+
+from pydantic import BaseModel
+
+
+class PoolStats(BaseModel):
+    workers: int
+    queue_depth: int
+    queue_capacity: int
+    in_flight: int
+    completed: int
+    # How long the most recent task waited in the queue before a worker picked it up
+    last_wait: float
+    max_wait: float
+    total_wait: float
+
+
+class WorkerPool(Executor):
+    """
+    Fixed-size thread pool with a bounded queue. submit() blocks once the queue is full, pushing back on whoever is producing work
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, name: str = "worker"):
+        self.max_workers = max_workers
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._shutdown = False
+        self._in_flight = 0
+        # Submitted but not finished, whether queued or running
+        self._pending = 0
+        self._completed = 0
+        self._last_wait = 0.0
+        self._max_wait = 0.0
+        self._total_wait = 0.0
+        self._threads = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new work after shutdown")
+            self._pending += 1
+        future = Future()
+        self._queue.put((future, fn, args, kwargs, time.monotonic()))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs, enqueued = item
+            waited = time.monotonic() - enqueued
+            with self._lock:
+                self._in_flight += 1
+                self._last_wait = waited
+                self._max_wait = max(self._max_wait, waited)
+                self._total_wait += waited
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:  # noqa: BLE001
+                    # Handed to whoever waits on the future, as ThreadPoolExecutor does
+                    future.set_exception(e)
+            with self._lock:
+                self._in_flight -= 1
+                self._pending -= 1
+                self._completed += 1
+                self._idle.notify_all()
+
+    def stats(self) -> PoolStats:
+        with self._lock:
+            return PoolStats(
+                workers=self.max_workers,
+                queue_depth=self._queue.qsize(),
+                queue_capacity=self._queue.maxsize,
+                in_flight=self._in_flight,
+                completed=self._completed,
+                last_wait=self._last_wait,
+                max_wait=self._max_wait,
+                total_wait=self._total_wait,
+            )
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        """
+        Block until nothing is queued or running
+        """
+        with self._lock:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+        if cancel_futures:
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[0].cancel()
+                    with self._lock:
+                        self._pending -= 1
+        # Queued work is drained first since the sentinels go to the back of the queue
+        for _ in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+class TaskLimiter:
+    """
+    asyncio counterpart of WorkerPool. At most `max_tasks` deferred listeners run at once, and acks wait once `max_queue` more are waiting
+    """
+
+    def __init__(self, max_tasks: int, max_queue: int):
+        self.max_tasks = max_tasks
+        self.max_queue = max_queue
+        # Created on first use so they bind to the running loop
+        self._running: asyncio.Semaphore | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._idle: asyncio.Event | None = None
+        self._waiting = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._last_wait = 0.0
+        self._max_wait = 0.0
+        self._total_wait = 0.0
+
+    def _init(self) -> None:
+        if self._running is None:
+            self._running = asyncio.Semaphore(self.max_tasks)
+            self._slots = asyncio.Semaphore(self.max_tasks + self.max_queue)
+            self._idle = asyncio.Event()
+            self._idle.set()
+
+    async def reserve(self) -> None:
+        """
+        Wait for room in the queue. Every reserve() must be followed by exactly one run()
+        """
+        self._init()
+        await self._slots.acquire()
+        self._idle.clear()
+
+    async def run(self, coro):
+        self._init()
+        enqueued = time.monotonic()
+        self._waiting += 1
+        try:
+            try:
+                await self._running.acquire()
+            finally:
+                self._waiting -= 1
+            waited = time.monotonic() - enqueued
+            self._last_wait = waited
+            self._max_wait = max(self._max_wait, waited)
+            self._total_wait += waited
+            self._in_flight += 1
+            try:
+                return await coro
+            finally:
+                self._in_flight -= 1
+                self._completed += 1
+                self._running.release()
+        finally:
+            self._slots.release()
+            if self._in_flight == 0 and self._waiting == 0:
+                self._idle.set()
+
+    def stats(self) -> PoolStats:
+        return PoolStats(
+            workers=self.max_tasks,
+            queue_depth=self._waiting,
+            queue_capacity=self.max_queue,
+            in_flight=self._in_flight,
+            completed=self._completed,
+            last_wait=self._last_wait,
+            max_wait=self._max_wait,
+            total_wait=self._total_wait,
+        )
+
+    async def drain(self) -> None:
+        if self._idle is not None:
+            await self._idle.wait()
@@ -0,0 +1,30 @@
+import os
+
+# Settings are validated on import, and nothing here should reach a real workspace or database
+os.environ.update(
+    {
+        "SHROUD_SLACK_BOT_TOKEN": "xoxb-test",
+        "SHROUD_SLACK_APP_TOKEN": "xapp-test",
+        "SHROUD_CHANNEL": "C0BENCHFD00",
+        "SHROUD_AIRTABLE_TOKEN": "test",
+        "SHROUD_AIRTABLE_BASE_ID": "test",
+        "SHROUD_AIRTABLE_TABLE_NAME": "test",
+        "SHROUD_DB_BACKEND": "sqlite",
+        "SHROUD_SQLITE_PATH": ":memory:",
+        "SHROUD_OUTBOX_PATH": ":memory:",
+        "SHROUD_STATS_PATH": ":memory:",
+        "SHROUD_EDIT_RELAY_WINDOW": "0",
+    }
+)
+
+
+def pytest_configure(config):
+    # Imported here so the settings above are in place first
+    from shroud.bench.fakes import FakeSlack
+
+    # Installed before anything builds a WebClient, since Bolt calls auth.test when the app is created
+    FakeSlack(latency=0).install()
+
+    from shroud.slack.client import scheduler
+
+    scheduler.enabled = False
@@ -0,0 +1,46 @@
+from shroud.utils.allowlist import Allowlist
+
+
+class MembersClient:
+    """
+    Answers conversations.members from `members`, two to a page
+    """
+
+    def __init__(self, members: list[str]):
+        self.members = members
+        self.calls = 0
+
+    def conversations_members(self, channel: str, limit: int, cursor: str | None = None):
+        self.calls += 1
+        start = int(cursor or 0)
+        end = start + 2
+        return {
+            "members": self.members[start:end],
+            "response_metadata": {"next_cursor": str(end) if end < len(self.members) else ""},
+        }
+
+
+def test_on_demand_allowlist_sees_a_member_leave_without_an_event():
+    client = MembersClient(["U1", "U2", "U3", "U4"])
+    members = Allowlist(channel="C1", reconcile_interval=900, on_demand=True)
+    assert members.is_member("U3", client)
+    # Left through another worker's connection, so this one never got member_left_channel
+    client.members.remove("U3")
+    assert not members.is_member("U3", client)
+
+
+def test_on_demand_allowlist_stops_at_the_members_page():
+    client = MembersClient(["U1", "U2", "U3", "U4", "U5", "U6"])
+    members = Allowlist(channel="C1", reconcile_interval=900, on_demand=True)
+    assert members.is_member("U2", client)
+    assert client.calls == 1
+
+
+def test_listed_allowlist_keeps_members_until_told():
+    client = MembersClient(["U1", "U2", "U3"])
+    members = Allowlist(channel="C1", reconcile_interval=900)
+    assert members.is_member("U3", client)
+    client.members.remove("U3")
+    assert members.is_member("U3", client)
+    members.remove("U3")
+    assert not members.is_member("U3", client)
@@ -0,0 +1,65 @@
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web import SlackResponse
+
+from shroud.utils.channels import ChannelDirectory
+
+
+class ChannelsClient:
+    """
+    Answers conversations.list and conversations.info from `channels`, id -> (name, archived)
+    """
+
+    def __init__(self, channels: dict[str, tuple[str, bool]]):
+        self.channels = channels
+        self.listings = 0
+
+    def conversations_list(self, **kwargs):
+        self.listings += 1
+        return {
+            "channels": [{"id": i, "name": name} for i, (name, archived) in self.channels.items() if not archived],
+            "response_metadata": {"next_cursor": ""},
+        }
+
+    def conversations_info(self, channel: str):
+        if channel not in self.channels:
+            response = SlackResponse(
+                client=None, http_verb="POST", api_url="", req_args={}, data={"ok": False, "error": "channel_not_found"},
+                headers={}, status_code=200,
+            )
+            raise SlackApiError("channel_not_found", response)
+        name, archived = self.channels[channel]
+        return {"channel": {"id": channel, "name": name, "is_archived": archived}}
+
+
+def test_missing_name_lists_the_channels_again():
+    client = ChannelsClient({"C1": ("shroud-u1", False)})
+    directory = ChannelDirectory(reconcile_interval=0)
+    assert directory.get("shroud-u1", client) == "C1"
+    # Created through an event this worker didn't get
+    client.channels["C2"] = ("shroud-u2", False)
+    assert directory.get("shroud-u2", client) == "C2"
+    assert client.listings == 2
+
+
+def test_stale_entries_are_checked_and_fixed():
+    client = ChannelsClient({"C1": ("shroud-u1", False), "C2": ("shroud-u2", False), "C3": ("shroud-u3", False)})
+    directory = ChannelDirectory(reconcile_interval=0)
+    directory.load(client)
+    client.channels["C1"] = ("shroud-renamed", False)
+    client.channels["C2"] = ("shroud-u2", True)
+    del client.channels["C3"]
+    listings = client.listings
+    assert directory.get("shroud-u1", client) is None
+    assert directory.get("shroud-u2", client) is None
+    assert directory.get("shroud-u3", client) is None
+    assert client.listings == listings
+    assert directory.get("shroud-renamed", client) == "C1"
+
+
+def test_reload_drops_channels_that_are_gone():
+    client = ChannelsClient({"C1": ("shroud-u1", False)})
+    directory = ChannelDirectory(reconcile_interval=0)
+    directory.load(client)
+    del client.channels["C1"]
+    directory.load(client, reload=True)
+    assert directory.get("shroud-u1", client) is None
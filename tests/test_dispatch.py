@@ -0,0 +1,158 @@
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from slack_sdk import WebClient
+
+from shroud.bench import payloads
+from shroud.bench.fakes import FakeSlack, MemoryBackend
+from shroud.utils.dispatch import OrderedDispatcher
+
+RELAYS = 8
+MESSAGES_PER_RELAY = 25
+
+
+class RandomLatencySlack(FakeSlack):
+    """
+    FakeSlack whose calls each take a random time up to `max_latency`, recording posted texts by thread
+    """
+
+    def __init__(self, max_latency: float):
+        super().__init__(latency=0)
+        self.max_latency = max_latency
+        self.posts: dict[str, list[str]] = defaultdict(list)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def api_call(self, client, api_method: str, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(random.uniform(0, self.max_latency))
+            if api_method == "chat.postMessage":
+                args = kwargs.get("json") or kwargs.get("params") or {}
+                with self._lock:
+                    self.posts[args["thread_ts"]].append(args["text"])
+            return super().api_call(client, api_method, **kwargs)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def slack():
+    fake = RandomLatencySlack(max_latency=0.005)
+    fake.install()
+    yield fake
+    FakeSlack(latency=0).install()
+
+
+def test_dispatcher_keeps_each_key_in_order(slack):
+    client = WebClient(token="xoxb-test")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        dispatcher = OrderedDispatcher(pool, max_pending=1000)
+        futures = [
+            dispatcher.submit(
+                f"relay-{i % RELAYS}",
+                client.chat_postMessage,
+                channel="C0BENCHFD00",
+                thread_ts=f"relay-{i % RELAYS}",
+                text=str(i // RELAYS),
+            )
+            for i in range(RELAYS * MESSAGES_PER_RELAY)
+        ]
+        for future in futures:
+            future.result()
+
+    expected = [str(n) for n in range(MESSAGES_PER_RELAY)]
+    assert len(slack.posts) == RELAYS
+    for posts in slack.posts.values():
+        assert posts == expected
+    # Different relays ran at the same time
+    assert slack.max_in_flight > 1
+
+
+def test_socket_mode_delivers_each_relay_in_order(slack):
+    from shroud.slack import handlers
+    from shroud.slack import slack as slack_app
+    from shroud.utils import db
+
+    backend = MemoryBackend(latency=0)
+    relays = []
+    for i in range(RELAYS):
+        dm_ts = f"1700000000.{i:06d}"
+        forwarded_ts = f"1700000001.{i:06d}"
+        backend.create(
+            {
+                "dm_ts": dm_ts,
+                "forwarded_ts": forwarded_ts,
+                "selection_ts": f"1700000002.{i:06d}",
+                "dm_channel": payloads.dm_channel(i),
+            }
+        )
+        relays.append((i, dm_ts, forwarded_ts))
+    db.use_backend(backend)
+    handlers.register()
+
+    # Stands in for middleware that takes a varying time before the ack, like claiming the request in the event store
+    def random_delay(next):
+        time.sleep(random.uniform(0, 0.003))
+        next()
+
+    slack_app.app.middleware(random_delay)
+    handler = slack_app.socket_mode_handler()
+    # Never connected, so there's nowhere to send acks
+    handler.client.send_socket_mode_response = lambda response: None
+    try:
+        for n in range(MESSAGES_PER_RELAY):
+            for i, dm_ts, _ in relays:
+                body = payloads.dm_reply(i, dm_ts, f"1700000100.{n * RELAYS + i:06d}")
+                body["event"]["text"] = str(n)
+                envelope = {"envelope_id": f"{n}-{i}", "type": "events_api", "payload": body}
+                handler.client.enqueue_message(json.dumps(envelope))
+
+        deadline = time.monotonic() + 30
+        while sum(len(p) for p in slack.posts.values()) < RELAYS * MESSAGES_PER_RELAY:
+            assert time.monotonic() < deadline, "Not every reply was relayed"
+            time.sleep(0.01)
+    finally:
+        handler.client.close()
+        slack_app.app._middleware_list.remove(
+            next(m for m in slack_app.app._middleware_list if getattr(m, "func", None) is random_delay)
+        )
+
+    expected = [str(n) for n in range(MESSAGES_PER_RELAY)]
+    for _, _, forwarded_ts in relays:
+        assert slack.posts[forwarded_ts] == expected
+
+
+def test_async_socket_mode_handles_envelopes_in_order():
+    from shroud.slack.aio.app import socket_mode_handler
+
+    async def run() -> list[int]:
+        handled = []
+        handler = socket_mode_handler()
+
+        async def listener(client, request):
+            # Later envelopes would finish first if they weren't waiting for earlier ones
+            await asyncio.sleep(random.uniform(0, 0.003))
+            handled.append(request.payload["n"])
+
+        handler.client.socket_mode_request_listeners = [listener]
+        for n in range(50):
+            await handler.client.message_queue.put(
+                json.dumps({"envelope_id": str(n), "type": "events_api", "payload": {"n": n}})
+            )
+        for _ in range(50):
+            await handler.client.process_message()
+        while len(handled) < 50:
+            await asyncio.sleep(0.01)
+        await handler.client.close()
+        return handled
+
+    assert asyncio.run(asyncio.wait_for(run(), timeout=30)) == list(range(50))
@@ -0,0 +1,102 @@
+import time
+from collections import defaultdict
+
+import pytest
+from slack_sdk import WebClient
+
+from shroud.bench import payloads
+from shroud.bench.fakes import FakeSlack, MemoryBackend
+from shroud.slack.handlers import incoming_message
+from shroud.utils import db
+from shroud.utils.edits import EditDebouncer
+
+WINDOW = 0.05
+DM_TS = "1700000000.000001"
+FORWARDED_TS = "1700000001.000001"
+REPLY_TS = "1700000100.000001"
+
+
+class RecordingSlack(FakeSlack):
+    """
+    FakeSlack that keeps the text of every chat.postMessage by thread
+    """
+
+    def __init__(self):
+        super().__init__(latency=0)
+        self.posts: dict[str, list[str]] = defaultdict(list)
+
+    def api_call(self, client, api_method: str, **kwargs):
+        if api_method == "chat.postMessage":
+            args = kwargs.get("json") or kwargs.get("params") or {}
+            with self._lock:
+                self.posts[args.get("thread_ts")].append(args["text"])
+        return super().api_call(client, api_method, **kwargs)
+
+
+@pytest.fixture
+def slack(monkeypatch):
+    fake = RecordingSlack()
+    fake.install()
+    memory = MemoryBackend(latency=0)
+    memory.create(
+        {
+            "dm_ts": DM_TS,
+            "forwarded_ts": FORWARDED_TS,
+            "selection_ts": "1700000002.000001",
+            "dm_channel": payloads.dm_channel(0),
+        }
+    )
+    db.use_backend(memory)
+    monkeypatch.setattr(incoming_message, "debouncer", EditDebouncer(window=WINDOW))
+    yield fake
+    FakeSlack(latency=0).install()
+
+
+def handle(body: dict) -> None:
+    incoming_message.handle_message(body["event"], say=None, client=WebClient(token="xoxb-test"), respond=None)
+
+
+def edit(before: str, after: str, event_ts: str) -> None:
+    body = payloads.message_changed(0, DM_TS, REPLY_TS, event_ts)
+    body["event"]["previous_message"]["text"] = before
+    body["event"]["message"]["text"] = after
+    handle(body)
+
+
+def settle() -> None:
+    time.sleep(WINDOW * 6)
+
+
+def test_a_burst_of_edits_is_relayed_once(slack):
+    edit("First", "Second", "1700000101.000001")
+    edit("Second", "Third", "1700000102.000001")
+    edit("Third", "Fourth", "1700000103.000001")
+    assert slack.posts[FORWARDED_TS] == []
+    settle()
+    assert slack.posts[FORWARDED_TS] == [incoming_message.edited_text("First", "Fourth")]
+
+
+def test_deleting_the_message_drops_its_pending_edit(slack):
+    edit("First", "Second", "1700000101.000001")
+    handle(payloads.message_deleted(0, DM_TS, REPLY_TS, "1700000102.000001"))
+    settle()
+    assert slack.posts[FORWARDED_TS] == []
+    # The reporter is told deletions aren't forwarded
+    assert slack.calls["chat.postEphemeral"] == 1
+
+
+def test_editing_back_to_the_original_relays_nothing(slack):
+    edit("First", "Second", "1700000101.000001")
+    edit("Second", "First", "1700000102.000001")
+    settle()
+    assert slack.posts[FORWARDED_TS] == []
+
+
+def test_flush_relays_what_is_waiting():
+    sent = []
+    debouncer = EditDebouncer(window=60)
+    assert debouncer.hold("D1", "1.0", "First", "Second", lambda original, final: sent.append((original, final)))
+    assert debouncer.hold("D1", "1.0", "Second", "Third", lambda original, final: sent.append((original, final)))
+    debouncer.flush()
+    assert sent == [("First", "Third")]
+    assert not EditDebouncer(window=0).hold("D1", "1.0", "First", "Second", sent.append)
@@ -0,0 +1,68 @@
+import gzip
+import json
+
+import pytest
+
+from shroud import export, settings
+from shroud.bench.fakes import MemoryBackend
+from shroud.utils import db
+
+
+class Interrupted(Exception):
+    pass
+
+
+def exported_ids(path) -> list[str]:
+    with gzip.open(path, "rt") as lines:
+        return [json.loads(line)["record"]["id"] for line in lines]
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setitem(settings, "export_checkpoint_interval", 10)
+    monkeypatch.setitem(settings, "export_workers", 2)
+    backend = MemoryBackend(latency=0)
+    for i in range(95):
+        backend.create({"dm_ts": f"1700000000.{i:06d}", "forwarded_ts": f"1700000001.{i:06d}"})
+    db.use_backend(backend)
+    yield backend
+    db.close()
+
+
+def test_resumes_after_the_last_exported_record_while_the_table_changes(backend, monkeypatch, tmp_path):
+    output = tmp_path / "export.jsonl.gz"
+    export_line = export._export_line
+    lines = 0
+
+    def interrupt_after_45(record, client):
+        nonlocal lines
+        lines += 1
+        if lines > 45:
+            raise Interrupted()
+        return export_line(record, client)
+
+    monkeypatch.setattr(export, "_export_line", interrupt_after_45)
+    with pytest.raises(Interrupted):
+        export.export(output)
+    saved = export.Checkpoint.model_validate_json((tmp_path / "export.jsonl.gz.checkpoint").read_text())
+    assert saved.records == 40
+    # The gzip member that was cut short is dropped on resume
+    first_run = exported_ids(output)[:40]
+    assert first_run[-1] == saved.last_id
+
+    # Records deleted and created after the checkpoint, including the one it stopped at
+    original = {r["id"] for page in backend.iterate() for r in page}
+    deleted = first_run[-3:] + first_run[:5]
+    for record_id in deleted:
+        backend.delete(record_id)
+    for i in range(95, 105):
+        backend.create({"dm_ts": f"1700000000.{i:06d}"})
+
+    monkeypatch.setattr(export, "_export_line", export_line)
+    checkpoint = export.export(output)
+    ids = exported_ids(output)
+    assert len(ids) == len(set(ids)) == checkpoint.records
+    assert ids[:40] == first_run
+    # Every record that was there all along made it in, and no others from before the checkpoint
+    assert original - set(deleted) <= set(ids)
+    assert set(ids) - original == {r["id"] for page in backend.iterate() for r in page if r["id"] > saved.last_id} - original
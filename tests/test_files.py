@@ -0,0 +1,67 @@
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+from slack_sdk import WebClient
+
+from shroud import settings
+from shroud.bench import files as bench
+from shroud.bench.fakes import FakeSlack
+from shroud.utils import files
+
+SIZE = 64 * bench.MB
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setitem(settings, "file_relay_max_size", SIZE)
+    monkeypatch.setitem(settings, "file_relay_max_total", SIZE * 2)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), bench.FileServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    slack = FakeSlack(latency=0)
+    slack.install()
+    slack.upload_url = f"http://127.0.0.1:{server.server_port}/upload"
+    yield server
+    server.shutdown()
+    FakeSlack(latency=0).install()
+
+
+def test_streaming_copy_holds_a_few_chunks_at_most(server):
+    # Raises SystemExit if an upload's length or CRC doesn't match what was served
+    result = bench.run("streaming", server.server_port, SIZE, count=2)
+    assert result.files == 2
+    # Per copy running at once: a chunk being read and one being sent, what urllib holds on to, and the stand-in
+    # server's own blocks, since it runs in this process
+    assert result.peak_traced_mb * bench.MB < 6 * settings.file_relay_chunk_size * result.files
+
+
+def test_buffered_copy_would_fail_the_bound(server):
+    # Shows the bound above tells a streaming copy from one that reads the file whole
+    result = bench.run("buffered", server.server_port, SIZE, count=1)
+    assert result.peak_traced_mb * bench.MB >= SIZE
+
+
+def test_start_relay_returns_before_the_copy_finishes(server, monkeypatch):
+    copying = threading.Event()
+    transfer = files.transfer
+
+    def slow_transfer(file, client):
+        copying.wait(timeout=10)
+        return transfer(file, client)
+
+    monkeypatch.setattr(files, "transfer", slow_transfer)
+    shared = [
+        {
+            "id": "FTEST0001",
+            "name": "test.bin",
+            "size": bench.MB,
+            "url_private_download": f"http://127.0.0.1:{server.server_port}/download/{bench.MB}",
+        }
+    ]
+    start = time.monotonic()
+    relayed = files.start_relay(shared, "C0BENCH0001", "1800000000.000001", WebClient(token="xoxb-test"))
+    assert time.monotonic() - start < 1
+    assert not relayed.done()
+    copying.set()
+    assert relayed.result(timeout=10).relayed == ["test.bin"]
@@ -0,0 +1,67 @@
+from slack_sdk import WebClient
+
+from shroud import settings
+from shroud.bench.fakes import MemoryBackend
+from shroud.slack import forwarding
+from shroud.utils import db, reports
+from shroud.utils.outbox import Outbox
+
+DM_TS = "1700000000.000001"
+
+
+def make_outbox(path: str, steps: dict) -> Outbox:
+    box = Outbox(path, workers=2, max_attempts=1)
+    box.register(forwarding.KIND, steps)
+    return box
+
+
+def test_replay_saves_forwarded_ts_after_a_crash(tmp_path, monkeypatch):
+    # Long enough that only a durable write reaches the backend before the test looks
+    monkeypatch.setitem(settings, "write_behind_delay", 60)
+    memory = MemoryBackend(latency=0)
+    memory.create(
+        {
+            "dm_ts": DM_TS,
+            "selection_ts": "1700000000.000002",
+            "dm_channel": "D0000000001",
+            "selection": "anonymous",
+        }
+    )
+    db.use_backend(memory)
+    client = WebClient(token="xoxb-test")
+    path = str(tmp_path / "outbox.db")
+    steps = forwarding.outbox.kinds[forwarding.KIND]
+
+    def crash(job, replay):
+        raise RuntimeError("Killed before saving forwarded_ts")
+
+    # The first run stops once the report is posted
+    first = make_outbox(path, {**steps, "finish_forward": (steps["finish_forward"][0], crash)})
+    report = reports.ReportContent(text="Something happened", attachments=[])
+    job = first.submit(
+        forwarding.KIND,
+        {
+            "user_id": "U0000000001",
+            "selection": "anonymous",
+            "dm_channel": "D0000000001",
+            "dm_ts": DM_TS,
+            "selection_ts": "1700000000.000002",
+            "text": report.text,
+            "attachments": report.attachments,
+        },
+        client,
+    )
+    job.wait("post_report", timeout=10)
+    forwarded_ts = job.results["forwarded_ts"]
+    assert job.futures["finish_forward"].exception(timeout=10) is not None
+    first.close()
+    assert "forwarded_ts" not in memory.find(DM_TS)["fields"]
+
+    second = make_outbox(path, steps)
+    assert second.start(client) == 1
+    assert second.wait_idle(timeout=10)
+    second.close()
+    fields = memory.find(DM_TS)["fields"]
+    assert fields["forwarded_ts"] == forwarded_ts
+    assert "selection" not in fields
+    assert db.writes.pending_id(forwarded_ts) is None
@@ -0,0 +1,35 @@
+from shroud.utils import ratelimit
+from shroud.utils.ratelimit import SlackScheduler, TokenBucket
+
+
+def test_idle_post_message_buckets_are_dropped(monkeypatch):
+    monkeypatch.setattr(ratelimit, "IDLE_SWEEP_INTERVAL", 0)
+    scheduler = SlackScheduler(background_reserve=0.2)
+    for i in range(100):
+        scheduler._bucket("chat.postMessage", f"C{i:010d}")
+    # Every channel's bucket filled back up, the way it would after a while without posts
+    for bucket in scheduler._buckets.values():
+        bucket._tokens = bucket.capacity
+    scheduler.acquire("chat.postMessage", "C9999999999")
+    assert list(scheduler._buckets) == [("chat.postMessage", "C9999999999")]
+
+
+def test_buckets_in_use_are_kept(monkeypatch):
+    monkeypatch.setattr(ratelimit, "IDLE_SWEEP_INTERVAL", 0)
+    scheduler = SlackScheduler(background_reserve=0.2)
+    scheduler.acquire("chat.postMessage", "C0000000001")
+    scheduler.throttled("chat.postMessage", "C0000000002", retry_after=30)
+    scheduler.acquire("reactions.add")
+    scheduler.acquire("chat.postMessage", "C0000000003")
+    assert ("chat.postMessage", "C0000000001") in scheduler._buckets
+    assert ("chat.postMessage", "C0000000002") in scheduler._buckets
+    assert ("reactions.add", None) in scheduler._buckets
+
+
+def test_workers_split_the_limits():
+    scheduler = SlackScheduler(background_reserve=0.2, workers=4)
+    single = TokenBucket.for_tier(3)
+    split = scheduler._bucket("reactions.add", None)
+    assert split.rate * 4 == single.rate
+    post = scheduler._bucket("chat.postMessage", "C0000000001")
+    assert post.rate * 4 == ratelimit.POST_MESSAGE_PER_SECOND
@@ -0,0 +1,76 @@
+import pytest
+from slack_sdk import WebClient
+
+from shroud.bench import payloads
+from shroud.bench.fakes import FakeSlack, MemoryBackend
+from shroud.slack.handlers import reactions
+from shroud.utils import db
+from shroud.utils.reaction_state import ReactionTracker
+
+FORWARDED = ["1700000001.000001", "1700000001.000002"]
+
+
+class ReactionsSlack(FakeSlack):
+    """
+    FakeSlack whose reactions.get reports :hourglass: on every message
+    """
+
+    def _response(self, api_method: str, args: dict) -> dict:
+        if api_method == "reactions.get":
+            return {"message": {"reactions": [{"name": "hourglass", "users": ["U0BENCHBOT"], "count": 1}]}}
+        return super()._response(api_method, args)
+
+
+@pytest.fixture
+def slack():
+    fake = ReactionsSlack(latency=0)
+    fake.install()
+    memory = MemoryBackend(latency=0)
+    for i, forwarded_ts in enumerate(FORWARDED):
+        memory.create({"dm_ts": f"1700000000.00000{i}", "forwarded_ts": forwarded_ts})
+    db.use_backend(memory)
+    yield fake
+    FakeSlack(latency=0).install()
+
+
+def react(kind: str, forwarded_ts: str, user: str = payloads.FD_MEMBER, reaction: str = "white_check_mark") -> None:
+    event = payloads.reaction(kind, payloads.FD_CHANNEL, forwarded_ts, "1700000100.000001")["event"]
+    event["user"] = user
+    event["reaction"] = reaction
+    handler = reactions.handle_reaction_added if kind == "reaction_added" else reactions.handle_reaction_removed
+    handler(event, client=WebClient(token="xoxb-test"))
+
+
+def test_hourglass_only_changes_with_the_resolved_state(slack, monkeypatch):
+    tracker = ReactionTracker(max_size=10)
+    monkeypatch.setattr(reactions, "tracker", tracker)
+    # As forwarding does once the report is posted
+    tracker.seed(payloads.FD_CHANNEL, FORWARDED[0], hourglass=True)
+
+    react("reaction_added", FORWARDED[0], user="U1")
+    assert slack.calls["reactions.remove"] == 1
+    react("reaction_added", FORWARDED[0], user="U2", reaction="x")
+    react("reaction_removed", FORWARDED[0], user="U1")
+    assert slack.calls["reactions.remove"] == 1
+    assert slack.calls["reactions.add"] == 0
+    react("reaction_removed", FORWARDED[0], user="U2", reaction="x")
+    assert slack.calls["reactions.add"] == 1
+    # Nothing was read back, since every change came through events
+    assert slack.calls["reactions.get"] == 0
+
+
+def test_evicted_messages_are_read_back_from_slack(slack, monkeypatch):
+    tracker = ReactionTracker(max_size=1)
+    monkeypatch.setattr(reactions, "tracker", tracker)
+    tracker.seed(payloads.FD_CHANNEL, FORWARDED[0], hourglass=True)
+    # Pushes the first message out
+    tracker.seed(payloads.FD_CHANNEL, FORWARDED[1], hourglass=True)
+    assert tracker.get(payloads.FD_CHANNEL, FORWARDED[0]) is None
+
+    react("reaction_added", FORWARDED[0], user="U1")
+    assert slack.calls["reactions.get"] == 1
+    assert slack.calls["reactions.remove"] == 1
+    # Tracked again from here on
+    react("reaction_removed", FORWARDED[0], user="U1")
+    assert slack.calls["reactions.get"] == 1
+    assert slack.calls["reactions.add"] == 1
@@ -0,0 +1,72 @@
+import math
+import random
+import time
+from collections import Counter
+
+import pytest
+
+from shroud.utils.stats import (
+    RELATIVE_ACCURACY,
+    StatsStore,
+    bucket_of,
+    bucket_value,
+    percentile,
+)
+
+
+@pytest.fixture
+def store():
+    store = StatsStore(":memory:")
+    yield store
+    store.close()
+
+
+def forwarded_ts(seconds_ago: float) -> str:
+    return f"{time.time() - seconds_ago:.6f}"
+
+
+def test_buckets_hold_timings_within_the_relative_accuracy():
+    for seconds in [1.5, 59, 60, 3600, 86400, 30 * 86400]:
+        assert bucket_value(bucket_of(seconds)) == pytest.approx(seconds, rel=RELATIVE_ACCURACY)
+
+
+def test_percentiles_match_a_known_distribution():
+    rng = random.Random(0)
+    timings = sorted(rng.lognormvariate(8, 1.5) for _ in range(10_000))
+    counts = sorted(Counter(bucket_of(seconds) for seconds in timings).items())
+    for p in (50, 90, 99):
+        exact = timings[math.ceil(p / 100 * len(timings)) - 1]
+        assert percentile(counts, p) == pytest.approx(exact, rel=RELATIVE_ACCURACY)
+    assert percentile([], 50) is None
+
+
+def test_reopening_undoes_a_resolution(store):
+    ts = forwarded_ts(3600)
+    store.forwarded(ts)
+    before = store.summary(weeks=1)
+    store.resolved(ts, resolved_at=float(ts) + 1800)
+    resolved = store.summary(weeks=1)
+    assert resolved.open == before.open - 1
+    assert resolved.resolve.count == 1
+    assert resolved.resolve.p50 == pytest.approx(1800, rel=RELATIVE_ACCURACY)
+
+    store.reopened(ts)
+    assert store.summary(weeks=1) == before
+    # Resolving again counts the new time, not the old one as well
+    store.resolved(ts, resolved_at=float(ts) + 3000)
+    summary = store.summary(weeks=1)
+    assert summary.resolve.count == 1
+    assert summary.resolve.p50 == pytest.approx(3000, rel=RELATIVE_ACCURACY)
+
+
+def test_only_the_first_reply_is_timed(store):
+    ts = forwarded_ts(7200)
+    store.forwarded(ts)
+    store.replied(ts, f"{float(ts) + 600:.6f}")
+    store.replied(ts, f"{float(ts) + 5000:.6f}")
+    # Forwarding is recorded once too, as the outbox may run the step again
+    store.forwarded(ts)
+    summary = store.summary(weeks=1)
+    assert summary.forwarded == 1
+    assert summary.reply.count == 1
+    assert summary.reply.p50 == pytest.approx(600, rel=RELATIVE_ACCURACY)
@@ -0,0 +1,233 @@
+import sqlite3
+import time
+
+from shroud.utils.storage import AirtableMirror, SQLiteBackend, WriteBehind
+
+
+class FlakyTable:
+    """
+    Stands in for a pyairtable Table, failing the first `failures` requests
+    """
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.rows: dict[str, dict] = {}
+
+    def _request(self):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Airtable is down")
+
+    def create(self, fields: dict) -> dict:
+        self._request()
+        record_id = f"rec{len(self.rows)}"
+        self.rows[record_id] = dict(fields)
+        return {"id": record_id, "fields": fields}
+
+    def update(self, record_id: str, fields: dict) -> None:
+        self._request()
+        self.rows[record_id].update(fields)
+
+    def delete(self, record_id: str) -> None:
+        self._request()
+        del self.rows[record_id]
+
+
+def mirrored(table: FlakyTable, path) -> SQLiteBackend:
+    mirror = AirtableMirror(table, str(path))
+    # No waiting between retries
+    mirror.BACKOFF = 0
+    return SQLiteBackend(str(path), mirror=mirror)
+
+
+def test_close_drains_the_mirror(tmp_path):
+    table = FlakyTable()
+    backend = mirrored(table, tmp_path / "records.db")
+    for i in range(50):
+        record = backend.create({"dm_ts": f"1700000000.{i:06d}"})
+        backend.update(record["id"], {"forwarded_ts": f"1700000001.{i:06d}"})
+    backend.close()
+    assert len(table.rows) == 50
+    assert all("forwarded_ts" in fields for fields in table.rows.values())
+
+
+def test_failed_create_is_retried_before_later_writes(tmp_path):
+    table = FlakyTable(failures=3)
+    backend = mirrored(table, tmp_path / "records.db")
+    record = backend.create({"dm_ts": "1700000000.000001"})
+    backend.update(record["id"], {"forwarded_ts": "1700000001.000001"})
+    backend.close()
+    assert list(table.rows.values()) == [{"dm_ts": "1700000000.000001", "forwarded_ts": "1700000001.000001"}]
+
+
+def test_writes_survive_a_restart(tmp_path):
+    path = tmp_path / "records.db"
+    # Down for longer than the first run lasts
+    table = FlakyTable(failures=1)
+    backend = SQLiteBackend(str(path), mirror=AirtableMirror(table, str(path)))
+    record = backend.create({"dm_ts": "1700000000.000001"})
+    backend.delete(record["id"])
+    backend.close()
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT op FROM airtable_pending ORDER BY seq").fetchall() == [("create",), ("delete",)]
+
+    restarted = mirrored(table, path)
+    restarted.close()
+    assert table.rows == {}
+    assert table.failures == 0
+
+
+class FailingBackend(SQLiteBackend):
+    """
+    Fails every update to the records in `failing`
+    """
+
+    def __init__(self, failing: set[str]):
+        super().__init__(":memory:")
+        self.failing = failing
+        self.update_attempts = 0
+        self.attempted_at: list[float] = []
+
+    def batch_update(self, records: list[dict]) -> None:
+        if any(record["id"] in self.failing for record in records):
+            raise ConnectionError("Airtable is down")
+        super().batch_update(records)
+
+    def update(self, record_id: str, fields: dict) -> None:
+        if record_id in self.failing:
+            self.update_attempts += 1
+            self.attempted_at.append(time.monotonic())
+            raise ConnectionError("Airtable is down")
+        super().update(record_id, fields)
+
+
+def test_write_behind_retries_then_lets_go():
+    backend = FailingBackend(failing=set())
+    record = backend.create({"dm_ts": "1700000000.000001"})
+    backend.failing.add(record["id"])
+    dropped = []
+    writes = WriteBehind(backend, delay=0.01, max_attempts=3, on_dropped=dropped.append)
+    writes.update(record["id"], {"forwarded_ts": "1700000001.000001"})
+    deadline = time.monotonic() + 10
+    while not dropped:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    writes.close()
+    assert dropped == [record["id"]]
+    assert backend.update_attempts == 3
+    assert writes.pending_id("1700000001.000001") is None
+
+
+def test_write_behind_retry_lands_once_the_backend_recovers():
+    backend = FailingBackend(failing=set())
+    record = backend.create({"dm_ts": "1700000000.000001"})
+    backend.failing.add(record["id"])
+    writes = WriteBehind(backend, delay=0.01, max_attempts=10, on_dropped=lambda record_id: None)
+    writes.update(record["id"], {"forwarded_ts": "1700000001.000001"})
+    while not backend.update_attempts:
+        time.sleep(0.01)
+    # Made while the first write was failing, and written with it
+    writes.update(record["id"], {"selection_ts": "1700000002.000001"})
+    backend.failing.clear()
+    writes.close()
+    assert backend.find("1700000000.000001")["fields"] == {
+        "dm_ts": "1700000000.000001",
+        "forwarded_ts": "1700000001.000001",
+        "selection_ts": "1700000002.000001",
+    }
+
+
+def test_write_behind_waits_out_the_backoff_before_retrying():
+    backend = FailingBackend(failing=set())
+    record = backend.create({"dm_ts": "1700000000.000001"})
+    backend.failing.add(record["id"])
+    writes = WriteBehind(backend, delay=0.1, max_batch=1, max_attempts=10, on_dropped=lambda record_id: None)
+    writes.update(record["id"], {"forwarded_ts": "1700000001.000001"})
+    while not backend.update_attempts:
+        time.sleep(0.01)
+    # Each of these fills a batch on its own, which mustn't pull the failing record forward
+    for i in range(2, 8):
+        other = backend.create({"dm_ts": f"1700000000.00000{i}"})
+        writes.update(other["id"], {"forwarded_ts": f"1700000001.00000{i}"})
+        time.sleep(0.02)
+    assert backend.find("1700000000.000007")["fields"]["forwarded_ts"] == "1700000001.000007"
+    while backend.update_attempts < 2:
+        time.sleep(0.01)
+    # The second attempt comes due 2 * delay after the first failed
+    assert backend.attempted_at[1] - backend.attempted_at[0] >= 0.2
+    backend.failing.clear()
+    writes.close()
+    assert backend.find("1700000000.000001")["fields"]["forwarded_ts"] == "1700000001.000001"
+
+
+def test_dropped_write_isnt_left_in_the_record_cache():
+    from shroud.bench.fakes import MemoryBackend
+    from shroud.utils import db
+
+    memory = MemoryBackend(latency=0)
+    record = memory.create({"dm_ts": "1700000000.000001"})
+    db.use_backend(memory)
+    db.cache.put(record)
+    db._forget(record["id"])
+    assert db.cache.get("1700000000.000001") is None
+
+
+def test_record_cache_evicts_the_least_recently_used():
+    from shroud.utils.db import RecordCache
+
+    cache = RecordCache(max_size=2, ttl=60)
+    cache.put({"id": "rec1", "fields": {"dm_ts": "1.1", "forwarded_ts": "2.1"}})
+    cache.put({"id": "rec2", "fields": {"dm_ts": "1.2"}})
+    # Looked up by its other timestamp, which still counts as a use
+    assert cache.get("2.1")["id"] == "rec1"
+    cache.put({"id": "rec3", "fields": {"dm_ts": "1.3"}})
+    assert cache.get("1.2") is None
+    assert cache.get("1.1")["id"] == "rec1"
+    assert cache.get("1.3")["id"] == "rec3"
+
+
+def test_record_cache_expires_records():
+    from shroud.utils.db import RecordCache
+
+    cache = RecordCache(max_size=10, ttl=0.05)
+    cache.put({"id": "rec1", "fields": {"dm_ts": "1.1"}})
+    assert cache.get("1.1")["id"] == "rec1"
+    time.sleep(0.1)
+    assert cache.get("1.1") is None
+    # Nothing is cached with no room for it
+    empty = RecordCache(max_size=0, ttl=60)
+    empty.put({"id": "rec1", "fields": {"dm_ts": "1.1"}})
+    assert empty.get("1.1") is None
+
+
+def test_record_cache_follows_updates_and_deletes():
+    from slack_sdk import WebClient
+
+    from shroud.bench.fakes import MemoryBackend
+    from shroud.utils import db
+
+    memory = MemoryBackend(latency=0)
+    record = memory.create({"dm_ts": "1700000000.000001", "selection_ts": "1700000000.000002", "selection": "anonymous"})
+    db.use_backend(memory)
+    assert db.get_message_by_ts("1700000000.000001")["fields"]["selection"] == "anonymous"
+
+    db.update_record(record["id"], {"forwarded_ts": "1700000001.000001", "selection": None})
+    finds = memory.ops["find"]
+    cached = db.get_message_by_ts("1700000001.000001")
+    assert memory.ops["find"] == finds
+    assert cached["fields"] == {
+        "dm_ts": "1700000000.000001",
+        "selection_ts": "1700000000.000002",
+        "forwarded_ts": "1700000001.000001",
+    }
+    # Changing a timestamp moves the index over to the new one
+    db.update_record(record["id"], {"forwarded_ts": "1700000001.000002"})
+    assert db.cache.get("1700000001.000001") is None
+    assert db.cache.get("1700000001.000002")["id"] == record["id"]
+
+    # Without a DM and a forwarded message on record it's stale, so cleaning deletes it
+    db.update_record(record["id"], {"forwarded_ts": None})
+    summary = db.clean_database(WebClient(token="xoxb-test"))
+    assert summary.deleted == 1
+    assert db.cache.get("1700000000.000001") is None
+    assert db.get_message_by_ts("1700000000.000001") is None
@@ -0,0 +1,63 @@
+import pytest
+
+from shroud import settings
+from shroud.bench.fakes import MemoryBackend
+from shroud.utils import db
+
+
+@pytest.fixture(params=["exact", "bloom"])
+def memory(request, monkeypatch):
+    monkeypatch.setitem(settings, "ts_filter", request.param)
+    # Room for every timestamp the tests add, so the bloom filter keeps to ts_filter_fp_rate
+    monkeypatch.setitem(settings, "ts_filter_capacity", 500)
+    monkeypatch.setitem(settings, "write_behind_delay", 0)
+    memory = MemoryBackend(latency=0)
+    for i in range(100):
+        memory.create({"dm_ts": f"1700000000.{i:06d}", "forwarded_ts": f"1700000001.{i:06d}"})
+    db.use_backend(memory)
+    assert db.ts_filter.ready
+    return memory
+
+
+def uncached_lookup(ts: str) -> dict | None:
+    record = db.cache.get(ts)
+    if record is not None:
+        db.cache.discard(record["id"])
+    return db.get_message_by_ts(ts)
+
+
+def test_every_record_is_found_after_the_build(memory):
+    for i in range(100):
+        assert uncached_lookup(f"1700000001.{i:06d}")["fields"]["dm_ts"] == f"1700000000.{i:06d}"
+
+
+def test_records_created_after_the_build_are_found(memory):
+    for i in range(100):
+        db.save_forward_start("Report", f"1700000002.{i:06d}", f"1700000003.{i:06d}", "D0000000001")
+        db.finish_forward(f"1700000002.{i:06d}", f"1700000004.{i:06d}")
+    for i in range(100):
+        for ts in (f"1700000002.{i:06d}", f"1700000003.{i:06d}", f"1700000004.{i:06d}"):
+            assert db.might_have_record(ts)
+            assert uncached_lookup(ts)["fields"]["dm_ts"] == f"1700000002.{i:06d}"
+
+
+def test_unknown_timestamps_skip_the_database(memory):
+    finds = memory.ops["find"]
+    skipped = sum(not db.might_have_record(f"1800000000.{i:06d}") for i in range(100))
+    for i in range(100):
+        assert db.get_message_by_ts(f"1800000000.{i:06d}") is None
+    # Bloom filters let the odd false positive through to the database
+    assert memory.ops["find"] - finds == 100 - skipped
+    if settings.ts_filter == "exact":
+        assert skipped == 100
+    else:
+        assert skipped >= 95
+
+
+def test_false_positives_fall_back_to_the_database(memory):
+    # Like a deleted record, or a bloom filter collision
+    db.ts_filter.add("1800000000.000001")
+    finds = memory.ops["find"]
+    assert db.might_have_record("1800000000.000001")
+    assert db.get_message_by_ts("1800000000.000001") is None
+    assert memory.ops["find"] == finds + 1
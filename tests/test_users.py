@@ -0,0 +1,113 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from shroud.utils.users import ProfileCache
+
+
+def make_user(user_id: str, name: str) -> dict:
+    return {"id": user_id, "real_name": name, "profile": {"image_512": f"https://example.com/{user_id}.png"}}
+
+
+class UsersClient:
+    def __init__(self):
+        self.calls = 0
+
+    def users_info(self, user: str) -> dict:
+        self.calls += 1
+        return {"user": make_user(user, f"User {user}")}
+
+
+def test_least_recently_used_profiles_are_dropped():
+    client = UsersClient()
+    cache = ProfileCache(max_size=2, ttl=60)
+    cache.get("U1", client)
+    cache.get("U2", client)
+    cache.get("U1", client)
+    cache.get("U3", client)
+    assert cache.peek("U1") is not None
+    assert cache.peek("U2") is None
+    assert cache.peek("U3") is not None
+    assert client.calls == 3
+
+
+def test_expired_profiles_are_fetched_again():
+    client = UsersClient()
+    cache = ProfileCache(max_size=10, ttl=0)
+    cache.get("U1", client)
+    assert cache.peek("U1") is None
+    cache.get("U1", client)
+    assert client.calls == 2
+
+
+def test_user_change_only_refreshes_cached_users():
+    client = UsersClient()
+    cache = ProfileCache(max_size=10, ttl=60)
+    cache.get("U1", client)
+    cache.update(make_user("U1", "Renamed"))
+    cache.update(make_user("U2", "Someone else"))
+    assert cache.peek("U1").name == "Renamed"
+    assert cache.peek("U2") is None
+
+
+class BlockingUsersClient(UsersClient):
+    """
+    users.info waits for `release`, then answers or fails
+    """
+
+    def __init__(self, fail: bool = False):
+        super().__init__()
+        self.fail = fail
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def users_info(self, user: str) -> dict:
+        self.started.set()
+        assert self.release.wait(timeout=10)
+        if self.fail:
+            self.calls += 1
+            raise ConnectionError("Slack is down")
+        return super().users_info(user)
+
+
+def test_concurrent_misses_share_one_fetch():
+    client = BlockingUsersClient()
+    cache = ProfileCache(max_size=10, ttl=60)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(cache.get, "U1", client) for _ in range(8)]
+        assert client.started.wait(timeout=10)
+        # Let the other callers line up behind the first fetch
+        time.sleep(0.05)
+        client.release.set()
+        names = {future.result(timeout=10).name for future in futures}
+    assert names == {"User U1"}
+    assert client.calls == 1
+
+
+def test_fetch_failing_after_invalidate_lets_waiters_go():
+    client = BlockingUsersClient(fail=True)
+    cache = ProfileCache(max_size=10, ttl=60)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(cache.get, "U1", client) for _ in range(4)]
+        assert client.started.wait(timeout=10)
+        time.sleep(0.05)
+        cache.invalidate("U1")
+        client.release.set()
+        for future in futures:
+            with pytest.raises(ConnectionError):
+                future.result(timeout=10)
+    assert cache.peek("U1") is None
+
+
+def test_fetch_finishing_after_user_change_isnt_cached():
+    client = BlockingUsersClient()
+    cache = ProfileCache(max_size=10, ttl=60)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(cache.get, "U1", client)
+        assert client.started.wait(timeout=10)
+        cache.update(make_user("U1", "Renamed"))
+        client.release.set()
+        future.result(timeout=10)
+    assert cache.peek("U1").name == "Renamed"